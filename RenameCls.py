@@ -1,93 +1,415 @@
-from pathlib import Path
 # from telnetlib import GA
 # from tkinter.messagebox import RETRY
 
-import pyexiv2
+import heapq
 import random
 import string
+import threading
+import contextlib
+import multiprocessing
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
 from functools import partial
 
-from PySide6.QtWidgets import QWidget, QGridLayout, QVBoxLayout, QGroupBox, QLabel, QPushButton, QHBoxLayout, QScrollArea, QCheckBox
-from PySide6.QtGui import QPixmap, QTransform, QPalette, QKeyEvent, QIcon
-from PySide6.QtCore import Qt, Signal, Slot, QObject, QSize
-from PIL import Image, ImageFilter
+from PySide6.QtWidgets import QWidget, QGridLayout, QVBoxLayout, QGroupBox, QLabel, QPushButton, QHBoxLayout, QScrollArea, QCheckBox, QListView, QAbstractItemView, QStyledItemDelegate, QLineEdit, QFileDialog, QProgressBar, QSlider, QMessageBox
+from PySide6.QtGui import QPixmap, QImage, QImageReader, QTransform, QPalette, QKeyEvent, QIcon, QColor, QPen, QFont
+from PySide6.QtCore import Qt, Signal, Slot, QObject, QSize, QRunnable, QThreadPool, QRect, QEvent, QModelIndex, QAbstractListModel, QTimer, QPoint, QBuffer, QByteArray, QIODevice
 
 from constants import *
+from extraction import extract_preview, read_preview
+from photo_exif import PhotoExif, read_exif_batch, read_tags
+from thumb_cache import ThumbCache
+from transfer import execute_plan, Journal, TransferStats
+from tracing import tracer, timed
+from card_scan import chronological
+from library_index import LibraryIndex
+from naming import next_suffix, propose_suffixes, PhotoTable, NamingError, EPOCH
+from session import SessionJournal
 
+# jobs of the ThumbLoader
+DECODE = 'decode'
+BLUR = 'blur'
+# EXIF orientation: (horizontal mirror, vertical mirror, clockwise rotation)
+ORIENTATIONS = {
+    1: (False, False, 0), 2: (True, False, 0), 3: (False, False, 180), 4: (False, True, 0),
+    5: (True, False, 270), 6: (False, False, 90), 7: (True, False, 90), 8: (False, False, 270),
+}
 #################################################################################
-class Display(QScrollArea):
-    def __init__(self, gallery) -> None:
+def make_thumbnail_title(exif: PhotoExif) -> str:
+    """
+    make_thumbnail_title returns the title of a thumbnail: original name and date (DD/MM/YYYY) followed by the date suffix
+    """
+    reversed_date = '/'.join(list(reversed(exif.date.split(' '))))
+    return exif.original_name + '  (' + reversed_date + exif.date_suffix + ')'
+#--------------------------------------------------------------------------------
+def orient_image(image: QImage, exif_orientation: int) -> QImage:
+    """
+    orient_image applies an EXIF orientation (1 to 8) to an image
+
+    Args:
+        image: QImage
+        exif_orientation: int
+            2 and 4 are mirrors, 3 is a half turn, 6 and 8 are quarter turns, 5 and 7 are mirrors followed by a quarter turn
+    """
+    mirror_h, mirror_v, angle = ORIENTATIONS.get(exif_orientation, (False, False, 0))
+    if mirror_h or mirror_v:
+        image = image.mirrored(mirror_h, mirror_v)
+    if angle:
+        image = image.transformed(QTransform().rotate(angle))
+    return image
+#--------------------------------------------------------------------------------
+def image_reader(path: str, data: bytes = None) -> tuple:
+    """
+    image_reader returns a reader of a JPEG, from its file or, if data is given, straight from its bytes (MemoryThumbCache)
+
+    Returns:
+        tuple: (QImageReader, QBuffer or None), the buffer and data must be kept as long as the reader is used (the reader does not own the buffer, the buffer does not copy data)
+    """
+    if data is None:
+        return QImageReader(path), None
+    buffer = QBuffer()
+    buffer.setData(QByteArray.fromRawData(data))
+    buffer.open(QIODevice.OpenModeFlag.ReadOnly)
+    return QImageReader(buffer, b'jpeg'), buffer
+#--------------------------------------------------------------------------------
+def load_thumb_image(path: str, exif_orientation: int, max_size: int = PIXMAP_MAX_SIZE, data: bytes = None) -> QImage:
+    """
+    load_thumb_image decodes a JPEG directly at display size then applies its EXIF orientation
+    The size is set before decoding: the JPEG decoder then works on a reduced image (scaled DCT) instead of decoding the full image and scaling it
+
+    Args:
+        path: str
+            path to the JPEG
+        exif_orientation: int
+            EXIF orientation of the RAW file
+        max_size: int
+            size of the bounding square of the result
+        data: bytes
+            the JPEG itself, decoded instead of path if given (see MemoryThumbCache.data)
+    """
+    with tracer.span('decode', file=path):
+        reader, buffer = image_reader(path, data)
+        reader.setAutoTransform(False)
+        size = reader.size()
+        if size.isValid():
+            # the bounding box is a square: the size is the same before and after a quarter turn
+            reader.setScaledSize(size.scaled(QSize(max_size, max_size), Qt.AspectRatioMode.KeepAspectRatio))
+        return orient_image(reader.read(), exif_orientation)
+#--------------------------------------------------------------------------------
+def load_thumb_pixmap(path: str, exif_orientation: int) -> QPixmap:
+    """
+    load_thumb_pixmap returns the pixmap of a thumbnail, see load_thumb_image
+    """
+    return QPixmap.fromImage(load_thumb_image(path, exif_orientation))
+#--------------------------------------------------------------------------------
+def load_preview_image(path: str, exif_orientation: int, max_size: int, data: bytes = None) -> QImage:
+    """
+    load_preview_image decodes a JPEG for the PreviewViewer: at full size, or reduced to max_size (the size of the screen) if it is larger
+    """
+    with tracer.span('preview', file=path):
+        size = image_size(path, data)
+        if size.isValid():
+            max_size = min(max_size, max(size.width(), size.height()))
+        return load_thumb_image(path, exif_orientation, max_size, data)
+#--------------------------------------------------------------------------------
+def image_size(path: str, data: bytes = None) -> QSize:
+    """
+    image_size returns the size of a JPEG (see image_reader), only its header is read
+    """
+    reader, buffer = image_reader(path, data)
+    return reader.size()
+#--------------------------------------------------------------------------------
+def thumb_size(path: str, exif_orientation: int, max_size: int = PIXMAP_MAX_SIZE, data: bytes = None) -> QSize:
+    """
+    thumb_size returns the size of the thumbnail of a JPEG (see load_thumb_image) without decoding it, only its header is read
+    """
+    size = image_size(path, data)
+    if not size.isValid():
+        return QSize(max_size, max_size)
+    size = size.scaled(QSize(max_size, max_size), Qt.AspectRatioMode.KeepAspectRatio)
+    return size.transposed() if exif_orientation in (5, 6, 7, 8) else size
+#--------------------------------------------------------------------------------
+_placeholders = dict()
+def placeholder_pixmap(size: QSize) -> QPixmap:
+    """
+    placeholder_pixmap returns the pixmap displayed until a thumbnail is decoded, one per size shared by all the thumbnails
+    """
+    key = (size.width(), size.height())
+    if key not in _placeholders:
+        pixmap = QPixmap(size)
+        pixmap.fill(QColor('#555'))
+        _placeholders[key] = pixmap
+    return _placeholders[key]
+#--------------------------------------------------------------------------------
+_icons = dict()
+def shared_icon(path: str) -> QIcon:
+    """
+    shared_icon returns the icon of path, read once and shared by all the widgets ('' for no icon)
+    """
+    if path not in _icons:
+        _icons[path] = QIcon(path) if path else QIcon()
+    return _icons[path]
+#--------------------------------------------------------------------------------
+_palettes = dict()
+def background_palette(color: str) -> QPalette:
+    """
+    background_palette returns a palette whose background (Window role) is color, one per color shared by all the widgets
+    Setting a palette does not parse a style sheet and restyle the children, unlike setStyleSheet
+    """
+    if color not in _palettes:
+        palette = QPalette()
+        palette.setColor(QPalette.ColorRole.Window, QColor(color))
+        _palettes[color] = palette
+    return _palettes[color]
+#--------------------------------------------------------------------------------
+def blur_radius(path: str, image: QImage, data: bytes = None) -> float:
+    """
+    blur_radius returns the radius to blur image (decoded at display size from the JPEG path) as much as a BLUR_RADIUS blur of the full size JPEG
+    """
+    size = image_size(path, data)
+    if not size.isValid():
+        return BLUR_RADIUS
+    return BLUR_RADIUS * max(image.width(), image.height()) / max(size.width(), size.height())
+#--------------------------------------------------------------------------------
+def blur_image(image: QImage, radius: float) -> QImage:
+    """
+    blur_image returns a gaussian blurred copy of image, entirely in memory
+    Thread safe (QImage and PIL only): the PIL filter releases the GIL, the ThumbLoader runs it in a thread pool
+    """
+    # imported on the first blur: PIL is not needed at startup
+    from PIL import Image, ImageFilter
+    with tracer.span('blur', radius=radius):
+        image = image.convertToFormat(QImage.Format.Format_RGBA8888)
+        width, height = image.width(), image.height()
+        img = Image.frombuffer('RGBA', (width, height), bytes(image.constBits()), 'raw', 'RGBA', image.bytesPerLine(), 1)
+        img = img.filter(ImageFilter.GaussianBlur(radius))
+        return QImage(img.tobytes(), width, height, 4*width, QImage.Format.Format_RGBA8888).copy()
+#################################################################################
+class LoadJob(QRunnable):
+    def __init__(self, loader, kind: str, key, args: tuple):
         super().__init__()
-        # self.setBackgroundRole(QPalette.Dark)
-        self.setStyleSheet('background-color: #303030')
-        self.setWidget(gallery)
-        self.setWidgetResizable(True)
+        self.loader = loader
+        self.kind = kind
+        self.key = key
+        self.args = args
+    def run(self):
+        try:
+            if self.kind == DECODE:
+                path, exif_orientation = self.args
+                image = load_thumb_image(path, exif_orientation, data=self.loader.cache.data(path))
+            else:
+                # the radius depends on the size of the full JPEG: read here, the JPEG may have to be read again from its RAW file (MemoryThumbCache)
+                image, path = self.args
+                image = blur_image(image, blur_radius(path, image, self.loader.cache.data(path)))
+        except Exception:
+            # unreadable JPEG or RAW file: a null image, and the loader frees the slot of the job anyway
+            tracer.count('decode failures')
+            image = QImage()
+        self.loader.done(self.kind, self.key, image)
 #################################################################################
-class PhotoExif():
+class ThumbLoader(QObject):
     """
-    PhotoExif object contains the exif informations necessary for the present program and a compressed version of the original date
+    ThumbLoader decodes and blurs the thumbnails in a thread pool, off the GUI thread, the thumbnails in or near the viewport of the Display first
+    The jobs wait in a queue of the loader, not of the pool: the pool is only given as many jobs as it has threads, and the next job is chosen when one ends, by distance of its rank to the visible ranks (see set_visible)
+    When the visible ranks change, the waiting jobs are ordered again, and the cancellable ones (rows of a VirtualGallery, requested again when painted) further than LOAD_CANCEL_DISTANCE from the viewport are dropped
 
-    Attributes
-        dir: str
-            directory containing the RAW files
-        original_name: str
-            original name (stem) from camera memory card
-        original_suffix: str
-            original ext (NEF for Nikon)
-        date [%Y %m %d]: str
-            original date (date of the shooting)
-        compressed_date: tuple
-            the first element of the tuple represents the decade (format: YYYX), the second one the date itself (format: YMDD, where Y is the last part of the year et M is the month as a letter between A for january and L for december)
-            Note: the compressed date is for compatibility with old files (the time of the 8.3 filenames)
-        oriention: str
-            portrait (exif orientation == 8), landscape (otherwise)
-        nikon_file_number: int
-            Nikon file number
-    """
-    def __init__(self, file) -> None:
-        """
-        __init__ creates PhotoExif objects
+    Signals:
+        decoded(object, QImage): emitted in the GUI thread with the item given to request_decode and the image decoded at display size
+        blurred(object, QImage): emitted in the GUI thread with the item given to request_blur and the blurred image
+    """
+    decoded = Signal(object, QImage)
+    blurred = Signal(object, QImage)
+    # internal: a job is done, queued to the GUI thread
+    _job_done = Signal(str, object)
+
+    def __init__(self, cache: ThumbCache, threads: int = LOAD_THREADS):
+        """
+        __init__ creates ThumbLoader objects
+
+        Args:
+            cache: ThumbCache or MemoryThumbCache
+                where the JPEG are read (see ThumbCache.data)
+            threads: int
+                number of threads of the pool
+        """
+        super().__init__()
+        self.cache = cache
+        self._pool = QThreadPool()
+        self._pool.setMaxThreadCount(threads)
+        self._threads = threads
+        # (kind, key) -> (background, cancellable, args, sequence number), the jobs waiting for a thread
+        self._waiting = dict()
+        # (priority, sequence number, kind, key), entries no longer in _waiting are skipped
+        self._heap = list()
+        self._running = set()
+        self._sequence = 0
+        self._visible = (1, 1)
+        self._job_done.connect(self._finished)
+#--------------------------------------------------------------------------------
+    def request_decode(self, item, path: str, exif_orientation: int, cancellable: bool = False):
+        """
+        request_decode queues the decoding of a thumbnail (see load_thumb_image), nothing is done if it is already queued
+
+        Args:
+            item: Thumbnails or ThumbItem
+                returned with the image, its rank gives its distance to the viewport
+            cancellable: bool
+                the job can be dropped when the item is far from the viewport
+        """
+        self._request(DECODE, item, (path, exif_orientation), False, cancellable)
+#--------------------------------------------------------------------------------
+    def request_blur(self, item, image: QImage, path: str, background: bool = False, cancellable: bool = False):
+        """
+        request_blur queues the blur of image (see blur_image and blur_radius), nothing is done if it is already queued
 
         Args:
-            file: str
-                path to the RAW file
-        """
-        self._file = file
-        self._date_suffix = ''
-        path = Path(file)
-        self.dir = str(path.cwd()) # maybe useless
-        self.original_name = path.stem
-        self.original_suffix = path.suffix
-        meta_data = pyexiv2.ImageMetadata(file)
-        meta_data.read()
-        self.date = meta_data['Exif.Image.DateTimeOriginal'].value.strftime('%Y %m %d')
-        orientation = meta_data['Exif.Image.Orientation'].value
-        self.orientation = 'portrait' if orientation == 8 else 'landscape'
-        if self.original_suffix == '.NEF':
-            self.nikon_file_number = meta_data['Exif.NikonFi.FileNumber'].value
+            item: Thumbnails or ThumbItem
+                returned with the image
+            path: str
+                JPEG image was decoded from, in the cache
+            background: bool
+                pre-computation, after every other job
+        """
+        self._request(BLUR, item, (image, path), background, cancellable)
+#--------------------------------------------------------------------------------
+    def set_visible(self, first: int, last: int):
+        """
+        set_visible sets the ranks displayed in the viewport, orders the waiting jobs again and drops the cancellable ones too far from the viewport
+        """
+        if (first, last) == self._visible:
+            return
+        self._visible = (first, last)
+        for job, (background, cancellable, args, sequence) in list(self._waiting.items()):
+            if cancellable and self._distance(job[1].rank) > LOAD_CANCEL_DISTANCE:
+                del self._waiting[job]
+        self._heap = [(self._priority(kind, key, background), sequence, kind, key)
+                      for (kind, key), (background, _, _, sequence) in self._waiting.items()]
+        heapq.heapify(self._heap)
+#--------------------------------------------------------------------------------
+    def clear(self):
+        # the waiting jobs are dropped, the running ones end normally
+        self._waiting.clear()
+        self._heap.clear()
+#--------------------------------------------------------------------------------
+    def done(self, kind: str, key, image: QImage):
+        # called from a thread of the pool: the signals are queued to the GUI thread
+        if kind == DECODE:
+            self.decoded.emit(key, image)
         else:
-            self.nikon_file_number = -1
-#--------------------------------------------------------------------------------
-    @property
-    def file(self):
-        return self._file
-    @property
-    def full_path(self):
-        return '/'.join([self.dir, self.file])
-    @property
-    def date_suffix(self):
-        # print('Récupération du suffixe de la date')
-        return str(self._date_suffix)
-    @date_suffix.setter
-    def date_suffix(self, suffix: str):
-        # print('Attribution suffixe')
-        self._date_suffix = suffix
-    @property
-    def compressed_date(self):
-        index = int(self.date[5:7]) - 1
-        tmp_date = self.date[3] + string.ascii_uppercase[index] + self.date[-2:]
-        self._compressed_date = (str(self.date[0:3])+'0', str(tmp_date), self.date_suffix)
-        return self._compressed_date
+            self.blurred.emit(key, image)
+        self._job_done.emit(kind, key)
+#--------------------------------------------------------------------------------
+    def _request(self, kind: str, key, args: tuple, background: bool, cancellable: bool):
+        job = (kind, key)
+        if job in self._waiting or job in self._running:
+            return
+        self._sequence += 1
+        self._waiting[job] = (background, cancellable, args, self._sequence)
+        heapq.heappush(self._heap, (self._priority(kind, key, background), self._sequence, kind, key))
+        self._dispatch()
+#--------------------------------------------------------------------------------
+    def _distance(self, rank: int) -> int:
+        first, last = self._visible
+        return max(first - rank, rank - last, 0)
+#--------------------------------------------------------------------------------
+    def _priority(self, kind: str, key, background: bool) -> tuple:
+        # the visible thumbnails are decoded before they are blurred
+        return background, self._distance(key.rank), kind != DECODE
+#--------------------------------------------------------------------------------
+    def _dispatch(self):
+        while self._heap and len(self._running) < self._threads:
+            _, sequence, kind, key = heapq.heappop(self._heap)
+            waiting = self._waiting.get((kind, key))
+            if waiting is None or waiting[3] != sequence:
+                continue
+            del self._waiting[(kind, key)]
+            self._running.add((kind, key))
+            self._pool.start(LoadJob(self, kind, key, waiting[2]))
+#--------------------------------------------------------------------------------
+    def _finished(self, kind: str, key):
+        self._running.discard((kind, key))
+        self._dispatch()
+#################################################################################
+class PixmapCache():
+    """
+    PixmapCache holds the decoded thumbnails (clear and blurred) of a gallery, within a memory budget
+    The pixmaps are evicted in LRU order when the budget is exceeded: the thumbnails near the viewport are used again on every scroll (see Gallery.update_viewport), the evicted ones are the offscreen ones, decoded again from the ThumbCache when they come back into view
+    The owner of an evicted pixmap (a Thumbnails displaying it) is told with pixmap_evicted, so that it releases its own reference
+
+    Attributes
+        budget: int
+            memory budget in bytes
+        resident: int
+            size in bytes of the pixmaps held
+        hits: int
+        misses: int
+    """
+    def __init__(self, budget: int = PIXMAP_BUDGET) -> None:
+        self.budget = budget
+        self.resident = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        # key -> (pixmap, size in bytes, owner)
+        self._pixmaps = OrderedDict()
+#--------------------------------------------------------------------------------
+    def get(self, key: str, owner=None) -> QPixmap:
+        """
+        get returns the pixmap of key, None if it is not (or no longer) held
+
+        Args:
+            key: str
+                path of the JPEG in the ThumbCache (+ BLURRED for the blurred pixmap)
+            owner: Thumbnails
+                displays the pixmap from now on
+        """
+        entry = self._pixmaps.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self._pixmaps.move_to_end(key)
+        if owner is not None and entry[2] is not owner:
+            self._pixmaps[key] = (entry[0], entry[1], owner)
+        return entry[0]
+#--------------------------------------------------------------------------------
+    def put(self, key: str, pixmap: QPixmap, owner=None):
+        self.discard(key)
+        size = pixmap.width() * pixmap.height() * pixmap.depth() // 8
+        self._pixmaps[key] = (pixmap, size, owner)
+        self.resident += size
+        while self.resident > self.budget and len(self._pixmaps) > 1:
+            evicted, (_, size, owner) = self._pixmaps.popitem(last=False)
+            self.resident -= size
+            self.evictions += 1
+            if owner is not None:
+                owner.pixmap_evicted(evicted)
+#--------------------------------------------------------------------------------
+    def discard(self, key: str):
+        entry = self._pixmaps.pop(key, None)
+        if entry is not None:
+            self.resident -= entry[1]
+#--------------------------------------------------------------------------------
+    def release_owners(self):
+        # the owners are removed from the gallery (see Gallery.remove_items), the pixmaps are kept for the next ones
+        for key, (pixmap, size, _) in self._pixmaps.items():
+            self._pixmaps[key] = (pixmap, size, None)
+#--------------------------------------------------------------------------------
+    def hit_rate(self) -> float:
+        requests = self.hits + self.misses
+        return self.hits / requests if requests else 0.0
+#--------------------------------------------------------------------------------
+    def stats(self) -> dict:
+        return {'pixmaps': len(self._pixmaps), 'resident': self.resident, 'budget': self.budget, 'hits': self.hits,
+                'misses': self.misses, 'hit_rate': round(self.hit_rate(), 3), 'evictions': self.evictions}
+#################################################################################
+class Display(QScrollArea):
+    def __init__(self, gallery) -> None:
+        super().__init__()
+        # the background is a rule of style.qss for this object only: a style sheet of its own would cascade to the Thumbnails and replace their palettes (colors of the groups)
+        self.setObjectName('display')
+        self.setWidget(gallery)
+        self.setWidgetResizable(True)
 #################################################################################
 class Gallery(QWidget):
     """
@@ -98,52 +420,340 @@ class Gallery(QWidget):
 
     Signals:
         When a Thumbnails object is changed (on a signal emitted by the Thumbnails object) the Gallery object is updated and a changed signal (an empty str) is emitted
+        thumbnail_added(int): a thumbnail of rank int is displayed
+        message(str): a text for the status bar of the window (groups proposed, bursts hidden, file that cannot be extracted…)
 
     Class Variables:
         hidden_list: list of the thumbnails to be displayed blurred
+
+    Attributes:
+        items: list
+            the Thumbnails, by rank (rank 1 is items[0])
+        days: dict
+            date [%Y %m %d] -> set of the ranks of the photos of the day
+        groups: dict
+            compressed date (with suffix) -> set of the ranks of the group
+        Both indexes are updated when a thumbnail is added or a suffix changed, so that the group operations cost O(group size)
     """
-    def __init__(self, controls, fichier_raw):
+    thumbnail_added = Signal(int)
+    message = Signal(str)
+
+    def __init__(self, controls, cache: ThumbCache, session: SessionJournal = None):
         """
         __init__ creates Gallery objects
+        Thumbnails are added afterwards with add_thumbnail, as soon as their JPEG is extracted
+
+        Args:
+            controls: Controls
+            cache: ThumbCache or MemoryThumbCache
+                cache containing the extracted JPEG
+            session: SessionJournal
+                journal of the card: the state of the thumbnails (hidden, date suffix, color, selection) is restored from it and every change is recorded in it
         """
         super().__init__()
-        # development only ---------------------------------------------------------
-        # fichier_raw = [str(fichier) for fichier in Path('./pictures').glob('*.NEF')]
-        # fichier_raw = sorted(fichier_raw)
-        #----------------------------------------------------------------------------
+        self.cache = cache
+        self.session = session
+        self.pixmaps = PixmapCache()
+        self.loader = ThumbLoader(cache)
+        # created when a thumbnail is enlarged for the first time
+        self.viewer = None
+        self.loader.decoded.connect(self.set_decoded_image)
+        self.loader.blurred.connect(self.set_blurred_image)
+        # the visible ranks are given to the loader when the scrolling or the thumbnails stop changing
+        self._viewport_timer = QTimer(self)
+        self._viewport_timer.setSingleShot(True)
+        self._viewport_timer.setInterval(VIEWPORT_DELAY)
+        self._viewport_timer.timeout.connect(self.update_viewport)
         self.first = -1
         self.last = -1
         self.list_set = False
         self.checked_list = list()
+        self.items = list()
+        self.days = dict()
+        self.groups = dict()
+        # PhotoTable of the items, for the automatic groups (see propose_groups), built again when the items change
+        self._table = None
+        # RAW file -> suffix of the last groups proposed: any other suffix was given by hand
+        self._proposed = dict()
+        # RAW files extracted but not yet displayed (waiting for a previous one), by index
+        self._ready = dict()
+        self._next_index = 0
         
         self.layout = QHBoxLayout()
         self.layout.setSpacing(0)
         self.layout.addStretch()
         self.setLayout(self.layout)
 
-        # create Thumbnails and add to Gallery
-        for i_thumb in range(len(fichier_raw)):
-            # only for development --------------------------
-            # for development with short photo list, set to 4
-            # for development with long photo list, set > 12
-            if i_thumb > 4:       
-               continue
-            # development -----------------------------------
-            photo_file = 'pictures/' + fichier_raw[i_thumb]
-            th = Thumbnails(photo_file)
-            self.layout.addWidget(th)
-            th.set_bg_color(self.assign_bg_color(th.rank))
-            print(th.exif.full_path)
-            # process signals from thumbnails
-            th.selected.connect(partial(self.thumb_selected, th.rank))
-            th.colored.connect(partial(self.change_group_bg_color, th.rank))
         # process signals from controls
         controls.sliced.connect(self.slice_date)
         controls.cleared.connect(self.clear_selection)
+        controls.bursts.connect(self.hide_bursts)
+        controls.grouped.connect(self.propose_groups)
+        self.burst_engine = BurstEngine()
+        self.burst_engine.finished.connect(self.bursts_found)
+#--------------------------------------------------------------------------------
+    def add_thumbnail(self, index: int, exif: PhotoExif):
+        """
+        add_thumbnail adds the Thumbnails of a RAW file whose JPEG is extracted
+        The extraction order is not the order of the files: a Thumbnails is added as soon as its JPEG and the JPEG of all the previous files are ready, so that the rank of the Thumbnails remains the rank of the file
+
+        Args:
+            index: int
+                index of the RAW file in the list given to the ExtractionEngine
+            exif: PhotoExif
+                metadata of the RAW file, None if the extraction failed
+        """
+        self._ready[index] = exif
+        while self._next_index in self._ready:
+            i_thumb = self._next_index
+            exif = self._ready.pop(i_thumb)
+            self._next_index += 1
+            if exif is None:
+                continue
+            with tracer.span('widget', 'ui', file=exif.file):
+                self.append_thumbnail(exif)
+            self.thumbnail_added.emit(self.item_count())
+            self.viewport_changed()
+#--------------------------------------------------------------------------------
+    def append_thumbnail(self, exif: PhotoExif):
+        self.restore_suffix(exif)
+        th = Thumbnails(exif, self.cache, self.pixmaps, self.loader)
+        self.layout.addWidget(th)
+        self.index_item(th)
+        print(th.exif.full_path)
+        # process signals from thumbnails
+        th.selected.connect(partial(self.thumb_selected, th.rank))
+        th.colored.connect(partial(self.change_group_bg_color, th.rank))
+        th.enlarged.connect(self.show_preview)
+        th.btn.toggled.connect(partial(self.record_hidden, th))
+        self.restore_item(th)
+#--------------------------------------------------------------------------------
+    def restore_suffix(self, exif: PhotoExif):
+        # before the item is created: the suffix is in its title and in its group
+        if self.session is not None:
+            exif.date_suffix = self.session.get(exif.file, 'x', exif.date_suffix)
+#--------------------------------------------------------------------------------
+    def restore_item(self, item):
+        """
+        restore_item gives a new item its color and hidden state from the session journal, a color is assigned (and recorded) otherwise
+        """
+        color = self.session.get(item.exif.file, 'c') if self.session is not None else None
+        if color is None:
+            color = self.assign_bg_color(item.rank)
+            self.record(item.exif, c=color)
+        item.set_bg_color(color)
+        if self.session is not None and self.session.get(item.exif.file, 'h', False):
+            item.set_hidden(True)
+#--------------------------------------------------------------------------------
+    def record(self, exif: PhotoExif, **fields):
+        # see SessionJournal.update
+        if self.session is not None:
+            self.session.update(exif.file, **fields)
+#--------------------------------------------------------------------------------
+    def record_hidden(self, item, hidden: bool):
+        self.record(item.exif, h=hidden)
+#--------------------------------------------------------------------------------
+    def record_selection(self):
+        if self.session is not None:
+            path = lambda rank: self.w(rank).exif.file if 0 < rank <= self.item_count() else None
+            self.session.set_selection([path(rank) for rank in self.checked_list], path(self.first), path(self.last))
+#--------------------------------------------------------------------------------
+    def restore_selection(self):
+        """
+        restore_selection selects again the thumbnails selected in the session journal, once all the thumbnails are displayed
+        """
+        if self.session is None:
+            return
+        ranks = {item.exif.file: rank for rank, item in enumerate(self.items, 1)}
+        selection = self.session.selection
+        checked = [ranks[path] for path in selection['sel'] if path in ranks]
+        if not checked:
+            return
+        with self.batch_update():
+            for rank in checked:
+                self.w(rank).set_selection(True)
+        self.checked_list = sorted(checked)
+        self.first = ranks.get(selection['first'], -1)
+        self.last = ranks.get(selection['last'], -1)
+#--------------------------------------------------------------------------------
+    def sort_items(self):
+        """
+        sort_items puts the items in chronological order (see card_scan.chronological) once all the metadata are known
+        The items are displayed in the order of the files on the card, which is the shooting order unless the clock of the camera was changed or the card holds the photos of several cameras
+        """
+        photos = [item.exif for item in self.items]
+        ordered = chronological(photos)
+        if ordered != photos:
+            self.reorder(ordered)
+#--------------------------------------------------------------------------------
+    def reorder(self, photos: list):
+        """
+        reorder displays the items again in the order of photos (the PhotoExif of the items), the hidden items stay hidden
+        """
+        hidden = {item.exif.file for item in self.items if item.is_hidden()}
+        self.clear_selection()
+        with self.batch_update():
+            self.remove_items()
+            for exif in photos:
+                self.append_thumbnail(exif)
+                if exif.file in hidden:
+                    self.w(self.item_count()).set_hidden(True)
+#--------------------------------------------------------------------------------
+    def remove_items(self):
+        self.loader.clear()
+        self.pixmaps.release_owners()
+        for item in self.items:
+            self.layout.removeWidget(item)
+            item.deleteLater()
+        # the ranks of the Thumbnails start again from 1
+        Thumbnails.count = 0
+        self.items.clear()
+        self.days.clear()
+        self.groups.clear()
+        self._table = None
+#--------------------------------------------------------------------------------
+    @contextlib.contextmanager
+    def batch_update(self):
+        """
+        batch_update: with self.batch_update(): changes many items (selection of a range, color of a group…) with a single repaint at the end
+        """
+        if not self.updatesEnabled():
+            # nested batch
+            yield
+            return
+        self.setUpdatesEnabled(False)
+        try:
+            yield
+        finally:
+            self.setUpdatesEnabled(True)
+#--------------------------------------------------------------------------------
+    def index_item(self, item):
+        """
+        index_item adds a new item (Thumbnails or ThumbItem) of rank len(items)+1 to the indexes
+        """
+        self.items.append(item)
+        self._table = None
+        rank = len(self.items)
+        # ranks of each day: the days are not contiguous before sort_items (several cameras, clock changed)
+        self.days.setdefault(item.exif.date, set()).add(rank)
+        self.groups.setdefault(item.exif.compressed_date, set()).add(rank)
+#--------------------------------------------------------------------------------
+    def set_date_suffix(self, rank: int, suffix: str):
+        """
+        set_date_suffix changes the date suffix of an item and moves it to its new group
+        """
+        exif = self.w(rank).exif
+        group = self.groups[exif.compressed_date]
+        group.discard(rank)
+        if not group:
+            del self.groups[exif.compressed_date]
+        exif.date_suffix = suffix
+        self.groups.setdefault(exif.compressed_date, set()).add(rank)
+        self.record(exif, x=suffix)
+#--------------------------------------------------------------------------------
+    def day_ranks(self, date: str) -> list:
+        return sorted(self.days[date])
+#--------------------------------------------------------------------------------
+    def kept_photos(self) -> list:
+        """
+        kept_photos returns the PhotoExif of the photos to be copied (not hidden), in chronological order
+        """
+        return [item.exif for item in self.items if not item.is_hidden()]
+#--------------------------------------------------------------------------------
+    def viewport_changed(self, *args):
+        # on every scroll step and every thumbnail added: the visible ranks are computed once they stop changing
+        self._viewport_timer.start()
+#--------------------------------------------------------------------------------
+    def update_viewport(self):
+        if self.items:
+            first, last = self.visible_ranks()
+            self.loader.set_visible(first, last)
+            self.load_pixmaps(first, last)
+#--------------------------------------------------------------------------------
+    def load_pixmaps(self, first: int, last: int):
+        """
+        load_pixmaps displays the pixmaps of the thumbnails in the viewport and one viewport width on each side, decoded again if they were evicted from the PixmapCache
+        The nearest ones are used last: they are the last ones to be evicted
+        """
+        width = last - first + 1
+        ranks = range(max(1, first - width), min(self.item_count(), last + width) + 1)
+        for rank in sorted(ranks, key=lambda rank: -max(first - rank, rank - last, 0)):
+            self.w(rank).load_pixmap()
+#--------------------------------------------------------------------------------
+    def visible_ranks(self) -> tuple:
+        """
+        visible_ranks returns the first and last ranks of the thumbnails in the viewport of the Display
+        The thumbnails are laid out from left to right: the first visible one is found by bisection
+        """
+        area = self.visibleRegion().boundingRect()
+        low, high = 0, len(self.items)
+        while low < high:
+            middle = (low + high) // 2
+            if self.items[middle].geometry().right() < area.left():
+                low = middle + 1
+            else:
+                high = middle
+        first = low
+        last = first
+        while last + 1 < len(self.items) and self.items[last + 1].geometry().left() <= area.right():
+            last += 1
+        return first + 1, last + 1
+#--------------------------------------------------------------------------------
+    def is_current(self, item) -> bool:
+        # False for an item removed since its image was requested (see reorder)
+        return item.rank <= self.item_count() and self.w(item.rank) is item
+#--------------------------------------------------------------------------------
+    def set_decoded_image(self, item, image: QImage):
+        if self.is_current(item):
+            item.set_clear_image(image)
+#--------------------------------------------------------------------------------
+    def set_blurred_image(self, item, image: QImage):
+        if self.is_current(item):
+            item.set_blurred_image(image)
+#--------------------------------------------------------------------------------
+    def show_preview(self, rank: int):
+        """
+        show_preview opens the PreviewViewer on the photo of rank, the arrow keys go through the photos of the gallery
+        """
+        if self.viewer is None:
+            self.viewer = PreviewViewer(self.cache, self)
+        self.viewer.open(self.items, rank)
+#--------------------------------------------------------------------------------
+    def hide_bursts(self):
+        """
+        hide_bursts looks for the bursts and near duplicates of the gallery in the background (see bursts.detect_bursts), then hides all but the sharpest photo of each of them (see bursts_found)
+        """
+        items = list(self.items)
+        if self.cache.in_memory:
+            # the JPEG in memory are not all kept: the workers read them from the RAW files
+            paths = [item.exif.file for item in items]
+        else:
+            paths = [self.cache.path(item.exif) for item in items]
+        times = [(item.exif.date_time - EPOCH).total_seconds() for item in items]
+        if not self.burst_engine.start(items, paths, times, self.cache.in_memory):
+            self.message.emit('Recherche des rafales déjà en cours')
+#--------------------------------------------------------------------------------
+    def bursts_found(self, items: list, bursts):
+        hidden = 0
+        with self.batch_update():
+            for k in bursts.hide:
+                # the items removed or hidden by the user since the search are left as they are
+                if self.is_current(items[k]) and not items[k].is_hidden():
+                    items[k].set_hidden(True)
+                    hidden += 1
+        self.message.emit(f'Rafales : {len(bursts.groups)} groupes, {hidden} photos masquées (la plus nette de chaque groupe est conservée)')
+#--------------------------------------------------------------------------------
+    def skip_thumbnail(self, index: int, error: str):
+        self.message.emit(f'Extraction impossible ({index}) : {error}')
+        self.add_thumbnail(index, None)
 #--------------------------------------------------------------------------------
     def slice_date(self):
         if len(self.checked_list) == 0: # no selection
             return
+        with tracer.span('slice', 'ui', count=len(self.checked_list)), self.batch_update():
+            self._slice_date()
+#--------------------------------------------------------------------------------
+    def _slice_date(self):
         first_index = self.checked_list[0]
         original_suffix = self.w(first_index).exif.date_suffix        
         if not self.valid_selection(first_index, original_suffix):
@@ -153,14 +763,57 @@ class Gallery(QWidget):
 
         suffix = self.get_suffix(first_index)
         for i in self.checked_list:
-            self.w(i).exif.date_suffix = suffix
+            self.set_date_suffix(i, suffix)
             self.update_thumbnail_title(i)
         self.change_group_bg_color(first_index, 0)
         self.clear_selection()
 
-        for i in range(1, Thumbnails.count+1):
+        for i in self.day_ranks(self.w(first_index).exif.date):
             print(self.w(i).exif.compressed_date)
         return
+#--------------------------------------------------------------------------------
+    def propose_groups(self, minutes: int):
+        """
+        propose_groups splits every day of the gallery in groups a, b, c… after each interval longer than minutes between two photos (see naming.propose_suffixes), instead of selecting and slicing the groups one by one
+        Called when the slider of the Controls is released: only the items whose group changes are updated, the groups of the days changed get new colors
+        Groups made by hand (see slice_date, or restored from the session) are replaced only once the user confirms
+        """
+        if not self.items:
+            return
+        if self.manual_groups():
+            answer = QMessageBox.question(self, 'Groupes', 'Remplacer les groupes faits à la main par les groupes proposés ?')
+            if answer != QMessageBox.StandardButton.Yes:
+                return
+        if self._table is None:
+            self._table = PhotoTable.from_photos([item.exif for item in self.items])
+        try:
+            suffixes = propose_suffixes(self._table, 60 * minutes)
+        except NamingError as e:
+            self.message.emit(str(e))
+            return
+        days = set()
+        self.clear_selection()
+        self._proposed.clear()
+        with tracer.span('groups', 'ui', minutes=minutes), self.batch_update():
+            for rank, code in enumerate(suffixes.tolist(), 1):
+                suffix = chr(code) if code else ''
+                self._proposed[self.w(rank).exif.file] = suffix
+                if self.w(rank).exif.date_suffix != suffix:
+                    self.set_date_suffix(rank, suffix)
+                    self.update_thumbnail_title(rank)
+                    days.add(self.w(rank).exif.date)
+            for date in days:
+                # first rank of each group of the day
+                firsts = dict()
+                for rank in self.day_ranks(date):
+                    firsts.setdefault(self.w(rank).exif.compressed_date, rank)
+                for rank in firsts.values():
+                    self.change_group_bg_color(rank, 0)
+        self.message.emit(f'Écart de {minutes} min : {len(self.groups)} groupes')
+#--------------------------------------------------------------------------------
+    def manual_groups(self) -> bool:
+        # a suffix other than the one of the last proposal (none before the first one) was given by hand
+        return any(item.exif.date_suffix != self._proposed.get(item.exif.file, '') for item in self.items)
 #--------------------------------------------------------------------------------
     def valid_selection(self, first_index, original_suffix) ->bool:
         print('La sélection est-elle valide ?')
@@ -180,19 +833,12 @@ class Gallery(QWidget):
         return True
 #--------------------------------------------------------------------------------
     def initialize_all_dates(self, first):
-        items_per_date = list()
-        for i in range(1, Thumbnails.count+1):
-            if self.w(i).exif.date == self.w(first).exif.date:
-                items_per_date.append(i)
-        for i in items_per_date:
-            self.w(i).exif.date_suffix = '?'
+        for i in self.day_ranks(self.w(first).exif.date):
+            self.set_date_suffix(i, '?')
 #--------------------------------------------------------------------------------
     def update_thumbnail_title(self, index):
-            title1 = self.w(index).get_thumbnail_title()[:-13]
-            title = self.w(index).get_thumbnail_title()[-12:-1]
-            title = title + self.w(index).get_date_suffix() +')'
-            print('title', title1, title)
-            self.w(index).set_thumbnail_title(title1 + title)
+        # the title is made again from the metadata, with the new date suffix
+        self.w(index).set_thumbnail_title(make_thumbnail_title(self.w(index).exif))
 #--------------------------------------------------------------------------------
     def different_dates(self) -> int:
         """
@@ -203,19 +849,26 @@ class Gallery(QWidget):
                 -1 if date is the same for all items
                 the boundary where the date change otherwise
         """
-        for i in self.checked_list[1:]:
-            if not self.w(i).exif.date == self.w(i-1).exif.date:
-                return i
+        date = self.w(self.checked_list[0]).exif.date
+        for rank in self.checked_list:
+            if self.w(rank).exif.date != date:
+                return rank
         return -1
 #--------------------------------------------------------------------------------
     def clear_selection(self):
-        for i in self.checked_list:
-            self.w(i).set_selection(False)
+        with self.batch_update():
+            for i in self.checked_list:
+                self.w(i).set_selection(False)
         self.first = -1
         self.last = -1
         self.checked_list.clear()
+        self.record_selection()
 #--------------------------------------------------------------------------------  
     def thumb_selected(self, rank: int, button_checked: bool):
+        self._thumb_selected(rank, button_checked)
+        self.record_selection()
+#--------------------------------------------------------------------------------
+    def _thumb_selected(self, rank: int, button_checked: bool):
         self._modifier = str(Thumbnails.modifier).split('.')[1][:-8]
         if self._modifier == 'Control':
             if not self.in_list_ok(rank):
@@ -248,10 +901,11 @@ class Gallery(QWidget):
             tmp = self.first
             self.first = min(rank, tmp)
             self.last = max(rank, tmp)
-            self.w(rank).set_selection(True)
-            for i in range(self.first+1, self.last):
-                self.w(i).set_selection(True)
-                self.update_checked_list(i)
+            with self.batch_update():
+                self.w(rank).set_selection(True)
+                for i in range(self.first+1, self.last):
+                    self.w(i).set_selection(True)
+                    self.update_checked_list(i)
             return
         else:
             print('ON CHANGE DE LISTE')
@@ -259,9 +913,10 @@ class Gallery(QWidget):
                 print('INTÉRIEUR')
             else:
                 print('EXTÉRIEUR')
-            for i in self.checked_list:
-                self.w(i).set_selection(False)
-            self.w(rank).set_selection(True)
+            with self.batch_update():
+                for i in self.checked_list:
+                    self.w(i).set_selection(False)
+                self.w(rank).set_selection(True)
             self.checked_list.clear()
             self.first = rank
             self.last = -1
@@ -277,9 +932,10 @@ class Gallery(QWidget):
     def change_group_bg_color(self, rank: int, e: int):
         date = self.w(rank).exif.compressed_date
         bg_color = self.new_color()
-        for i in range(1, Thumbnails.count + 1):
-            if self.w(i).exif.compressed_date == date:
+        with tracer.span('recolor', 'ui', count=len(self.groups[date])), self.batch_update():
+            for i in self.groups[date]:
                 self.w(i).set_bg_color(bg_color)
+                self.record(self.w(i).exif, c=bg_color)
 #--------------------------------------------------------------------------------
     def new_color(self):
         red = random.randint(0, 255)
@@ -302,11 +958,7 @@ class Gallery(QWidget):
         return True
 #--------------------------------------------------------------------------------
     def first_series_of_day(self, first_index: int):
-        if first_index == 1:
-            return True
-        if not self.w(first_index).exif.date == self.w(first_index-1).exif.date:
-            return True
-        return False
+        return min(self.days[self.w(first_index).exif.date]) == first_index
 #--------------------------------------------------------------------------------
     def get_suffix(self, first_index):
         if self.first_series_of_day(first_index):
@@ -317,12 +969,7 @@ class Gallery(QWidget):
             if not previous:
                 print('Erreur de début')
                 return ''
-            return self.get_next_letter(previous)
-#--------------------------------------------------------------------------------
-    def get_next_letter(self, letter):
-            letters = string.ascii_lowercase
-            print('gnext', letter, letters)
-            return letters[letters.index(letter) + 1]
+            return next_suffix(previous)
 #--------------------------------------------------------------------------------
     def update_checked_list(self, item: int):
         if item == 0:
@@ -337,31 +984,635 @@ class Gallery(QWidget):
         print('upd lst', self.checked_list)
 #--------------------------------------------------------------------------------
     def w(self, rank: int):
-        return self.layout.itemAt(rank).widget()
+        return self.items[rank - 1]
+#--------------------------------------------------------------------------------
+    def item_count(self) -> int:
+        return len(self.items)
 #--------------------------------------------------------------------------------
 #--------------------------------------------------------------------------------
     def update_next_item_date(self, original_date, suffix):
-        next_suffix = self.get_next_letter(suffix)
-        first = -1
-        for i in range(1, Thumbnails.count+1):
-            if self.w(i).exif.compressed_date == original_date:
-                if first == -1:
-                    first = i
-                self.update_thumbnail_date(i, next_suffix)
-        print('i', first)       
+        suffix = next_suffix(suffix)
+        ranks = sorted(self.groups.get(original_date, ()))
+        for i in ranks:
+            self.update_thumbnail_date(i, suffix)
+        print('i', ranks[0] if ranks else -1)
 #--------------------------------------------------------------------------------
     def update_thumbnail_date(self, i, suffix):
-            # update suffix
-            self.w(i).exif.date_suffix = suffix
-            # update title
-            thumbnail_title = self.w(i).get_thumbnail_title()[:-1] + suffix + ')'
-            self.w(i).set_thumbnail_title(thumbnail_title)
+        self.set_date_suffix(i, suffix)
+        self.update_thumbnail_title(i)
+#################################################################################
+class ThumbItem():
+    """
+    ThumbItem is the counterpart of Thumbnails in a VirtualGallery: a lightweight record holding the state of one photo, with the same interface as Thumbnails
+    The painting is done by ThumbDelegate, every change is notified to the GalleryModel
+
+    Attributes
+        exif: PhotoExif
+        rank: int
+            rank of the item in the gallery (from 1)
+        bg_color: str
+        is_selected: bool
+        hidden: bool
+            whether or not the JPEG is displayed blurred
+        thumbnail_title: str
+            original title (without date suffix)
+        title: str
+            displayed title
+    """
+    __slots__ = ('exif', 'rank', 'bg_color', 'is_selected', 'hidden', 'thumbnail_title', 'title', '_model')
+
+    def __init__(self, exif: PhotoExif, rank: int, model) -> None:
+        self.exif = exif
+        self.rank = rank
+        self.bg_color = '#bbb'
+        self.is_selected = False
+        self.hidden = False
+        self.thumbnail_title = make_thumbnail_title(exif)
+        self.title = self.thumbnail_title
+        self._model = model
+#--------------------------------------------------------------------------------
+    def get_date_suffix(self):
+        return self.exif.date_suffix
+    def get_thumbnail_title(self):
+        return self.thumbnail_title
+    def set_thumbnail_title(self, title):
+        self.title = title
+        self._model.item_changed(self.rank)
+    def set_selection(self, flag: bool):
+        self.is_selected = flag
+        self._model.item_changed(self.rank)
+    def get_selection(self):
+        return self.is_selected
+    def get_bg_color(self):
+        return self.bg_color
+    def set_bg_color(self, color: str):
+        self.bg_color = color
+        self._model.item_changed(self.rank)
+    def set_hidden(self, flag: bool):
+        changed = flag != self.hidden
+        self.hidden = flag
+        self._model.item_changed(self.rank)
+        if changed:
+            self._model.hidden_changed.emit(self, flag)
+    def is_hidden(self):
+        return self.hidden
+#################################################################################
+class GalleryModel(QAbstractListModel):
+    """
+    GalleryModel is the item model of a VirtualGallery: one row per photo, the ThumbItem of a row is returned for Qt.UserRole
+    The pixmaps are requested from the ThumbLoader only when a row is painted, and kept in the PixmapCache of the gallery
+
+    Signals:
+        hidden_changed(object, bool): an item is hidden or shown
+    """
+    hidden_changed = Signal(object, bool)
+
+    def __init__(self, cache: ThumbCache, pixmaps: PixmapCache, loader: ThumbLoader):
+        super().__init__()
+        self.cache = cache
+        self.pixmaps = pixmaps
+        self.loader = loader
+        self.items = list()
+        # first and last ranks changed during a batch (see batch), None outside of a batch
+        self._changed = None
+#--------------------------------------------------------------------------------
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.items)
+#--------------------------------------------------------------------------------
+    def data(self, index, role=Qt.ItemDataRole.DisplayRole):
+        if not index.isValid():
+            return None
+        item = self.items[index.row()]
+        if role == Qt.ItemDataRole.DisplayRole:
+            return item.title
+        if role == Qt.ItemDataRole.DecorationRole:
+            return self.pixmap(item)
+        if role == Qt.ItemDataRole.UserRole:
+            return item
+        return None
+#--------------------------------------------------------------------------------
+    def append(self, exif: PhotoExif) -> ThumbItem:
+        row = len(self.items)
+        self.beginInsertRows(QModelIndex(), row, row)
+        item = ThumbItem(exif, row + 1, self)
+        self.items.append(item)
+        self.endInsertRows()
+        return item
+#--------------------------------------------------------------------------------
+    def clear(self):
+        # the decoded pixmaps are kept: they are keyed on the cached JPEG, not on the rows
+        self.beginResetModel()
+        self.items.clear()
+        self.endResetModel()
+#--------------------------------------------------------------------------------
+    def item_changed(self, rank: int):
+        if self._changed is not None:
+            first, last = self._changed
+            self._changed = (min(first, rank), max(last, rank))
+            return
+        index = self.index(rank - 1)
+        self.dataChanged.emit(index, index)
+#--------------------------------------------------------------------------------
+    @contextlib.contextmanager
+    def batch(self):
+        """
+        batch: with model.batch(): the changes of the items are notified once, as a single range, at the end
+        """
+        if self._changed is not None:
+            # nested batch
+            yield
+            return
+        self._changed = (len(self.items) + 1, 0)
+        try:
+            yield
+        finally:
+            first, last = self._changed
+            self._changed = None
+            if first <= last:
+                self.dataChanged.emit(self.index(first - 1), self.index(last - 1))
+#--------------------------------------------------------------------------------
+    def pixmap(self, item: ThumbItem) -> QPixmap:
+        """
+        pixmap returns the pixmap of an item
+        A pixmap not decoded yet is requested from the ThumbLoader and an empty pixmap is returned, the row is painted again when it is ready (see set_decoded_image)
+        The blurred pixmap of a hidden item is requested in the same way, the clear one is returned until it is ready
+        """
+        path = self.cache.path(item.exif)
+        if item.hidden:
+            blurred = self.pixmaps.get(path + BLURRED)
+            if blurred is not None:
+                return blurred
+        pixmap = self.pixmaps.get(path)
+        if pixmap is None:
+            self.loader.request_decode(item, path, item.exif.exif_orientation, cancellable=True)
+            return QPixmap()
+        if item.hidden:
+            image = pixmap.toImage()
+            self.loader.request_blur(item, image, path, cancellable=True)
+        return pixmap
+#--------------------------------------------------------------------------------
+    def set_decoded_image(self, item: ThumbItem, image: QImage):
+        self.pixmaps.put(self.cache.path(item.exif), QPixmap.fromImage(image))
+        self.item_changed(item.rank)
+#--------------------------------------------------------------------------------
+    def set_blurred_image(self, item: ThumbItem, image: QImage):
+        self.pixmaps.put(self.cache.path(item.exif) + BLURRED, QPixmap.fromImage(image))
+        self.item_changed(item.rank)
+#################################################################################
+class ThumbDelegate(QStyledItemDelegate):
+    """
+    ThumbDelegate paints the rows of a GalleryModel like Thumbnails widgets (title, JPEG, Masquer/Afficher button, color and selection buttons) and handles the clicks on the buttons
+
+    Signals:
+        selected(int): the selection button of the item of rank int is clicked
+        colored(int): the color button of the item of rank int is clicked
+        enlarged(int): the JPEG of the item of rank int is clicked
+    """
+    selected = Signal(int)
+    colored = Signal(int)
+    enlarged = Signal(int)
+    TITLE_HEIGHT = 24
+    MARGIN = 6
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self._icon_selected = QPixmap('./icons/_active__yes.png')
+        self._icon_color = QPixmap('./icons/color.png')
+#--------------------------------------------------------------------------------
+    def sizeHint(self, option, index):
+        return QSize(PIXMAP_MAX_SIZE + 2*self.MARGIN, self.TITLE_HEIGHT + PIXMAP_MAX_SIZE + BUTTON_V_SIZE + 3*self.MARGIN)
+#--------------------------------------------------------------------------------
+    def rects(self, rect: QRect) -> dict:
+        """
+        rects returns the areas of an item painted in rect: 'frame', 'title', 'pixmap', 'hide', 'color' and 'select'
+        """
+        m = self.MARGIN
+        frame = rect.adjusted(m//2, self.TITLE_HEIGHT//2, -m//2, -m//2)
+        pixmap = QRect(rect.left() + m, rect.top() + self.TITLE_HEIGHT + m//2, PIXMAP_MAX_SIZE, PIXMAP_MAX_SIZE)
+        buttons_top = pixmap.bottom() + m//2
+        return {
+            'frame': frame,
+            'title': QRect(rect.left() + m, rect.top(), rect.width() - 2*m, self.TITLE_HEIGHT),
+            'pixmap': pixmap,
+            'hide': QRect(rect.left() + m, buttons_top, MASK_BUTTON_H_SIZE, BUTTON_V_SIZE),
+            'color': QRect(rect.right() - m - 2*BUTTON_V_SIZE, buttons_top, BUTTON_V_SIZE, BUTTON_V_SIZE),
+            'select': QRect(rect.right() - m - BUTTON_V_SIZE, buttons_top, BUTTON_V_SIZE, BUTTON_V_SIZE),
+        }
+#--------------------------------------------------------------------------------
+    def paint(self, painter, option, index):
+        item = index.data(Qt.ItemDataRole.UserRole)
+        rects = self.rects(option.rect)
+        painter.save()
+        painter.fillRect(option.rect, QColor(item.bg_color))
+        painter.setPen(QPen(QColor('silver')))
+        painter.drawRoundedRect(rects['frame'], 3, 3)
+        # title
+        title_rect = painter.boundingRect(rects['title'], Qt.AlignmentFlag.AlignLeft | Qt.AlignmentFlag.AlignVCenter, item.title).adjusted(-5, -3, 5, 3)
+        painter.setPen(Qt.PenStyle.NoPen)
+        painter.setBrush(QColor('#555'))
+        painter.drawRoundedRect(title_rect, 7, 7)
+        painter.setPen(QColor('#eee'))
+        painter.drawText(rects['title'], Qt.AlignmentFlag.AlignLeft | Qt.AlignmentFlag.AlignVCenter, item.title)
+        # JPEG
+        pixmap = index.data(Qt.ItemDataRole.DecorationRole)
+        target = rects['pixmap']
+        painter.drawPixmap(target.left() + (target.width() - pixmap.width())//2, target.top() + (target.height() - pixmap.height())//2, pixmap)
+        # buttons
+        painter.fillRect(rects['hide'], QColor('#e66' if item.hidden else '#6e6'))
+        painter.setPen(QColor('#222'))
+        painter.drawText(rects['hide'], Qt.AlignmentFlag.AlignCenter, 'Afficher' if item.hidden else 'Masquer')
+        painter.drawPixmap(rects['color'], self._icon_color)
+        painter.fillRect(rects['select'], QColor(item.bg_color))
+        painter.drawRect(rects['select'])
+        if item.is_selected:
+            painter.drawPixmap(rects['select'].adjusted(2, 2, -2, -2), self._icon_selected)
+        painter.restore()
+#--------------------------------------------------------------------------------
+    def editorEvent(self, event, model, option, index):
+        if event.type() != QEvent.Type.MouseButtonRelease or event.button() != Qt.MouseButton.LeftButton:
+            return False
+        item = index.data(Qt.ItemDataRole.UserRole)
+        rects = self.rects(option.rect)
+        position = event.position().toPoint()
+        if rects['hide'].contains(position):
+            item.set_hidden(not item.hidden)
+        elif rects['color'].contains(position):
+            self.colored.emit(item.rank)
+        elif rects['select'].contains(position):
+            self.selected.emit(item.rank)
+        elif rects['pixmap'].contains(position):
+            self.enlarged.emit(item.rank)
+        else:
+            return False
+        return True
+#################################################################################
+class VirtualGallery(Gallery):
+    """
+    VirtualGallery is a Gallery for cards with thousands of photos: the photos are the rows of a GalleryModel shown by a QListView with a ThumbDelegate, so that only the visible thumbnails are painted and their JPEG decoded
+    The selection, suffix and color logic of Gallery is unchanged, it works on ThumbItem instead of Thumbnails
+    """
+    def __init__(self, controls, cache: ThumbCache, session: SessionJournal = None):
+        super().__init__(controls, cache, session)
+        self.model = GalleryModel(cache, self.pixmaps, self.loader)
+        self.view = QListView()
+        self.view.setObjectName('gallery')
+        self.view.setFlow(QListView.Flow.LeftToRight)
+        self.view.setWrapping(False)
+        self.view.setUniformItemSizes(True)
+        self.view.setHorizontalScrollMode(QAbstractItemView.ScrollMode.ScrollPerPixel)
+        self.view.setSelectionMode(QAbstractItemView.SelectionMode.NoSelection)
+        self.delegate = ThumbDelegate(self.view)
+        self.view.setItemDelegate(self.delegate)
+        self.view.setModel(self.model)
+        # the view replaces the stretch of the Gallery layout
+        self.layout.takeAt(0)
+        self.layout.addWidget(self.view)
+        self.view.horizontalScrollBar().valueChanged.connect(self.viewport_changed)
+        # process signals from the delegate
+        self.delegate.selected.connect(partial(self.thumb_selected, button_checked=True))
+        self.delegate.colored.connect(partial(self.change_group_bg_color, e=0))
+        self.delegate.enlarged.connect(self.show_preview)
+        self.model.hidden_changed.connect(self.record_hidden)
+#--------------------------------------------------------------------------------
+    def append_thumbnail(self, exif: PhotoExif):
+        self.restore_suffix(exif)
+        item = self.model.append(exif)
+        self.index_item(item)
+        self.restore_item(item)
+#--------------------------------------------------------------------------------
+    def remove_items(self):
+        self.loader.clear()
+        self.model.clear()
+        self.items.clear()
+        self.days.clear()
+        self.groups.clear()
+        self._table = None
+#--------------------------------------------------------------------------------
+    @contextlib.contextmanager
+    def batch_update(self):
+        with self.model.batch():
+            yield
+#--------------------------------------------------------------------------------
+    def load_pixmaps(self, first: int, last: int):
+        # the rows request their pixmaps when they are painted
+        pass
+#--------------------------------------------------------------------------------
+    def visible_ranks(self) -> tuple:
+        # rows at the left and right edges of the viewport of the view
+        viewport = self.view.viewport().rect()
+        first = self.view.indexAt(viewport.topLeft() + QPoint(1, viewport.height()//2))
+        last = self.view.indexAt(viewport.topRight() + QPoint(-1, viewport.height()//2))
+        first_rank = first.row() + 1 if first.isValid() else 1
+        last_rank = last.row() + 1 if last.isValid() else self.model.rowCount()
+        return first_rank, last_rank
+#--------------------------------------------------------------------------------
+    def set_decoded_image(self, item: ThumbItem, image: QImage):
+        if self.is_current(item):
+            self.model.set_decoded_image(item, image)
+#--------------------------------------------------------------------------------
+    def set_blurred_image(self, item: ThumbItem, image: QImage):
+        if self.is_current(item):
+            self.model.set_blurred_image(item, image)
+#################################################################################
+class ExtractionEngine(QObject):
+    """
+    ExtractionEngine reads the metadata and extracts the JPEG embedded in the RAW files in a pool of processes
+    With load, each file goes through the pipeline on its own (scan, metadata, cache lookup, extraction): the first thumbnails are ready long before the last files are found
+    The metadata of the files recorded in the session journal (see session) are not read again
+
+    Signals:
+        found(int, str): emitted as soon as a file is found by the scan, with its index and its path
+        scanned(int): emitted at the end of the scan, with the number of files found
+        extracted(int, object): emitted as soon as the JPEG of a file is written, with the index of the file (in the order given to load or start) and its PhotoExif
+        imported(int, object): emitted instead of extracted for a file already in the library (see library), nothing is extracted
+        failed(int, str): emitted when the extraction of a file fails, with the index of the file and the error message; index -1 for a file of the library whose metadata cannot be read (see LibraryIndex.update)
+        finished(): emitted when every file has been processed
+    """
+    found = Signal(int, str)
+    scanned = Signal(int)
+    extracted = Signal(int, object)
+    imported = Signal(int, object)
+    failed = Signal(int, str)
+    finished = Signal()
+    # internal: metadata read by a worker, queued to the GUI thread
+    _read_done = Signal(int, object)
+
+    def __init__(self, cache: ThumbCache, workers: int = EXTRACT_WORKERS, library: LibraryIndex = None, session: SessionJournal = None):
+        """
+        __init__ creates ExtractionEngine objects
+
+        Args:
+            cache: ThumbCache or MemoryThumbCache
+                cache where the JPEG are written (or kept in memory), files already in the cache are not extracted again
+            workers: int
+                number of worker processes
+            library: LibraryIndex
+                index of the destination library, the files already imported are skipped; updated by load before the scan
+            session: SessionJournal
+                journal of the card, the metadata read are recorded in it
+        """
+        super().__init__()
+        self.cache = cache
+        self.workers = workers
+        self.library = library
+        self.session = session
+        self._executor = None
+        self._remaining = 0
+        self._lock = threading.Lock()
+        self.photos = list()
+        self._scanning = False
+        self._read_done.connect(self._extract)
+        self.found.connect(self._read_file)
+        self.scanned.connect(self._scan_done)
+#--------------------------------------------------------------------------------
+    def load(self, raw_files):
+        """
+        load reads the metadata of the RAW files and extracts their JPEG, and returns immediately
+        raw_files is consumed in a background thread: with a generator (see card_scan.iter_raw_files) the first files are read and extracted while the card is still being scanned
+        The PhotoExif are stored in photos as they are read
+
+        Args:
+            raw_files: iterable[str]
+                paths to the RAW files
+        """
+        self.photos = list()
+        with self._lock:
+            self._remaining = 0
+            self._scanning = True
+        threading.Thread(target=self._scan, args=(raw_files,), daemon=True).start()
+#--------------------------------------------------------------------------------
+    def _scan(self, raw_files):
+        # background thread: the signals are queued to the GUI thread, in order
+        if self.library is not None:
+            errors = list()
+            try:
+                self.library.update(errors)
+            except OSError as e:
+                # index not writable: the scan goes on, the files already known are still skipped
+                errors.append((self.library.path, str(e)))
+            for path, error in errors:
+                self.failed.emit(-1, f'{path} : {error}')
+        count = 0
+        with tracer.span('scan', 'io'):
+            for raw_file in raw_files:
+                self.found.emit(count, raw_file)
+                count += 1
+        self.scanned.emit(count)
+#--------------------------------------------------------------------------------
+    def _read_file(self, index: int, raw_file: str):
+        self.photos.append(None)
+        with self._lock:
+            self._remaining += 1
+        tags = self.session.tags(raw_file) if self.session is not None else None
+        if tags is not None:
+            tracer.count('session hits')
+            exif = PhotoExif(raw_file, tags)
+            self.photos[index] = exif
+            self._extract(index, exif)
+            return
+        future = self._submit(read_tags, raw_file)
+        future.add_done_callback(partial(self._read, index, raw_file))
+#--------------------------------------------------------------------------------
+    def _scan_done(self, count: int):
+        with self._lock:
+            self._scanning = False
+            last = self._remaining == 0
+        if last:
+            self.finished.emit()
+#--------------------------------------------------------------------------------
+    def read_exif(self, raw_files: list) -> list:
+        """
+        read_exif reads the metadata of all the RAW files with the pool of the engine
+
+        Returns:
+            list[PhotoExif]: to be given to start, then shared with the Gallery
+        """
+        return read_exif_batch(raw_files, executor=self._pool())
+#--------------------------------------------------------------------------------
+    def start(self, photos: list):
+        """
+        start submits the extraction of all the RAW files and returns immediately
+
+        Args:
+            photos: list[PhotoExif]
+                metadata of the RAW files from which the JPEG is to be extracted
+        """
+        self.photos = list(photos)
+        with self._lock:
+            self._remaining = len(photos)
+            self._scanning = False
+        if not photos:
+            self.finished.emit()
+            return
+        for index, exif in enumerate(photos):
+            self._extract(index, exif)
+#--------------------------------------------------------------------------------
+    def _extract(self, index: int, exif: PhotoExif):
+        if self.session is not None:
+            self.session.record_photo(exif)
+        if self.library is not None and self.library.contains(exif):
+            tracer.count('already imported')
+            self.imported.emit(index, exif)
+            self._count_down()
+            return
+        thumb_file = self.cache.path(exif)
+        if self.cache.get(thumb_file):
+            tracer.count('cache hits')
+            self.extracted.emit(index, exif)
+            self._count_down()
+            return
+        if self.cache.in_memory:
+            # nothing is written: the worker returns the bytes of the JPEG
+            future = self._submit(read_preview, exif.file)
+        else:
+            future = self._submit(extract_preview, exif.file, thumb_file)
+        future.add_done_callback(partial(self._done, index, exif, thumb_file))
+#--------------------------------------------------------------------------------
+    def _submit(self, function, *args):
+        # the workers time each file only when the tracing is on
+        if tracer.enabled:
+            return self._pool().submit(timed, function, *args)
+        return self._pool().submit(function, *args)
+#--------------------------------------------------------------------------------
+    def _read(self, index: int, raw_file: str, future):
+        # called from a thread of the executor: the extraction is submitted from the GUI thread
+        if future.cancelled():
+            return
+        error = future.exception()
+        if error is not None:
+            self.failed.emit(index, str(error))
+            self._count_down()
+            return
+        exif = PhotoExif(raw_file, tracer.unwrap('exif', future.result(), file=raw_file))
+        self.photos[index] = exif
+        self._read_done.emit(index, exif)
+#--------------------------------------------------------------------------------
+    def _pool(self):
+        if self._executor is None:
+            # spawn: the workers must not inherit the Qt state of the GUI process
+            self._executor = ProcessPoolExecutor(max_workers=self.workers, mp_context=multiprocessing.get_context('spawn'))
+        return self._executor
+#--------------------------------------------------------------------------------
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+#--------------------------------------------------------------------------------
+    def _done(self, index: int, exif: PhotoExif, thumb_file: str, future):
+        # called from a thread of the executor: the signals are queued to the GUI thread
+        if future.cancelled():
+            return
+        error = future.exception()
+        if error is None:
+            result = tracer.unwrap('extraction', future.result(), file=exif.file)
+            if self.cache.in_memory:
+                self.cache.added(thumb_file, result)
+            else:
+                self.cache.added(result)
+            tracer.count('extracted')
+            self.extracted.emit(index, exif)
+        else:
+            self.failed.emit(index, str(error))
+        self._count_down()
+#--------------------------------------------------------------------------------
+    def _count_down(self):
+        with self._lock:
+            self._remaining -= 1
+            last = self._remaining == 0 and not self._scanning
+        if last:
+            self.finished.emit()
+#################################################################################
+class ExecutionEngine(QObject):
+    """
+    ExecutionEngine copies the photos to their new names (see naming.plan_copies) in a background thread
+    The copies are recorded in a Journal at the root of the destination: a transfer interrupted (card removed, crash) is resumed by executing the same plan again
+
+    Signals:
+        progress(int, int, object, object): files copied, files to copy, bytes copied, bytes to copy (bytes may exceed 32 bits)
+        finished(object): the TransferStats once every file is processed
+    """
+    progress = Signal(int, int, object, object)
+    finished = Signal(object)
+
+    def __init__(self, workers_per_device: int = COPY_WORKERS_PER_DEVICE):
+        super().__init__()
+        self.workers_per_device = workers_per_device
+        self._thread = None
+#--------------------------------------------------------------------------------
+    def start(self, plan: list, destination: str, verify: bool = False) -> bool:
+        """
+        start copies the files of plan and returns immediately, False if a copy is already running
+
+        Args:
+            plan: list[tuple]
+                (source path, destination path)
+            destination: str
+                root directory of the copies, where the journal is kept
+            verify: bool
+                read back and check every copy
+        """
+        if self.is_running():
+            return False
+        self._thread = threading.Thread(target=self._run, args=(plan, destination, verify), daemon=False)
+        self._thread.start()
+        return True
+#--------------------------------------------------------------------------------
+    def is_running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+#--------------------------------------------------------------------------------
+    def _run(self, plan: list, destination: str, verify: bool):
+        # signals emitted from this thread are queued to the GUI thread
+        try:
+            journal = Journal(destination)
+            try:
+                stats = execute_plan(plan, self.workers_per_device, self._progress, journal, verify)
+            finally:
+                journal.close()
+        except OSError as e:
+            # destination not writable (directories, journal): every file of the plan failed, finished is emitted anyway
+            stats = TransferStats(len(plan), 0)
+            stats.errors.append((destination, str(e)))
+        self.finished.emit(stats)
+    def _progress(self, stats):
+        self.progress.emit(stats.files, stats.total_files, stats.bytes, stats.total_bytes)
+#################################################################################
+class BurstEngine(QObject):
+    """
+    BurstEngine looks for the bursts and near duplicates of a gallery (see bursts.detect_bursts) in a background thread
+
+    Signals:
+        finished(object, object): the items given to start and the Bursts, whose indexes refer to the items
+    """
+    finished = Signal(object, object)
+
+    def __init__(self):
+        super().__init__()
+        self._thread = None
+#--------------------------------------------------------------------------------
+    def start(self, items: list, paths: list, times: list, raw: bool = False) -> bool:
+        """
+        start returns immediately, False if a search is already running (raw: paths are the RAW files, see bursts.raw_features)
+        """
+        if self._thread is not None and self._thread.is_alive():
+            return False
+        self._thread = threading.Thread(target=self._run, args=(items, paths, times, raw), daemon=True)
+        self._thread.start()
+        return True
+#--------------------------------------------------------------------------------
+    def _run(self, items: list, paths: list, times: list, raw: bool):
+        # imported on the first search: numpy is not needed otherwise
+        from bursts import detect_bursts
+        self.finished.emit(items, detect_bursts(paths, times, raw=raw))
 #################################################################################
 class Controls(QWidget):
     sliced = Signal(bool)
     cleared = Signal(bool)
+    bursts = Signal(bool)
+    grouped = Signal(int)
+    executed = Signal(str, str, bool)
     def __init__(self):
         super().__init__()
+        self.destination = ''
 
         # vbox_lbl = QVBoxLayout()
         vbox_btn = QVBoxLayout()
@@ -374,15 +1625,40 @@ class Controls(QWidget):
         # btn_clear_checked_list.setFixedSize(BUTTON_V_SIZE, BUTTON_V_SIZE)
         btn_clear_checked_list.clicked.connect(self._clear_selection)
         
+        # hide all but the sharpest photo of each burst
+        btn_bursts = QPushButton('Masquer les rafales')
+        btn_bursts.clicked.connect(self._bursts)
+
+        # automatic groups: a new group after each interval longer than the gap, proposed again when the slider is released
+        self.gap = QSlider(Qt.Orientation.Horizontal)
+        self.gap.setRange(1, GROUP_GAP_MAX)
+        self.gap.setValue(GROUP_GAP_MINUTES)
+        # while dragging, only the label follows the slider: valueChanged is emitted on release
+        self.gap.setTracking(False)
+        self.lbl_gap = QLabel()
+        self._show_gap(GROUP_GAP_MINUTES)
+        self.gap.sliderMoved.connect(self._show_gap)
+        # keys and wheel change the value step by step: the groups are proposed after the last step
+        self._gap_timer = QTimer(self)
+        self._gap_timer.setSingleShot(True)
+        self._gap_timer.setInterval(GROUP_DELAY)
+        self._gap_timer.timeout.connect(self._group)
+        self.gap.valueChanged.connect(self._gap_changed)
+        hbox_gap = QHBoxLayout()
+        hbox_gap.addWidget(self.lbl_gap)
+        hbox_gap.addWidget(self.gap)
+
         # add widgets to vboxes
         vbox_btn.addWidget(btn_slice_date)
         vbox_btn.addWidget(btn_clear_checked_list)
+        vbox_btn.addWidget(btn_bursts)
+        vbox_btn.addLayout(hbox_gap)
 
         layout = QGridLayout()
         self.setLayout(layout)
         groupbox_op = QGroupBox('Opérations')
         groupbox_op.setObjectName('ctrl1')
-        groupbox_op.setFixedSize(int(.3*H_SIZE), 100)
+        groupbox_op.setFixedSize(int(.3*H_SIZE), 150)
         layout.addWidget(groupbox_op)
         layout.setColumnStretch(1, 5)
 
@@ -394,13 +1670,103 @@ class Controls(QWidget):
         hbox.addStretch()
 
         groupbox_op.setLayout(hbox)
+
+        # execution: title of the directories, destination, execute button and progress
+        self.title = QLineEdit()
+        self.title.setPlaceholderText('Titre du répertoire')
+        btn_destination = QPushButton('Destination…')
+        btn_destination.clicked.connect(self._choose_destination)
+        self.lbl_destination = QLabel('')
+        btn_execute = QPushButton('Exécuter')
+        btn_execute.clicked.connect(self._execute)
+        self.verify = QCheckBox('Vérifier')
+        self.verify.setChecked(VERIFY_COPIES)
+        self.progress = QProgressBar()
+        self.progress.setVisible(False)
+
+        grid_exec = QGridLayout()
+        grid_exec.addWidget(self.title, 0, 0)
+        grid_exec.addWidget(self.verify, 0, 1)
+        grid_exec.addWidget(btn_destination, 1, 0)
+        grid_exec.addWidget(self.lbl_destination, 1, 1)
+        grid_exec.addWidget(btn_execute, 2, 0)
+        grid_exec.addWidget(self.progress, 2, 1)
+        groupbox_exec = QGroupBox('Exécution')
+        groupbox_exec.setObjectName('ctrl1')
+        groupbox_exec.setFixedSize(int(.4*H_SIZE), 120)
+        groupbox_exec.setLayout(grid_exec)
+        layout.addWidget(groupbox_exec, 0, 1, alignment=Qt.AlignmentFlag.AlignLeft)
 #--------------------------------------------------------------------------------
+    def show_progress(self, files: int, total_files: int):
+        self.progress.setVisible(True)
+        self.progress.setMaximum(total_files)
+        self.progress.setValue(files)
+#--------------------------------------------------------------------------------
+    def set_destination(self, destination: str):
+        self.destination = destination
+        self.lbl_destination.setText(destination)
+#--------------------------------------------------------------------------------
+    @Slot(result=bool)
+    def _choose_destination(self, event: int):
+        destination = QFileDialog.getExistingDirectory(self, 'Répertoire de destination', self.destination)
+        if destination:
+            self.set_destination(destination)
+    @Slot(result=bool)
+    def _execute(self, event: int):
+        self.executed.emit(self.title.text().strip(), self.destination, self.verify.isChecked())
     @Slot(result=bool)
     def _clear_selection(self, event: int):
         self.cleared.emit(True)
     @Slot(result=bool)
     def _slice(self, event:int):
         self.sliced.emit(True)
+    @Slot(result=bool)
+    def _bursts(self, event: int):
+        self.bursts.emit(True)
+    def _show_gap(self, minutes: int):
+        self.lbl_gap.setText(f'Groupes : écart {minutes} min')
+    def _gap_changed(self, minutes: int):
+        self._show_gap(minutes)
+        self._gap_timer.start()
+    def _group(self):
+        self.grouped.emit(self.gap.value())
+#################################################################################
+class StatsPanel(QGroupBox):
+    """
+    StatsPanel shows, next to the Controls, the totals of the Tracer by stage (number of spans, mean and longest time) and its counters, and the hit rate and resident size of the PixmapCache of the gallery
+    It is refreshed by a timer, only while the tracing is on
+    """
+    def __init__(self, tracer, interval: int = TRACE_PANEL_INTERVAL):
+        super().__init__('Performances')
+        self.setObjectName('ctrl1')
+        self.setFixedSize(int(.28*H_SIZE), 120)
+        self.tracer = tracer
+        self.pixmaps = None
+        self.label = QLabel('')
+        self.label.setFont(QFont('monospace', 8))
+        self.label.setAlignment(Qt.AlignmentFlag.AlignTop | Qt.AlignmentFlag.AlignLeft)
+        layout = QVBoxLayout()
+        layout.setContentsMargins(4, 4, 4, 4)
+        layout.addWidget(self.label)
+        self.setLayout(layout)
+        self.timer = QTimer(self)
+        self.timer.timeout.connect(self.refresh)
+        self.timer.start(interval)
+#--------------------------------------------------------------------------------
+    def refresh(self):
+        if not self.tracer.enabled:
+            return
+        summary = self.tracer.summary()
+        lines = [f'{name:<10} {stat["count"]:>6} × {stat["mean_ms"]:7.1f} ms (max {stat["max_ms"]:.0f})'
+                 for name, stat in summary['stages'].items()]
+        lines += [f'{name:<10} {value:>6}' for name, value in summary['counters'].items()]
+        if self.pixmaps is not None:
+            stats = self.pixmaps.stats()
+            lines.append(f'pixmaps    {stats["pixmaps"]:>6} {stats["resident"] / 1e6:6.1f}/{stats["budget"] / 1e6:.0f} Mo, {100 * stats["hit_rate"]:.0f} % hits')
+        self.label.setText('\n'.join(lines))
+#--------------------------------------------------------------------------------
+    def set_pixmaps(self, pixmaps: PixmapCache):
+        self.pixmaps = pixmaps
 #################################################################################
 class Thumbnails(QWidget):
     """
@@ -416,21 +1782,27 @@ class Thumbnails(QWidget):
 
     Signals:
         When status is changed (hidden/shown) a changed signal is emitted which contains the exif original name (stem)
+        enlarged(int): the JPEG is clicked, with the rank of the Thumbnails
     """
     selected = Signal(bool)
     colored = Signal(str)
+    enlarged = Signal(int)
     modifier = Qt.KeyboardModifier.NoModifier
     count: int = 0
 
-    def __init__(self, photo: str):
+    def __init__(self, exif: PhotoExif, cache: ThumbCache, pixmaps: PixmapCache, loader: ThumbLoader):
         """
         __init__ creates Thumbnails objects
 
         Args:
-            photo: str
-                path to RAW file
-            blur: str
-                whether or not the displayed JPEG should be blurred: clear = empty string, blurred = BLURRED constant
+            exif: PhotoExif
+                metadata of the RAW file (read once, see read_exif_batch)
+            cache: ThumbCache or MemoryThumbCache
+                cache containing the extracted JPEG
+            pixmaps: PixmapCache
+                holds the decoded JPEG (clear and blurred) of the gallery, the Thumbnails only references the one it displays
+            loader: ThumbLoader
+                decodes the JPEG, and blurs it when the thumbnail is hidden, in the background
 
             id: int
                 id number
@@ -448,25 +1820,36 @@ class Thumbnails(QWidget):
                 set background color to "color"
         """
         super().__init__()
-        self.exif = PhotoExif(photo)
+        self.exif = exif
         self.bg_color = '#bbb' #maybe useless, to check
         self.is_selected = False
-        self._full_path_tmp = TMP_DIR + self.exif.original_name + '.jpeg'
-        self._full_path_tmp_blurred = TMP_DIR + self.exif.original_name + BLURRED + '.jpeg'
+        self.cache = cache
+        self.pixmaps = pixmaps
+        self.loader = loader
+        self._full_path_tmp = cache.path(exif)
         Thumbnails.count += 1 
         self.rank = Thumbnails.count
 
         # self._thumbnail_title = ''
-        self.thumbnail_title = self.exif.original_name + '  ('  + self.exif.date.replace(' ', '/') + ')'
-        reversed_date = '/'.join(list(reversed(self.exif.date.split(' '))))
-        self.thumbnail_title = self.exif.original_name + '  (' + reversed_date + self.exif.date_suffix + ')'
+        self.thumbnail_title = make_thumbnail_title(self.exif)
 
+        # the styles are in style.qss (object names and dynamic properties), the background color is a shared palette: a change of state does not parse a style sheet
+        self.setAutoFillBackground(True)
+        self.setPalette(background_palette(self.bg_color))
         self._label = QLabel(self)
-        self._label.setStyleSheet('margin: 0px 0px 5px 0px')
-        self.set_pixmap(self._full_path_tmp)
+        self._label.setObjectName('jpeg')
+        # empty pixmap of the display size until the JPEG is decoded, when the thumbnail comes near the viewport (see load_pixmap)
+        # only the header is read, from memory if the JPEG is still there (a JPEG dropped by a MemoryThumbCache is not read again here: square placeholder)
+        data = cache.peek(self._full_path_tmp)
+        if cache.in_memory and data is None:
+            self._placeholder = placeholder_pixmap(PIXMAP_SCALE)
+        else:
+            self._placeholder = placeholder_pixmap(thumb_size(self._full_path_tmp, self.exif.exif_orientation, data=data))
+        self.set_pixmap(self._placeholder)
 
         # create the show/hide button (afficher/masquer)
         self.btn = QPushButton('')
+        self.btn.setObjectName('mask')
         self.update_hide_button(False)
         self.btn.setCheckable(True)
         self.btn.setFixedSize(MASK_BUTTON_H_SIZE, BUTTON_V_SIZE)
@@ -480,9 +1863,9 @@ class Thumbnails(QWidget):
 
         # creates a checkbox to select thumbnails
         self.select = QPushButton()# QCheckBox()
+        self.select.setObjectName('select')
         self.select.setFixedSize(BUTTON_V_SIZE, BUTTON_V_SIZE)
         self.select.clicked.connect(self._selection)
-        self.select.setStyleSheet(f'background-color: {self.bg_color}')
         self.select.setIconSize(QSize(ICON_H_SIZE, ICON_V_SIZE))
         self.set_selection(False)
 
@@ -519,20 +1902,57 @@ class Thumbnails(QWidget):
 #--------------------------------------------------------------------------------
     def set_selection(self, flag: bool):
         self.is_selected = flag
-        if flag:
-            self.select.setIcon(QIcon('./icons/_active__yes.png'))
-        else:
-            self.select.setIcon(QIcon(''))
+        self.select.setIcon(shared_icon('./icons/_active__yes.png' if flag else ''))
 #--------------------------------------------------------------------------------
     def get_selection(self):
         return self.is_selected
 #--------------------------------------------------------------------------------
-    def blur_pixmap(self):
-        if not Path(self._full_path_tmp_blurred).exists():
-            img = Image.open(self._full_path_tmp)
-            img = img.filter(ImageFilter.GaussianBlur(80))
-            img.save(self._full_path_tmp_blurred)
-        self.set_pixmap(self._full_path_tmp_blurred)
+    def is_hidden(self):
+        return self.btn.isChecked()
+#--------------------------------------------------------------------------------
+    def set_hidden(self, flag: bool):
+        self.btn.setChecked(flag)
+        self.hide()
+#--------------------------------------------------------------------------------
+    def load_pixmap(self):
+        """
+        load_pixmap displays the pixmap of the thumbnail (blurred if it is hidden) from the PixmapCache
+        The missing pixmaps are requested from the ThumbLoader (see set_clear_image and set_blurred_image), the clear one (or the placeholder) is displayed until the blurred one is ready
+        """
+        if self.btn.isChecked():
+            blurred = self.pixmaps.get(self._full_path_tmp + BLURRED, self)
+            if blurred is not None:
+                self.set_pixmap(blurred, self._full_path_tmp + BLURRED)
+                return
+        clear = self.pixmaps.get(self._full_path_tmp, self)
+        if clear is None:
+            self.set_pixmap(self._placeholder)
+            self.loader.request_decode(self, self._full_path_tmp, self.exif.exif_orientation, cancellable=True)
+            return
+        self.set_pixmap(clear, self._full_path_tmp)
+        if self.btn.isChecked():
+            self.request_blur(clear)
+#--------------------------------------------------------------------------------
+    def request_blur(self, clear: QPixmap, background: bool = False):
+        image = clear.toImage()
+        self.loader.request_blur(self, image, self._full_path_tmp, background)
+#--------------------------------------------------------------------------------
+    def set_clear_image(self, image: QImage):
+        clear = QPixmap.fromImage(image)
+        self.pixmaps.put(self._full_path_tmp, clear, self)
+        self.load_pixmap()
+        if BLUR_PRECOMPUTE and not self.btn.isChecked():
+            self.request_blur(clear, background=True)
+#--------------------------------------------------------------------------------
+    def set_blurred_image(self, image: QImage):
+        self.pixmaps.put(self._full_path_tmp + BLURRED, QPixmap.fromImage(image), self)
+        if self.btn.isChecked():
+            self.load_pixmap()
+#--------------------------------------------------------------------------------
+    def pixmap_evicted(self, key: str):
+        # the PixmapCache no longer holds the pixmap displayed: it is released, and decoded again when the thumbnail comes back into view
+        if key == self._shown:
+            self.set_pixmap(self._placeholder)
 #--------------------------------------------------------------------------------
     def get_bg_color(self):
         return self.bg_color
@@ -544,24 +1964,30 @@ class Thumbnails(QWidget):
         Args:
             color (str): color of the background
         """
-        self.setStyleSheet(f'background-color: {color}')
+        if color != self.bg_color:
+            self.setPalette(background_palette(color))
         self.bg_color = color
 #--------------------------------------------------------------------------------
-    def set_pixmap(self, pixmap_path: str):
-        self._pixmap = QPixmap(pixmap_path)
-        if self.exif.orientation == 'portrait':
-            transform = QTransform().rotate(270)
-            self._pixmap = self._pixmap.transformed(transform)
-        self._pixmap = self._pixmap.scaled(PIXMAP_SCALE, Qt.AspectRatioMode.KeepAspectRatio)
+    def set_pixmap(self, pixmap: QPixmap, key: str = None):
+        # key: key of the pixmap in the PixmapCache, None for the placeholder
+        self._shown = key
+        self._pixmap = pixmap
         self._label.setPixmap(self._pixmap)
 #--------------------------------------------------------------------------------
     def update_hide_button(self, blur: bool):
-        if blur:
-            self.btn.setStyleSheet('background-color: #e66')
-            self.btn.setText('Afficher')
-        else:
-            self.btn.setStyleSheet('background-color: #6e6')
-            self.btn.setText('Masquer')
+        # the color depends on the masked property (see style.qss): the style is applied again, without parsing a style sheet
+        if self.btn.property('masked') == blur:
+            return
+        self.btn.setProperty('masked', blur)
+        self.btn.setText('Afficher' if blur else 'Masquer')
+        self.btn.style().unpolish(self.btn)
+        self.btn.style().polish(self.btn)
+#--------------------------------------------------------------------------------
+    def mouseReleaseEvent(self, event):
+        # a click on the JPEG enlarges it (see PreviewViewer)
+        if event.button() == Qt.MouseButton.LeftButton and self._label.underMouse():
+            self.enlarged.emit(self.rank)
+        super().mouseReleaseEvent(event)
 #--------------------------------------------------------------------------------
     @Slot(result=bool)
     def _selection(self, e: int):
@@ -571,12 +1997,161 @@ class Thumbnails(QWidget):
         self.colored.emit(self.rank)
     @Slot(result=str)
     def hide(self):
-        if self.btn.isChecked():
-            self.blur_pixmap()
-            self.update_hide_button(True)
+        # a thumbnail never displayed (or evicted) is loaded when it comes near the viewport
+        if self._shown is not None:
+            self.load_pixmap()
+        self.update_hide_button(self.btn.isChecked())
+#################################################################################
+class PreviewJob(QRunnable):
+    def __init__(self, viewer, path: str, exif_orientation: int, max_size: int):
+        super().__init__()
+        self.viewer = viewer
+        self.path = path
+        self.exif_orientation = exif_orientation
+        self.max_size = max_size
+    def run(self):
+        # the job only emits: the state of the viewer belongs to the GUI thread
+        try:
+            image = load_preview_image(self.path, self.exif_orientation, self.max_size, self.viewer.cache.data(self.path))
+        except Exception:
+            tracer.count('decode failures')
+            image = QImage()
+        # queued to the GUI thread
+        self.viewer._loaded.emit(self.path, image)
+#################################################################################
+class PreviewViewer(QWidget):
+    """
+    PreviewViewer shows a photo of the gallery in a large window, from its full embedded JPEG (reduced to the size of the screen)
+    The PREVIEW_PREFETCH photos on each side of the displayed one are decoded in the background, and the last PREVIEW_CACHE_ITEMS decoded images are kept: going through a burst with the arrow keys does not wait for a decoding
+    Keys: ←/→ previous/next photo, Début/Fin first/last photo, Espace hide/show the photo (Masquer/Afficher of the thumbnail), Échap close
+    """
+    _loaded = Signal(str, QImage)
+
+    def __init__(self, cache: ThumbCache, parent=None, threads: int = 2):
+        # a window of its own, closed with the main window
+        super().__init__(parent)
+        self.setWindowFlag(Qt.WindowType.Window)
+        # colors in style.qss: a QWidget paints the background of its rule only with WA_StyledBackground
+        self.setObjectName('preview')
+        self.setAttribute(Qt.WidgetAttribute.WA_StyledBackground, True)
+        self.resize(HI_RES)
+        self.cache = cache
+        self.items = list()
+        self.rank = 0
+        self._pool = QThreadPool()
+        self._pool.setMaxThreadCount(threads)
+        # path -> QPixmap, in LRU order
+        self._pixmaps = OrderedDict()
+        # path -> PreviewJob, from the start of the job (GUI thread) to its image (image_loaded)
+        self._running = dict()
+        self._loaded.connect(self.image_loaded)
+        self.label = QLabel()
+        self.label.setObjectName('preview_image')
+        self.label.setAlignment(Qt.AlignmentFlag.AlignCenter)
+        self.label.setMinimumSize(1, 1)
+        layout = QVBoxLayout()
+        layout.setContentsMargins(0, 0, 0, 0)
+        layout.addWidget(self.label)
+        self.setLayout(layout)
+#--------------------------------------------------------------------------------
+    def open(self, items: list, rank: int):
+        """
+        open shows the photo of rank
+
+        Args:
+            items: list
+                the Thumbnails (or ThumbItem) of the gallery, by rank
+            rank: int
+                rank of the photo displayed (from 1)
+        """
+        self.items = items
+        self.show()
+        self.raise_()
+        self.activateWindow()
+        self.show_rank(rank)
+#--------------------------------------------------------------------------------
+    def show_rank(self, rank: int):
+        if not self.items:
+            return
+        self.rank = min(max(rank, 1), len(self.items))
+        item = self.items[self.rank - 1]
+        self.update_title()
+        pixmap = self._pixmaps.get(self.cache.path(item.exif))
+        if pixmap is None:
+            self.label.setText('…')
+        else:
+            self._pixmaps.move_to_end(self.cache.path(item.exif))
+            self.display(pixmap)
+        self.prefetch()
+#--------------------------------------------------------------------------------
+    def update_title(self):
+        item = self.items[self.rank - 1]
+        hidden = ' — masquée' if item.is_hidden() else ''
+        self.setWindowTitle(f'{item.get_thumbnail_title()} ({self.rank}/{len(self.items)}){hidden}')
+#--------------------------------------------------------------------------------
+    def prefetch(self):
+        """
+        prefetch requests the decoding of the displayed photo, then of its neighbours, nearest first
+        The requests not started yet for photos no longer near the displayed one are dropped
+        """
+        # the jobs still waiting are taken back from the pool, the running ones end normally
+        for path, job in list(self._running.items()):
+            if self._pool.tryTake(job):
+                del self._running[path]
+        ranks = [self.rank]
+        for distance in range(1, PREVIEW_PREFETCH + 1):
+            ranks += [self.rank + distance, self.rank - distance]
+        screen = self.screen()
+        size = screen.size() * screen.devicePixelRatio()
+        max_size = max(size.width(), size.height())
+        for priority, rank in enumerate(ranks):
+            if not 1 <= rank <= len(self.items):
+                continue
+            exif = self.items[rank - 1].exif
+            path = self.cache.path(exif)
+            if path in self._pixmaps or path in self._running:
+                continue
+            job = PreviewJob(self, path, exif.exif_orientation, max_size)
+            # kept by _running, not deleted by the pool: tryTake may still be called on it
+            job.setAutoDelete(False)
+            self._running[path] = job
+            self._pool.start(job, -priority)
+#--------------------------------------------------------------------------------
+    def image_loaded(self, path: str, image: QImage):
+        self._running.pop(path, None)
+        self._pixmaps[path] = QPixmap.fromImage(image)
+        while len(self._pixmaps) > PREVIEW_CACHE_ITEMS:
+            self._pixmaps.popitem(last=False)
+        if self.items and self.cache.path(self.items[self.rank - 1].exif) == path:
+            self.display(self._pixmaps[path])
+#--------------------------------------------------------------------------------
+    def display(self, pixmap: QPixmap):
+        self._pixmap = pixmap
+        self.label.setPixmap(pixmap.scaled(self.label.size(), Qt.AspectRatioMode.KeepAspectRatio, Qt.TransformationMode.SmoothTransformation))
+#--------------------------------------------------------------------------------
+    def resizeEvent(self, event):
+        super().resizeEvent(event)
+        if self.label.pixmap() is not None and not self.label.pixmap().isNull():
+            self.display(self._pixmap)
+#--------------------------------------------------------------------------------
+    def keyPressEvent(self, event):
+        key = event.key()
+        if key == Qt.Key.Key_Right:
+            self.show_rank(self.rank + 1)
+        elif key == Qt.Key.Key_Left:
+            self.show_rank(self.rank - 1)
+        elif key == Qt.Key.Key_Home:
+            self.show_rank(1)
+        elif key == Qt.Key.Key_End:
+            self.show_rank(len(self.items))
+        elif key == Qt.Key.Key_Space and self.items:
+            item = self.items[self.rank - 1]
+            item.set_hidden(not item.is_hidden())
+            self.update_title()
+        elif key == Qt.Key.Key_Escape:
+            self.close()
         else:
-            self.set_pixmap(self._full_path_tmp)
-            self.update_hide_button(False)
+            super().keyPressEvent(event)
 #################################################################################
 class KeyPressFilter(QObject):
     def eventFilter(self, widget, event):
@@ -0,0 +1,235 @@
+"""
+Benchmarks of the stages of an import, on synthetic cards (see synthetic_nef.py) of several sizes
+Each stage is timed on its own: scan, metadata, extraction, decode, blur, gallery, bursts, slicing, naming, copy
+The results are written to a JSON file, a previous result file can be given to compare the runs
+
+Usage:
+    python benchmark.py [--sizes 10 100 1000 10000] [--stages scan metadata ...] [--output benchmark.json] [--compare previous.json]
+"""
+import os
+import io
+import sys
+import json
+import time
+import shutil
+import argparse
+import platform
+import datetime
+import tempfile
+import contextlib
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+from synthetic_nef import make_card, PREVIEW_SIZE, RAW_BYTES
+from photo_exif import read_exif_batch
+from card_scan import scan_raw_files, chronological
+from extraction import extract_preview
+from thumb_cache import ThumbCache
+from naming import assign_suffixes, plan_copies, plan_names, PhotoTable, EPOCH
+from transfer import execute_plan, WORKERS_PER_DEVICE
+from tracing import tracer
+
+SIZES = (10, 100, 1000, 10000)
+STAGES = ('scan', 'metadata', 'extraction', 'decode', 'blur', 'gallery', 'bursts', 'slicing', 'naming', 'copy')
+# the stages that need PySide6 (and a QApplication)
+QT_STAGES = ('decode', 'blur', 'gallery')
+# the blur is timed on this number of images at most (the per file time is what matters)
+BLUR_SAMPLE = 50
+# gap used by the slicing stage
+SLICING_GAP = datetime.timedelta(minutes=30)
+
+
+#################################################################################
+class Timer():
+    """
+    Timer times a stage: with Timer() as timer: ..., then timer.seconds
+    """
+    def __enter__(self):
+        self._start = time.perf_counter()
+        return self
+    def __exit__(self, *exc):
+        self.seconds = time.perf_counter() - self._start
+        return False
+#--------------------------------------------------------------------------------
+def _result(seconds: float, files: int, **fields) -> dict:
+    result = dict(seconds=round(seconds, 6), files=files, per_file_ms=round(1000 * seconds / files, 4) if files else None)
+    result.update(fields)
+    return result
+#--------------------------------------------------------------------------------
+def _qt():
+    # imported only for the Qt stages, offscreen: the benchmarks run without a display
+    os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+    from PySide6.QtWidgets import QApplication
+    import RenameCls
+    app = QApplication.instance() or QApplication([])
+    return app, RenameCls
+#--------------------------------------------------------------------------------
+def run_size(card: str, work: str, size: int, stages: tuple, workers: int, args) -> dict:
+    """
+    Summary
+        run_size: runs the stages on a card of size files
+
+    Args:
+        card: str
+            directory of the synthetic card (created or reused)
+        work: str
+            scratch directory (cache, copies), emptied afterwards
+        size: int
+            number of files
+        stages: tuple[str]
+            stages to run (the stages they depend on run untimed if needed)
+        workers: int
+            worker processes of the metadata and extraction stages
+
+    Returns:
+        dict: stage -> result (seconds, files, per_file_ms…) or {'skipped': reason}
+    """
+    results = dict()
+    make_card(card, size, preview_size=args.preview_size, raw_bytes=args.raw_bytes)
+
+    with Timer() as timer:
+        files = scan_raw_files(card)
+    if 'scan' in stages:
+        results['scan'] = _result(timer.seconds, size)
+
+    with Timer() as timer:
+        photos = read_exif_batch(files, workers)
+    if 'metadata' in stages:
+        results['metadata'] = _result(timer.seconds, size)
+    photos = chronological(photos)
+
+    cache = ThumbCache(os.path.join(work, 'cache'), 1 << 62)
+    thumbs = [cache.path(exif) for exif in photos]
+    needs_jpeg = any(stage in stages for stage in ('extraction', 'bursts') + QT_STAGES)
+    if needs_jpeg:
+        with Timer() as timer:
+            with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn')) as pool:
+                list(pool.map(extract_preview, [exif.file for exif in photos], thumbs, chunksize=max(1, size // (4 * workers))))
+        if 'extraction' in stages:
+            results['extraction'] = _result(timer.seconds, size, bytes=sum(os.path.getsize(thumb) for thumb in thumbs))
+
+    qt_stages = [stage for stage in QT_STAGES if stage in stages]
+    if qt_stages:
+        try:
+            app, gui = _qt()
+        except ImportError as e:
+            gui = None
+            for stage in qt_stages:
+                results[stage] = dict(skipped=str(e))
+    if qt_stages and gui is not None:
+        images = list()
+        with Timer() as timer:
+            for exif, thumb in zip(photos, thumbs):
+                images.append(gui.load_thumb_image(thumb, exif.exif_orientation))
+        if 'decode' in stages:
+            results['decode'] = _result(timer.seconds, size)
+        if 'blur' in stages:
+            sample = min(size, BLUR_SAMPLE)
+            with Timer() as timer:
+                for image, thumb in zip(images[:sample], thumbs):
+                    gui.blur_image(image, gui.blur_radius(thumb, image))
+            results['blur'] = _result(timer.seconds, sample)
+        del images
+        if 'gallery' in stages:
+            controls = gui.Controls()
+            # the Gallery prints every thumbnail added
+            with Timer() as timer, contextlib.redirect_stdout(io.StringIO()):
+                gallery_class = gui.VirtualGallery if size >= gui.VIRTUAL_GALLERY_MIN else gui.Gallery
+                gallery = gallery_class(controls, cache)
+                for exif in photos:
+                    gallery.append_thumbnail(exif)
+                app.processEvents()
+            results['gallery'] = _result(timer.seconds, size, widget=gallery_class.__name__)
+            gallery.deleteLater()
+            controls.deleteLater()
+            app.processEvents()
+
+    if 'bursts' in stages:
+        try:
+            from bursts import detect_bursts
+        except ImportError as e:
+            results['bursts'] = dict(skipped=str(e))
+        else:
+            times = [(exif.date_time - EPOCH).total_seconds() for exif in photos]
+            with Timer() as timer:
+                bursts = detect_bursts(thumbs, times, workers=workers)
+            results['bursts'] = _result(timer.seconds, size, groups=len(bursts.groups), hidden=len(bursts.hide))
+
+    if 'slicing' in stages:
+        with Timer() as timer:
+            assign_suffixes(photos, SLICING_GAP)
+        results['slicing'] = _result(timer.seconds, size, groups=len({exif.compressed_date for exif in photos}))
+
+    if 'naming' in stages:
+        assign_suffixes(photos, SLICING_GAP)
+        with Timer() as timer:
+            names = plan_names(PhotoTable.from_photos(photos), 'benchmark')
+        results['naming'] = _result(timer.seconds, size, directories=len(set(names.directories)), conflicts=len(names.conflicts))
+
+    if 'copy' in stages:
+        assign_suffixes(photos, SLICING_GAP)
+        destination = os.path.join(work, 'copies')
+        with Timer() as timer:
+            plan = plan_copies(photos, 'benchmark', destination)
+            stats = execute_plan(plan, args.copies_per_device, verify=args.verify)
+        results['copy'] = _result(timer.seconds, size, bytes=stats.bytes, errors=len(stats.errors), verify=args.verify)
+
+    shutil.rmtree(work, ignore_errors=True)
+    return results
+#--------------------------------------------------------------------------------
+def compare(current: dict, previous: dict):
+    """
+    compare prints the ratio of the stage times of two runs, by size (> 1: slower than the previous run)
+    """
+    print(f'Comparaison avec {previous.get("date", "?")}')
+    for size, stages in current['results'].items():
+        for stage, result in stages.items():
+            old = previous.get('results', dict()).get(size, dict()).get(stage, dict())
+            if 'seconds' not in result or not old.get('seconds'):
+                continue
+            ratio = result['seconds'] / old['seconds']
+            print(f'{size:>6} fichiers  {stage:<11} {old["seconds"]:10.3f} s -> {result["seconds"]:10.3f} s  x{ratio:.2f}')
+#--------------------------------------------------------------------------------
+def parse_args(argv: list):
+    parser = argparse.ArgumentParser(description='Mesure des performances sur des cartes synthétiques')
+    parser.add_argument('--sizes', type=int, nargs='+', default=list(SIZES), help='nombres de fichiers des cartes')
+    parser.add_argument('--stages', nargs='+', choices=STAGES, default=list(STAGES), help='étapes mesurées')
+    parser.add_argument('--cards', default=os.path.join(tempfile.gettempdir(), 'renommage_benchmark'), help='répertoire des cartes synthétiques (réutilisées d\'une exécution à l\'autre)')
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1, help='processus de lecture et d\'extraction')
+    parser.add_argument('--copies-per-device', type=int, default=WORKERS_PER_DEVICE, help='copies simultanées par périphérique')
+    parser.add_argument('--verify', action='store_true', help='relire et vérifier chaque copie')
+    parser.add_argument('--preview-size', type=int, nargs=2, default=list(PREVIEW_SIZE), help='largeur et hauteur des JPEG')
+    parser.add_argument('--raw-bytes', type=int, default=RAW_BYTES, help='taille des données RAW de chaque fichier')
+    parser.add_argument('--output', default='benchmark.json', help='fichier JSON des résultats')
+    parser.add_argument('--compare', help='fichier JSON d\'une exécution précédente')
+    parser.add_argument('--trace', help='enregistrer aussi la durée de chaque fichier dans TRACE (format Chrome trace)')
+    return parser.parse_args(argv)
+#--------------------------------------------------------------------------------
+def main(argv: list = None) -> int:
+    args = parse_args(argv)
+    args.preview_size = tuple(args.preview_size)
+    tracer.enabled = bool(args.trace)
+    report = dict(date=datetime.datetime.now().isoformat(timespec='seconds'), python=platform.python_version(),
+                  platform=platform.platform(), cpus=os.cpu_count(), workers=args.workers, preview_size=list(args.preview_size),
+                  raw_bytes=args.raw_bytes, results=dict())
+    for size in args.sizes:
+        card = os.path.join(args.cards, f'card_{size}')
+        work = tempfile.mkdtemp(prefix='work_', dir=args.cards if os.path.isdir(args.cards) else None)
+        results = run_size(card, work, size, tuple(args.stages), args.workers, args)
+        report['results'][str(size)] = results
+        for stage, result in results.items():
+            if 'skipped' in result:
+                print(f'{size:>6} fichiers  {stage:<11} ignoré ({result["skipped"]})')
+            else:
+                print(f'{size:>6} fichiers  {stage:<11} {result["seconds"]:10.3f} s  {result["per_file_ms"]:8.3f} ms/fichier')
+    with open(args.output, 'w', encoding='utf-8') as file:
+        json.dump(report, file, indent=2, ensure_ascii=False)
+    if args.trace:
+        tracer.export(args.trace)
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as file:
+            compare(report, json.load(file))
+    return 0
+#################################################################################
+if __name__ == '__main__':
+    sys.exit(main())
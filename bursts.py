@@ -0,0 +1,217 @@
+import io
+import os
+import multiprocessing
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from tracing import tracer, timed
+from extraction import read_preview
+
+# side of the grayscale image the features are computed on (the JPEG decoder reduces the image while decoding it)
+FEATURE_SIZE = 128
+# difference hash: 9x8 pixels, each compared with its right neighbour -> 64 bits
+HASH_WIDTH = 9
+HASH_HEIGHT = 8
+# the 64 bits are split in BANDS bands: two hashes less than BANDS bits apart have at least one identical band
+BANDS = 8
+BAND_BITS = 64 // BANDS
+# near duplicates: hashes at most MAX_DISTANCE bits apart (less than BANDS), shot at most BURST_WINDOW seconds apart
+MAX_DISTANCE = 6
+BURST_WINDOW = 2.0
+# photos of the same band compared with each other: the MAX_NEIGHBOURS next ones in time
+MAX_NEIGHBOURS = 8
+# below this number of files, the features are computed in the calling process
+BATCH_MIN_FILES = 16
+
+# result of detect_bursts: groups (list of lists of indexes, in time order), keep (the sharpest photo of each group), hide (the other photos of the groups)
+Bursts = namedtuple('Bursts', ('groups', 'keep', 'hide'))
+
+
+#################################################################################
+def image_features(path) -> tuple:
+    """
+    Summary
+        image_features: reads a JPEG and returns what the burst detection needs (run in the worker processes)
+        The JPEG is decoded in gray levels and reduced by the decoder itself (draft mode) to about FEATURE_SIZE pixels
+
+    Args:
+        path: str or file object
+            path to the JPEG (preview extracted from a RAW file), or the JPEG itself (see raw_features)
+
+    Returns:
+        tuple: (bytes: the HASH_HEIGHT x HASH_WIDTH gray levels of the hash, float: sharpness), None if the JPEG cannot be read
+    """
+    # imported in the worker processes only
+    from PIL import Image
+    try:
+        with Image.open(path) as image:
+            image.draft('L', (FEATURE_SIZE, FEATURE_SIZE))
+            gray = image.convert('L')
+    except OSError:
+        return None
+    gray.thumbnail((FEATURE_SIZE, FEATURE_SIZE))
+    pixels = np.asarray(gray, dtype=np.float32)
+    # variance of the laplacian: the sharpest photo of a burst has the most contrasted edges
+    laplacian = 4*pixels[1:-1, 1:-1] - pixels[:-2, 1:-1] - pixels[2:, 1:-1] - pixels[1:-1, :-2] - pixels[1:-1, 2:]
+    small = gray.resize((HASH_WIDTH, HASH_HEIGHT), Image.Resampling.BOX)
+    return small.tobytes(), float(laplacian.var())
+#--------------------------------------------------------------------------------
+def raw_features(raw_file: str) -> tuple:
+    """
+    raw_features returns the features of the JPEG embedded in a RAW file, read in memory (MemoryThumbCache: no JPEG on disk), see image_features
+    """
+    try:
+        data = read_preview(raw_file)
+    except Exception:
+        # unreadable RAW file: no features, as for an unreadable JPEG
+        return None
+    return image_features(io.BytesIO(data))
+#--------------------------------------------------------------------------------
+def read_features(paths: list, workers: int = None, executor=None, raw: bool = False) -> tuple:
+    """
+    Summary
+        read_features: computes the features of a whole list of JPEG in parallel, see image_features
+
+    Args:
+        paths: list[str]
+        workers: int
+            number of worker processes (default: number of CPUs), ignored if executor is given
+        executor: concurrent.futures.Executor
+            existing pool to use
+        raw: bool
+            paths are RAW files, see raw_features
+
+    Returns:
+        tuple: (numpy array (n, HASH_HEIGHT, HASH_WIDTH) of uint8, numpy array (n,) of the sharpness, numpy array (n,) of bool: the JPEG could be read)
+    """
+    paths = list(paths)
+    function = raw_features if raw else image_features
+    if executor is None and len(paths) < BATCH_MIN_FILES:
+        features = list()
+        for path in paths:
+            with tracer.span('features', file=path):
+                features.append(function(path))
+    else:
+        workers = workers or os.cpu_count() or 1
+        chunksize = max(1, len(paths) // (4 * workers))
+        if executor is None:
+            with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn')) as pool:
+                features = _map_features(pool, function, paths, chunksize)
+        else:
+            features = _map_features(executor, function, paths, chunksize)
+    valid = np.array([feature is not None for feature in features], dtype=bool)
+    empty = bytes(HASH_WIDTH * HASH_HEIGHT)
+    small = np.frombuffer(b''.join(feature[0] if feature else empty for feature in features), dtype=np.uint8)
+    sharpness = np.array([feature[1] if feature else 0.0 for feature in features], dtype=np.float64)
+    return small.reshape(len(paths), HASH_HEIGHT, HASH_WIDTH), sharpness, valid
+#--------------------------------------------------------------------------------
+def _map_features(executor, function, paths: list, chunksize: int) -> list:
+    if not tracer.enabled:
+        return list(executor.map(function, paths, chunksize=chunksize))
+    results = executor.map(timed, [function] * len(paths), paths, chunksize=chunksize)
+    return [tracer.unwrap('features', result, file=path) for path, result in zip(paths, results)]
+#--------------------------------------------------------------------------------
+def dhash(small: np.ndarray) -> np.ndarray:
+    """
+    dhash returns the difference hashes of a stack of gray images (n, HASH_HEIGHT, HASH_WIDTH), as a numpy array (n,) of uint64
+    """
+    bits = small[:, :, 1:] > small[:, :, :-1]
+    packed = np.packbits(bits.reshape(len(small), -1), axis=1)
+    return packed.view('>u8').ravel().astype(np.uint64)
+#--------------------------------------------------------------------------------
+def hamming(a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    """
+    hamming returns the number of different bits of two arrays of uint64, element by element
+    """
+    different = np.ascontiguousarray(a ^ b).view(np.uint8).reshape(-1, 8)
+    return np.unpackbits(different, axis=1).sum(axis=1)
+#--------------------------------------------------------------------------------
+def near_duplicate_pairs(hashes: np.ndarray, times: np.ndarray, max_distance: int = MAX_DISTANCE, window: float = BURST_WINDOW) -> tuple:
+    """
+    Summary
+        near_duplicate_pairs: finds the pairs of near duplicate photos without comparing every pair
+        Index: for each band of the hashes, the photos are sorted by band value then by time, and each photo is compared only with its MAX_NEIGHBOURS next ones having the same band value and shot less than window seconds later
+        Two hashes less than BANDS bits apart share a band: no pair within max_distance (< BANDS) is missed, unless more than MAX_NEIGHBOURS photos with that band are shot within the window
+
+    Args:
+        hashes: numpy array (n,) of uint64
+        times: numpy array (n,) of the shooting times in seconds
+
+    Returns:
+        tuple: (numpy array i, numpy array j) of the indexes of the pairs, i < j
+    """
+    found_i = list()
+    found_j = list()
+    mask = np.uint64((1 << BAND_BITS) - 1)
+    for band in range(BANDS):
+        keys = (hashes >> np.uint64(band * BAND_BITS)) & mask
+        order = np.lexsort((times, keys))
+        sorted_keys = keys[order]
+        sorted_times = times[order]
+        for offset in range(1, min(MAX_NEIGHBOURS, len(order) - 1) + 1):
+            candidates = (sorted_keys[offset:] == sorted_keys[:-offset]) & (sorted_times[offset:] - sorted_times[:-offset] <= window)
+            found_i.append(order[:-offset][candidates])
+            found_j.append(order[offset:][candidates])
+    if not found_i:
+        return np.empty(0, dtype=np.intp), np.empty(0, dtype=np.intp)
+    i = np.concatenate(found_i)
+    j = np.concatenate(found_j)
+    near = hamming(hashes[i], hashes[j]) <= max_distance
+    pairs = np.unique(np.stack((np.minimum(i, j)[near], np.maximum(i, j)[near]), axis=1), axis=0)
+    return pairs[:, 0], pairs[:, 1]
+#--------------------------------------------------------------------------------
+def group_pairs(count: int, i: np.ndarray, j: np.ndarray) -> list:
+    """
+    group_pairs returns the groups of indexes linked by the pairs (i, j) (connected components, union-find), the groups of one index are left out
+    """
+    parent = list(range(count))
+
+    def root(k):
+        while parent[k] != k:
+            parent[k] = parent[parent[k]]
+            k = parent[k]
+        return k
+
+    for a, b in zip(i.tolist(), j.tolist()):
+        ra, rb = root(a), root(b)
+        if ra != rb:
+            parent[max(ra, rb)] = min(ra, rb)
+    groups = dict()
+    for k in sorted(set(i.tolist()) | set(j.tolist())):
+        groups.setdefault(root(k), list()).append(k)
+    return [group for group in groups.values() if len(group) > 1]
+#--------------------------------------------------------------------------------
+def detect_bursts(paths: list, times: list, max_distance: int = MAX_DISTANCE, window: float = BURST_WINDOW, workers: int = None, executor=None, raw: bool = False) -> Bursts:
+    """
+    Summary
+        detect_bursts: finds the bursts and near duplicates of a session and the photos to hide, all but the sharpest of each group
+        The features are read in parallel, the hashes, the index and the distances are computed on numpy arrays for the whole session at once
+
+    Args:
+        paths: list[str]
+            JPEG previews of the photos (ThumbCache)
+        times: list[float]
+            shooting times in seconds (naming.PhotoTable.times), same order as paths
+        max_distance: int
+            largest hash distance between near duplicates (less than BANDS)
+        window: float
+            largest time between two near duplicates, in seconds
+        raw: bool
+            paths are the RAW files, their JPEG are read in memory (see raw_features)
+
+    Returns:
+        Bursts: the indexes refer to paths
+    """
+    with tracer.span('bursts', files=len(paths)):
+        small, sharpness, valid = read_features(paths, workers, executor, raw)
+        hashes = dhash(small)
+        i, j = near_duplicate_pairs(hashes, np.asarray(times, dtype=np.float64), max_distance, window)
+        both = valid[i] & valid[j]
+        groups = group_pairs(len(paths), i[both], j[both])
+        keep = [group[int(np.argmax(sharpness[group]))] for group in groups]
+        kept = set(keep)
+        hide = sorted(k for group in groups for k in group if k not in kept)
+    return Bursts(groups, keep, hide)
+#################################################################################
@@ -0,0 +1,110 @@
+import os
+import re
+
+RAW_SUFFIXES = ('.nef',)
+# Nikon file numbers go from 0001 to 9999, then start again at 0001 (in a new folder)
+MAX_FILE_NUMBER = 9999
+# DCF folder: 3 digits (100 to 999) followed by 5 characters (1xxNIKON)
+FOLDER_NUMBER = re.compile(r'^(\d{3})')
+FILE_NUMBER = re.compile(r'(\d+)$')
+
+
+#################################################################################
+def file_number(path: str) -> int:
+    """
+    file_number returns the number at the end of the name of a file (_DSC1234.NEF, DSC_1234.NEF -> 1234), -1 if none
+    """
+    match = FILE_NUMBER.search(os.path.splitext(os.path.basename(path))[0])
+    return int(match.group(1)) if match else -1
+#--------------------------------------------------------------------------------
+def folder_number(path: str) -> int:
+    """
+    folder_number returns the number of the DCF folder of a file (.../DCIM/101NIKON/_DSC1234.NEF -> 101), -1 if none
+    """
+    match = FOLDER_NUMBER.match(os.path.basename(os.path.dirname(path)))
+    return int(match.group(1)) if match else -1
+#--------------------------------------------------------------------------------
+def unwrap_numbers(numbers: list) -> list:
+    """
+    unwrap_numbers undoes the rollover of the file numbers of a series: if the series holds both numbers close to MAX_FILE_NUMBER and small numbers, the small ones come after the rollover and MAX_FILE_NUMBER is added to them
+    """
+    valid = [n for n in numbers if n >= 0]
+    if not valid or max(valid) - min(valid) <= MAX_FILE_NUMBER // 2:
+        return list(numbers)
+    return [n + MAX_FILE_NUMBER if 0 <= n < MAX_FILE_NUMBER // 2 else n for n in numbers]
+#--------------------------------------------------------------------------------
+def iter_raw_files(source: str, suffixes: tuple = RAW_SUFFIXES):
+    """
+    Summary
+        iter_raw_files: yields the RAW files of a memory card as soon as they are found, in the order of the camera
+        The files of a folder are listed with one os.scandir and yielded at once, ordered by file number (rollover included); then the sub folders follow, the DCF folders (100NIKON, 101NIKON…) by number
+        Only the DCIM directory is scanned if source contains one, the unreadable directories are skipped
+
+    Args:
+        source: str
+            root of the memory card (or any directory)
+        suffixes: tuple[str]
+            extensions of the RAW files, lower case
+
+    Yields:
+        str: path of a RAW file
+    """
+    dcim = os.path.join(source, 'DCIM')
+    yield from _scan_directory(dcim if os.path.isdir(dcim) else source, suffixes)
+#--------------------------------------------------------------------------------
+def _scan_directory(directory: str, suffixes: tuple):
+    try:
+        with os.scandir(directory) as it:
+            entries = list(it)
+    except OSError:
+        return
+    files = list()
+    folders = list()
+    for entry in entries:
+        if entry.name.startswith('.'):
+            continue
+        try:
+            if entry.is_dir():
+                folders.append(entry)
+            elif os.path.splitext(entry.name)[1].lower() in suffixes and entry.is_file():
+                files.append(entry.path)
+        except OSError:
+            continue
+    numbers = unwrap_numbers([file_number(path) for path in files])
+    for _, path in sorted(zip(numbers, files)):
+        yield path
+    # the DCF folders first, in the order of their numbers
+    for entry in sorted(folders, key=lambda entry: (FOLDER_NUMBER.match(entry.name) is None, entry.name)):
+        yield from _scan_directory(entry.path, suffixes)
+#--------------------------------------------------------------------------------
+def scan_raw_files(source: str, suffixes: tuple = RAW_SUFFIXES) -> list:
+    """
+    scan_raw_files returns all the RAW files of a memory card, see iter_raw_files
+    """
+    return list(iter_raw_files(source, suffixes))
+#--------------------------------------------------------------------------------
+def chronological(photos: list) -> list:
+    """
+    Summary
+        chronological: returns the photos sorted by shooting time (DateTimeOriginal, with the sub seconds)
+        The photos taken at the same time (bursts, cameras without sub seconds) are ordered by folder and file number, after a rollover 0001 follows 9999
+
+    Args:
+        photos: list[PhotoExif]
+
+    Returns:
+        list[PhotoExif]
+    """
+    same_time = dict()
+    for exif in photos:
+        same_time.setdefault(exif.date_time, list()).append(exif.nikon_file_number)
+    wrapped = {date_time for date_time, numbers in same_time.items() if len(numbers) > 1 and unwrap_numbers(numbers) != numbers}
+
+    def key(exif):
+        number = exif.nikon_file_number
+        if exif.date_time in wrapped and 0 <= number < MAX_FILE_NUMBER // 2:
+            number += MAX_FILE_NUMBER
+        return exif.date_time, folder_number(exif.file), number
+
+    return sorted(photos, key=key)
+#################################################################################
@@ -1,7 +1,32 @@
+import os
+
 from PySide6.QtCore import QSize
 
+# JPEG of the former versions (now in the ThumbCache), removed on exit
 TMP_DIR = './tmp/'
-BLURRED = '_blurred'
+# memory card (or copy of a card) read when no directory is given on the command line
+CARD_SOURCE = './pictures/'
+# destination library when none is given on the command line: the photos of the card already in it are skipped (see LibraryIndex)
+LIBRARY_DIR = None
+# persistent cache of the extracted JPEG (see ThumbCache)
+CACHE_DIR = os.path.join(os.path.expanduser('~'), '.cache', 'renommage_photos')
+CACHE_MAX_BYTES = 2 * 1024**3
+# the JPEG are kept in memory instead (see MemoryThumbCache): nothing is written on disk, within THUMB_MEMORY_BYTES
+THUMB_CACHE_IN_MEMORY = False
+THUMB_MEMORY_BYTES = 512 * 1024**2
+# journals of the sorting of the memory cards (see SessionJournal)
+SESSION_DIR = os.path.join(CACHE_DIR, 'sessions')
+
+# prints the time to the first paint of the window and to the first thumbnail
+STARTUP_REPORT = True
+
+# per stage timing (see tracing.Tracer): a Performances panel next to the controls, the trace written to TRACE_FILE on exit (chrome://tracing)
+TRACE = False
+TRACE_FILE = './trace.json'
+TRACE_PANEL_INTERVAL = 500
+
+# number of processes extracting the JPEG embedded in the RAW files
+EXTRACT_WORKERS = os.cpu_count() or 1
 
 H_SIZE = 1000
 V_SIZE = 600
@@ -11,9 +36,39 @@ MASK_BUTTON_H_SIZE = 80
 ICON_V_SIZE = 18
 ICON_H_SIZE = 18
 
-HI_RES = QSize(400, 400)
+# preview window (see PreviewViewer): initial size, number of decoded images kept, photos decoded in advance on each side of the displayed one
+HI_RES = QSize(1200, 800)
+PREVIEW_CACHE_ITEMS = 12
+PREVIEW_PREFETCH = 2
 
 PIXMAP_MAX_SIZE = 300
 PIXMAP_SCALE = QSize(PIXMAP_MAX_SIZE, PIXMAP_MAX_SIZE)
 
+# hidden thumbnails: gaussian blur radius (in pixels of the full size JPEG), blur of all the thumbnails in the background
+BLURRED = '_blurred'
+BLUR_RADIUS = 80
+BLUR_PRECOMPUTE = False
+
+# threads decoding and blurring the thumbnails (see ThumbLoader), waiting rows of a VirtualGallery dropped beyond this distance (in items) from the viewport
+LOAD_THREADS = max(1, (os.cpu_count() or 2) // 2)
+LOAD_CANCEL_DISTANCE = 60
+# delay (in ms) after the last scroll step before the visible thumbnails are loaded first
+VIEWPORT_DELAY = 50
+
+# simultaneous copies reading from or writing to the same device
+COPY_WORKERS_PER_DEVICE = 2
+# read back and check every copy (default of the "Vérifier" checkbox)
+VERIFY_COPIES = False
+
+# automatic groups of a day (slider of the Controls): initial and largest interval between two groups, in minutes
+GROUP_GAP_MINUTES = 30
+GROUP_GAP_MAX = 240
+# delay (in ms) after the last key or wheel step on the slider before the groups are proposed again
+GROUP_DELAY = 300
+
+# from this number of photos, the gallery is a VirtualGallery (model/view)
+VIRTUAL_GALLERY_MIN = 500
+# memory budget (in bytes) of the decoded thumbnails, clear and blurred (see PixmapCache)
+PIXMAP_BUDGET = 256 * 1024 * 1024
+
 
@@ -0,0 +1,59 @@
+import os
+
+from nef_preview import read_jpeg_preview
+
+# RAW formats whose embedded JPEG can be read directly (TIFF based)
+FAST_PATH_SUFFIXES = ('.nef',)
+
+
+#################################################################################
+def read_preview(raw_file: str) -> bytes:
+    """
+    Summary
+        read_preview: returns the bytes of the JPEG embedded in a RAW file
+        Runs in a worker process of the ExtractionEngine (or in a thread of the MemoryThumbCache): it must stay free of any Qt import
+        For NEF files, only the bytes of the JPEG are read; rawpy is used for the other files or if the NEF cannot be parsed
+
+    Args:
+        raw_file: str
+            path to the RAW file
+
+    Returns:
+        bytes: the JPEG (a bytearray for the NEF files)
+    """
+    data = None
+    if os.path.splitext(raw_file)[1].lower() in FAST_PATH_SUFFIXES:
+        data = read_jpeg_preview(raw_file)
+    if data is None:
+        # imported only when needed: rawpy is slow to import and not used for the NEF files
+        import rawpy
+        with rawpy.imread(raw_file) as raw:
+            data = raw.extract_thumb().data
+    elif isinstance(data, memoryview):
+        # the whole buffer read by read_jpeg_preview, without a copy: unlike the view, it can be returned by a worker process
+        data = data.obj
+    return data
+#--------------------------------------------------------------------------------
+def extract_preview(raw_file: str, thumb_file: str) -> str:
+    """
+    Summary
+        extract_preview: writes the JPEG embedded in a RAW file to thumb_file (see read_preview)
+        Runs in a worker process of the ExtractionEngine: it must stay free of any Qt import
+
+    Args:
+        raw_file: str
+            path to the RAW file
+        thumb_file: str
+            path of the JPEG to be written
+
+    Returns:
+        str: thumb_file
+    """
+    data = read_preview(raw_file)
+    # written under a temporary name: an interrupted extraction never leaves a truncated JPEG in the cache
+    part_file = thumb_file + '.part'
+    with open(part_file, 'wb') as file:
+        file.write(data)
+    os.replace(part_file, thumb_file)
+    return thumb_file
+#################################################################################
@@ -0,0 +1,117 @@
+"""
+Headless ingest of a memory card: scan, metadata, groups, names, copy
+Never imports PySide6, so that it runs on a server and several cards can be imported in parallel
+The output is one JSON object per line on stdout
+
+Usage:
+    python ingest.py SOURCE DESTINATION --title TITLE [--gap MINUTES] [--split YYYY-MM-DDTHH:MM ...] [--verify] [--reimport] [--dry-run] [--trace FILE]
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import datetime
+
+from photo_exif import read_exif_batch
+from card_scan import scan_raw_files, chronological
+from naming import assign_suffixes, plan_copies, NamingError
+from transfer import execute_plan, Journal, WORKERS_PER_DEVICE
+from tracing import tracer
+from library_index import LibraryIndex
+
+
+#################################################################################
+def emit(event: str, **fields):
+    print(json.dumps(dict(event=event, **fields), ensure_ascii=False), flush=True)
+#--------------------------------------------------------------------------------
+def parse_args(argv: list):
+    parser = argparse.ArgumentParser(description='Tri et renommage des photos RAW, sans interface graphique')
+    parser.add_argument('source', help='répertoire d\'origine (carte mémoire)')
+    parser.add_argument('destination', help='répertoire de sortie')
+    parser.add_argument('--title', required=True, help='titre des répertoires')
+    parser.add_argument('--gap', type=float, help='nouveau groupe (a, b, c…) après un intervalle de plus de GAP minutes')
+    parser.add_argument('--split', action='append', default=[], type=datetime.datetime.fromisoformat, help='début d\'un nouveau groupe (AAAA-MM-JJTHH:MM), répétable')
+    parser.add_argument('--workers', type=int, default=None, help='processus de lecture des métadonnées')
+    parser.add_argument('--copies-per-device', type=int, default=WORKERS_PER_DEVICE, help='copies simultanées par périphérique')
+    parser.add_argument('--verify', action='store_true', help='relire et vérifier chaque copie')
+    parser.add_argument('--progress', action='store_true', help='une ligne par fichier copié')
+    parser.add_argument('--reimport', action='store_true', help='copier aussi les photos déjà présentes dans la destination')
+    parser.add_argument('--dry-run', action='store_true', help='afficher le plan sans copier')
+    parser.add_argument('--trace', help='enregistrer la durée de chaque étape dans TRACE (format Chrome trace)')
+    return parser.parse_args(argv)
+#--------------------------------------------------------------------------------
+def main(argv: list = None) -> int:
+    args = parse_args(argv)
+    if args.trace:
+        tracer.enabled = True
+    try:
+        return ingest(args)
+    finally:
+        if args.trace:
+            tracer.export(args.trace)
+            emit('trace', file=args.trace, **tracer.summary())
+#--------------------------------------------------------------------------------
+def ingest(args) -> int:
+    start = time.perf_counter()
+
+    with tracer.span('scan', 'io', source=args.source):
+        files = scan_raw_files(args.source)
+    emit('scan', source=args.source, files=len(files), seconds=round(time.perf_counter() - start, 3))
+
+    with tracer.span('exif batch', files=len(files)):
+        unreadable = list()
+        photos = read_exif_batch(files, args.workers, errors=unreadable)
+    for src, error in unreadable:
+        # a corrupt file is reported and left out, the readable files are imported anyway
+        emit('error', src=src, message=error)
+    photos = chronological(photos)
+    library = LibraryIndex(args.destination) if os.path.isdir(args.destination) else None
+    if library is not None and not args.reimport:
+        # the photos already in the destination are left out before anything else is done
+        unreadable = list()
+        added = library.update(unreadable)
+        for path, error in unreadable:
+            emit('error', src=path, message=error)
+        count = len(photos)
+        photos = [exif for exif in photos if not library.contains(exif)]
+        emit('library', files=len(library.files), indexed=added, imported=count - len(photos), seconds=round(time.perf_counter() - start, 3))
+    gap = datetime.timedelta(minutes=args.gap) if args.gap is not None else None
+    try:
+        with tracer.span('slice', files=len(photos)):
+            assign_suffixes(photos, gap, args.split)
+        with tracer.span('plan', files=len(photos)):
+            plan = plan_copies(photos, args.title, args.destination)
+    except NamingError as e:
+        emit('error', message=str(e))
+        return 2
+    emit('plan', files=len(plan), directories=len({os.path.dirname(dst) for _, dst in plan}), seconds=round(time.perf_counter() - start, 3))
+    if args.dry_run:
+        for src, dst in plan:
+            emit('copy', src=src, dst=dst)
+        return 0
+
+    progress = None
+    if args.progress:
+        progress = lambda stats: emit('progress', files=stats.files, total_files=stats.total_files, bytes=stats.bytes, total_bytes=stats.total_bytes)
+    try:
+        journal = Journal(args.destination)
+        try:
+            stats = execute_plan(plan, args.copies_per_device, progress, journal, args.verify)
+        finally:
+            journal.close()
+    except OSError as e:
+        # destination not writable (directories, journal)
+        emit('error', message=str(e))
+        return 1
+    if library is None:
+        library = LibraryIndex(args.destination)
+    library.record_plan(photos, plan, stats.errors)
+    for src, error in stats.errors:
+        emit('error', src=src, message=error)
+    emit('done', files=stats.files, skipped=stats.skipped, errors=len(stats.errors), bytes=stats.copied_bytes,
+         copy_rate=round(stats.copy_rate), verify_rate=round(stats.verify_rate), seconds=round(time.perf_counter() - start, 3))
+    return 1 if stats.errors else 0
+#################################################################################
+if __name__ == '__main__':
+    sys.exit(main())
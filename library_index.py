@@ -0,0 +1,214 @@
+import os
+import json
+import threading
+
+from card_scan import RAW_SUFFIXES
+from photo_exif import read_exif_batch
+from tracing import tracer
+
+# index of the library, at the root of the destination
+INDEX_NAME = '.renommage_index.jsonl'
+
+
+#################################################################################
+class LibraryIndex():
+    """
+    LibraryIndex is the index of the photos already imported in a destination library, stored at its root (INDEX_NAME)
+    A photo is identified by its Nikon file number, its DateTimeOriginal and its size: a photo of a card is already imported if a file of the library has the same key (lookup in a dict, whatever the size of the library)
+
+    The index is built once, then updated incrementally: the copies are recorded as they are made (record), and update only lists the directories whose mtime changed since the last update and only reads the metadata of the new files
+    One JSON line per directory ({'dir', 'mtime_ns'}) and per file ({'file', 'size', 'mtime_ns', 'file_number', 'date_time'}), the last line of a path wins
+
+    Attributes
+        root: str
+            root of the library
+        path: str
+            path of the index file
+        files: dict
+            path -> (size, mtime_ns, file_number, date_time iso), file_number and date_time None for a file whose metadata cannot be read (read again only once it changes)
+        directories: dict
+            path -> mtime_ns at the last update
+    """
+    def __init__(self, root: str, suffixes: tuple = RAW_SUFFIXES) -> None:
+        """
+        __init__ creates LibraryIndex objects and loads the index file if it exists (see update to bring it up to date)
+
+        Args:
+            root: str
+                root of the library (the destination of the copies)
+            suffixes: tuple[str]
+                extensions of the RAW files, lower case
+        """
+        self.root = root
+        self.suffixes = suffixes
+        self.path = os.path.join(root, INDEX_NAME)
+        self.files = dict()
+        self.directories = dict()
+        self._keys = dict()
+        # directory -> paths of its files
+        self._contents = dict()
+        self._lock = threading.Lock()
+        if os.path.exists(self.path):
+            with open(self.path, encoding='utf-8') as file:
+                for line in file:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        # last line of an interrupted write
+                        continue
+                    if 'dir' in entry:
+                        self.directories[entry['dir']] = entry['mtime_ns']
+                    else:
+                        self._add(entry['file'], (entry['size'], entry['mtime_ns'], entry['file_number'], entry['date_time']))
+#--------------------------------------------------------------------------------
+    def contains(self, exif) -> bool:
+        """
+        contains checks whether a photo of a card is already in the library
+
+        Args:
+            exif: PhotoExif
+                metadata of the photo of the card
+        """
+        size = os.stat(exif.file).st_size
+        return (exif.nikon_file_number, exif.date_time.isoformat(), size) in self._keys
+#--------------------------------------------------------------------------------
+    def record(self, exif, path: str):
+        """
+        record adds a photo copied to the library by this program, without reading it again
+
+        Args:
+            exif: PhotoExif
+                metadata of the source of the copy
+            path: str
+                path of the copy
+        """
+        stat = os.stat(path)
+        value = (stat.st_size, stat.st_mtime_ns, exif.nikon_file_number, exif.date_time.isoformat())
+        with self._lock:
+            self._add(path, value)
+            with open(self.path, 'a', encoding='utf-8') as file:
+                file.write(self._line(path, value))
+#--------------------------------------------------------------------------------
+    def record_plan(self, photos: list, plan: list, errors: list):
+        """
+        record_plan records the copies of a plan executed by transfer.execute_plan, except the failed ones
+
+        Args:
+            photos: list[PhotoExif]
+                the photos of the plan, in the same order (see naming.plan_copies)
+            plan: list[tuple]
+                (source path, destination path)
+            errors: list[tuple]
+                (source path, error message), see TransferStats
+        """
+        failed = {src for src, _ in errors}
+        for exif, (src, dst) in zip(photos, plan):
+            if src not in failed and os.path.exists(dst):
+                self.record(exif, dst)
+#--------------------------------------------------------------------------------
+    def update(self, errors: list = None) -> int:
+        """
+        Summary
+            update brings the index up to date with the library
+            A directory whose mtime did not change has the same entries as at the last update: it is not listed again, only its known sub directories are visited
+            The metadata of the new files are read (in parallel for many files, see read_exif_batch), the files removed from the library are removed from the index
+            A file whose metadata cannot be read is recorded as failed: it matches no photo of a card and is not read again until it changes
+
+        Args:
+            errors: list
+                if given, (path, error message) of each file recorded as failed is appended to it
+
+        Returns:
+            int: number of files added to the index
+        """
+        with tracer.span('library update', 'io', root=self.root):
+            children = dict()
+            for directory in self.directories:
+                children.setdefault(os.path.dirname(directory), list()).append(directory)
+            directories = dict()
+            new_files = dict()
+            removed = list()
+            self._visit(self.root, children, directories, new_files, removed)
+            for directory in self.directories.keys() - directories.keys():
+                # directories removed from the library
+                removed.extend(self._contents.get(directory, ()))
+            for path in removed:
+                self._remove(path)
+            unreadable = list()
+            photos = read_exif_batch(list(new_files), errors=unreadable) if new_files else list()
+            for exif in photos:
+                size, mtime_ns = new_files[exif.file]
+                self._add(exif.file, (size, mtime_ns, exif.nikon_file_number, exif.date_time.isoformat()))
+            for path, _ in unreadable:
+                size, mtime_ns = new_files[path]
+                self._add(path, (size, mtime_ns, None, None))
+            if errors is not None:
+                errors.extend(unreadable)
+            changed = bool(new_files or removed) or directories != self.directories
+            self.directories = directories
+            if changed:
+                self._save()
+        return len(photos)
+#--------------------------------------------------------------------------------
+    def _visit(self, directory: str, children: dict, directories: dict, new_files: dict, removed: list):
+        try:
+            mtime_ns = os.stat(directory).st_mtime_ns
+        except OSError:
+            return
+        directories[directory] = mtime_ns
+        if self.directories.get(directory) == mtime_ns:
+            for child in children.get(directory, ()):
+                self._visit(child, children, directories, new_files, removed)
+            return
+        present = set()
+        try:
+            with os.scandir(directory) as it:
+                entries = list(it)
+        except OSError:
+            return
+        for entry in entries:
+            if entry.name.startswith('.'):
+                continue
+            if entry.is_dir():
+                self._visit(entry.path, children, directories, new_files, removed)
+            elif os.path.splitext(entry.name)[1].lower() in self.suffixes:
+                present.add(entry.path)
+                stat = entry.stat()
+                known = self.files.get(entry.path)
+                if known is None or known[:2] != (stat.st_size, stat.st_mtime_ns):
+                    new_files[entry.path] = (stat.st_size, stat.st_mtime_ns)
+        removed.extend(self._contents.get(directory, set()) - present)
+#--------------------------------------------------------------------------------
+    def _add(self, path: str, value: tuple):
+        self._remove(path)
+        self.files[path] = value
+        size, _, file_number, date_time = value
+        if date_time is not None:
+            self._keys[(file_number, date_time, size)] = path
+        self._contents.setdefault(os.path.dirname(path), set()).add(path)
+#--------------------------------------------------------------------------------
+    def _remove(self, path: str):
+        value = self.files.pop(path, None)
+        if value is not None:
+            size, _, file_number, date_time = value
+            key = (file_number, date_time, size)
+            if self._keys.get(key) == path:
+                del self._keys[key]
+            self._contents[os.path.dirname(path)].discard(path)
+#--------------------------------------------------------------------------------
+    def _line(self, path: str, value: tuple) -> str:
+        size, mtime_ns, file_number, date_time = value
+        entry = {'file': path, 'size': size, 'mtime_ns': mtime_ns, 'file_number': file_number, 'date_time': date_time}
+        return json.dumps(entry, ensure_ascii=False) + '\n'
+#--------------------------------------------------------------------------------
+    def _save(self):
+        # the index is rewritten (compacted) under a temporary name, then renamed
+        part = self.path + '.part'
+        with self._lock:
+            with open(part, 'w', encoding='utf-8') as file:
+                for directory, mtime_ns in self.directories.items():
+                    file.write(json.dumps({'dir': directory, 'mtime_ns': mtime_ns}, ensure_ascii=False) + '\n')
+                for path, value in self.files.items():
+                    file.write(self._line(path, value))
+            os.replace(part, self.path)
+#################################################################################
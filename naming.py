@@ -0,0 +1,277 @@
+import os
+import string
+import datetime
+from array import array
+
+# origin of the timestamps of a PhotoTable (naive: the shooting times have no time zone)
+EPOCH = datetime.datetime(1970, 1, 1)
+# characters not allowed in the title of the directories (Windows, exFAT memory cards and disks)
+FORBIDDEN_TITLE_CHARACTERS = '/\\:*?"<>|'
+
+
+#################################################################################
+class NamingError(Exception):
+    pass
+#################################################################################
+def compress_date(day: datetime.date) -> tuple:
+    """
+    compress_date returns the decade (YYY0) and the compressed date (YMDD, M from A for january to L for december) of a day, see PhotoExif.compressed_date
+    """
+    year = f'{day.year:04d}'
+    return year[:3] + '0', f'{year[3]}{string.ascii_uppercase[day.month - 1]}{day.day:02d}'
+#--------------------------------------------------------------------------------
+def next_suffix(suffix: str) -> str:
+    """
+    next_suffix returns the suffix of the group following the group of suffix ('' or '?' -> 'a', 'a' -> 'b'…)
+
+    Raises:
+        NamingError: after 'z'
+    """
+    if suffix in ('', '?'):
+        return string.ascii_lowercase[0]
+    index = string.ascii_lowercase.index(suffix) + 1
+    if index >= len(string.ascii_lowercase):
+        raise NamingError(f'Plus de {len(string.ascii_lowercase)} groupes')
+    return string.ascii_lowercase[index]
+#################################################################################
+class PhotoTable():
+    """
+    PhotoTable is the compact table of the photos of a session used to plan their names: one row per photo, one column per field
+    The numeric columns are arrays (a few bytes per photo), the strings are shared with the PhotoExif records: a table of 100 000 photos is built and planned in a fraction of a second (see plan_names)
+
+    Attributes
+        files: list[str]
+            paths of the RAW files
+        names: list[str]
+            original names (stems)
+        extensions: list[str]
+            original suffixes (.NEF)
+        days: array
+            shooting day, as date.toordinal()
+        times: array
+            shooting time in seconds since EPOCH, sub seconds included
+        suffixes: array
+            date suffix, as a character code ('' is 0)
+    """
+    __slots__ = ('files', 'names', 'extensions', 'days', 'times', 'suffixes')
+
+    def __init__(self) -> None:
+        self.files = list()
+        self.names = list()
+        self.extensions = list()
+        self.days = array('l')
+        self.times = array('d')
+        self.suffixes = array('B')
+#--------------------------------------------------------------------------------
+    @classmethod
+    def from_photos(cls, photos: list):
+        """
+        from_photos returns the table of photos (list[PhotoExif]), in the same order
+        """
+        table = cls()
+        for exif in photos:
+            table.append(exif)
+        return table
+#--------------------------------------------------------------------------------
+    def append(self, exif):
+        date_time = exif.date_time
+        self.files.append(exif.file)
+        self.names.append(exif.original_name)
+        self.extensions.append(exif.original_suffix)
+        self.days.append(date_time.toordinal())
+        self.times.append((date_time - EPOCH).total_seconds())
+        suffix = exif.date_suffix
+        self.suffixes.append(ord(suffix) if suffix else 0)
+#--------------------------------------------------------------------------------
+    def __len__(self) -> int:
+        return len(self.files)
+#--------------------------------------------------------------------------------
+    def suffix(self, row: int) -> str:
+        code = self.suffixes[row]
+        return chr(code) if code else ''
+#--------------------------------------------------------------------------------
+    def set_suffix(self, row: int, suffix: str):
+        self.suffixes[row] = ord(suffix) if suffix else 0
+#################################################################################
+class NamePlan():
+    """
+    NamePlan is the result of plan_names, one entry per row of the PhotoTable
+
+    Attributes
+        directories: list[str]
+            directory of each photo, relative to the destination (<decade>/<compressed date>-<title>)
+        names: list[str]
+            new name of each photo
+        numbers: array
+            order number of each photo in its directory (from 1)
+        conflicts: list[tuple]
+            (row, message), the rows that cannot be named as they are, see plan_names
+    """
+    __slots__ = ('directories', 'names', 'numbers', 'conflicts')
+
+    def __init__(self) -> None:
+        self.directories = list()
+        self.names = list()
+        self.numbers = array('l')
+        self.conflicts = list()
+#--------------------------------------------------------------------------------
+    def paths(self, destination: str) -> list:
+        # destination path of each photo
+        return [os.path.join(destination, directory, name) for directory, name in zip(self.directories, self.names)]
+#################################################################################
+def plan_names(table: PhotoTable, title: str) -> NamePlan:
+    """
+    Summary
+        plan_names: computes in one pass the order numbers, the directories and the new names of all the photos of a session
+        Directories: <decade>/<compressed date><suffix>-<title>, names: (AAAA-MM-JJ)_NNN_DSCxxxx-<compressed date><suffix>-<title><original suffix> (see compress_date)
+        The compressed date, the directory and the date part of the names are computed once per day and group, not once per photo
+        Conflicts (rows that cannot be named as they are):
+            - the title is empty or contains a character not allowed in a file name (all the rows, row -1)
+            - a day is only partly split in groups (suffix '?')
+            - the groups of a day are not in chronological order (a photo of group a after a photo of group b), or a day mixes photos with and without groups
+            - the same RAW file appears twice
+        The rows in conflict are named anyway, the caller decides (see plan_copies)
+
+    Args:
+        table: PhotoTable
+            photos to be copied, in chronological order
+        title: str
+            title of the directories
+
+    Returns:
+        NamePlan
+    """
+    plan = NamePlan()
+    if not title.strip():
+        plan.conflicts.append((-1, 'Le titre du répertoire est vide'))
+    elif any(character in FORBIDDEN_TITLE_CHARACTERS for character in title):
+        plan.conflicts.append((-1, f'Le titre du répertoire ne peut pas contenir {FORBIDDEN_TITLE_CHARACTERS}'))
+    # (day, suffix) -> [directory, date part of the names, number of photos so far]
+    groups = dict()
+    previous_day = None
+    previous_suffix = 0
+    seen = set()
+    directories = plan.directories
+    names = plan.names
+    numbers = plan.numbers
+    conflicts = plan.conflicts
+    for row, (file, name, extension, day, suffix) in enumerate(zip(table.files, table.names, table.extensions, table.days, table.suffixes)):
+        group = groups.get((day, suffix))
+        if group is None:
+            decade, date = compress_date(datetime.date.fromordinal(day))
+            compressed = date + (chr(suffix) if suffix else '')
+            group = groups[(day, suffix)] = [os.path.join(decade, f'{compressed}-{title}'),
+                                             f'-{compressed}-{title}', f'({datetime.date.fromordinal(day).isoformat()})_', 0]
+        group[3] += 1
+        directories.append(group[0])
+        names.append(f'{group[2]}{group[3]:03d}_{name.lstrip("_")}{group[1]}{extension}')
+        numbers.append(group[3])
+        if suffix == 63:  # '?'
+            conflicts.append((row, f'{name} : la journée n\'est pas entièrement répartie en groupes'))
+        elif day == previous_day and suffix != previous_suffix and (suffix < previous_suffix or not previous_suffix or not suffix):
+            conflicts.append((row, f'{name} : les groupes de la journée ne sont pas dans l\'ordre chronologique'))
+        if file in seen:
+            conflicts.append((row, f'{name} : photo présente deux fois'))
+        seen.add(file)
+        previous_day, previous_suffix = day, suffix
+    return plan
+#--------------------------------------------------------------------------------
+def plan_copies(photos: list, title: str, destination: str) -> list:
+    """
+    Summary
+        plan_copies: computes the destination of every photo to be copied (see plan_names)
+
+    Args:
+        photos: list[PhotoExif]
+            photos to be copied (not hidden), in chronological order
+        title: str
+            title of the directories
+        destination: str
+            root directory of the copies
+
+    Raises:
+        NamingError: on the first conflict found by plan_names
+
+    Returns:
+        list[tuple]: (source path, destination path)
+    """
+    table = PhotoTable.from_photos(photos)
+    names = plan_names(table, title)
+    if names.conflicts:
+        raise NamingError(names.conflicts[0][1])
+    return list(zip(table.files, names.paths(destination)))
+#--------------------------------------------------------------------------------
+def assign_suffixes(photos: list, gap: datetime.timedelta = None, splits: tuple = ()):
+    """
+    Summary
+        assign_suffixes: splits each day in groups a, b, c… and sets the date suffix of the photos
+        A new group starts at each split time of the day and, if gap is given, after each interval longer than gap between two consecutive photos
+        The days with a single group keep an empty suffix
+
+    Args:
+        photos: list[PhotoExif]
+            in chronological order
+        gap: datetime.timedelta
+            automatic grouping, None for no automatic grouping
+        splits: tuple[datetime.datetime]
+            rules: start times of new groups
+    """
+    splits = tuple(splits)
+    days = dict()
+    for exif in photos:
+        days.setdefault(exif.date, list()).append(exif)
+    for day in days.values():
+        groups = [0]
+        for previous, exif in zip(day, day[1:]):
+            new_group = gap is not None and exif.date_time - previous.date_time > gap
+            new_group = new_group or any(previous.date_time < split <= exif.date_time for split in splits)
+            groups.append(groups[-1] + 1 if new_group else groups[-1])
+        if groups[-1] >= len(string.ascii_lowercase):
+            raise NamingError(f'{day[0].date} : plus de {len(string.ascii_lowercase)} groupes')
+        for exif, group in zip(day, groups):
+            exif.date_suffix = string.ascii_lowercase[group] if groups[-1] > 0 else ''
+#--------------------------------------------------------------------------------
+def propose_suffixes(table: PhotoTable, gap: float):
+    """
+    Summary
+        propose_suffixes: splits every day of a session in groups a, b, c… after each interval longer than gap between two consecutive photos, for the whole session at once
+        Same groups as assign_suffixes(photos, gap), computed on the columns of the table (numpy, no loop over the photos): fast enough to be run again on every move of a slider
+
+    Args:
+        table: PhotoTable
+            in chronological order
+        gap: float
+            largest interval within a group, in seconds
+
+    Returns:
+        numpy array (n,) of uint8: date suffixes as character codes, like PhotoTable.suffixes (0 for the days with a single group)
+    """
+    # imported on the first proposal: numpy is not needed otherwise
+    import numpy as np
+    count = len(table)
+    if count == 0:
+        return np.zeros(0, dtype=np.uint8)
+    # views on the arrays of the table, no copy
+    days = np.frombuffer(table.days, dtype=table.days.typecode)
+    times = np.frombuffer(table.times, dtype=table.times.typecode)
+    intervals = np.diff(times)
+    if np.any(intervals < 0):
+        raise NamingError('Les photos ne sont pas dans l\'ordre chronologique')
+    new_day = np.ones(count, dtype=bool)
+    new_day[1:] = days[1:] != days[:-1]
+    new_group = new_day.copy()
+    new_group[1:] |= intervals > gap
+    # number of the group in the session, then in its day
+    group = np.cumsum(new_group) - 1
+    day = np.cumsum(new_day) - 1
+    starts = np.flatnonzero(new_day)
+    in_day = group - group[starts][day]
+    last = np.maximum.reduceat(in_day, starts)
+    too_many = np.flatnonzero(last >= len(string.ascii_lowercase))
+    if len(too_many):
+        date = datetime.date.fromordinal(int(days[starts[too_many[0]]]))
+        raise NamingError(f'{date:%Y %m %d} : plus de {len(string.ascii_lowercase)} groupes')
+    suffixes = (in_day + ord(string.ascii_lowercase[0])).astype(np.uint8)
+    suffixes[last[day] == 0] = 0
+    return suffixes
+#################################################################################
@@ -0,0 +1,237 @@
+import struct
+
+# TIFF tags used to locate the JPEG previews
+NEW_SUBFILE_TYPE = 0x00FE
+COMPRESSION = 0x0103
+STRIP_OFFSETS = 0x0111
+STRIP_BYTE_COUNTS = 0x0117
+SUB_IFDS = 0x014A
+JPEG_OFFSET = 0x0201
+JPEG_LENGTH = 0x0202
+# TIFF/EXIF tags read by PhotoExif
+ORIENTATION = 0x0112
+EXIF_IFD = 0x8769
+DATE_TIME_ORIGINAL = 0x9003
+SUB_SEC_TIME_ORIGINAL = 0x9291
+MAKER_NOTE = 0x927C
+# Nikon MakerNote (type 3: 'Nikon\0' + version, followed by a TIFF header) and FileInfo (Exif.NikonFi)
+NIKON_HEADER = b'Nikon\0'
+NIKON_TIFF_OFFSET = 10
+NIKON_FILE_INFO = 0x00B8
+NIKON_FILE_NUMBER_OFFSET = 8
+
+# size in bytes of the TIFF field types (BYTE, ASCII, SHORT, LONG, RATIONAL, SBYTE, UNDEFINED, SSHORT, SLONG, SRATIONAL, FLOAT, DOUBLE, IFD)
+TYPE_SIZES = {1: 1, 2: 1, 3: 2, 4: 4, 5: 8, 6: 1, 7: 1, 8: 2, 9: 4, 10: 8, 11: 4, 12: 8, 13: 4}
+TYPE_FORMATS = {1: 'B', 3: 'H', 4: 'L', 6: 'b', 8: 'h', 9: 'l', 13: 'L'}
+MAX_IFDS = 32
+JPEG_SOI = b'\xff\xd8'
+
+
+#################################################################################
+class TiffError(Exception):
+    pass
+#################################################################################
+class TiffReader():
+    """
+    TiffReader reads the IFDs of a TIFF based RAW file (NEF for Nikon) with small reads, without loading the image data
+
+    Attributes
+        endian: str
+            '<' (II, little endian) or '>' (MM, big endian)
+        size: int
+            size of the file in bytes
+    """
+    def __init__(self, file, base: int = 0) -> None:
+        """
+        __init__ creates TiffReader objects
+
+        Args:
+            file: binary file object, opened by the caller
+            base: int
+                position of the TIFF header in the file, the offsets of the IFDs are relative to it (0 except for embedded TIFF structures such as the Nikon MakerNote)
+        """
+        self._file = file
+        self.base = base
+        file.seek(0, 2)
+        self.size = file.tell()
+        header = self.read(base, 8)
+        if header[:2] == b'II':
+            self.endian = '<'
+        elif header[:2] == b'MM':
+            self.endian = '>'
+        else:
+            raise TiffError('not a TIFF file')
+        magic, self.first_ifd = struct.unpack(self.endian + 'HL', header[2:])
+        if magic != 42:
+            raise TiffError('not a TIFF file')
+#--------------------------------------------------------------------------------
+    def read(self, offset: int, length: int) -> bytes:
+        # offset is absolute (from the start of the file)
+        if offset < 0 or offset + length > self.size:
+            raise TiffError(f'read outside the file at {offset}')
+        self._file.seek(offset)
+        return self._file.read(length)
+#--------------------------------------------------------------------------------
+    def ifd(self, offset: int):
+        """
+        ifd reads the IFD at offset (relative to base)
+
+        Returns:
+            tuple: (entries, next_offset), entries is a dict {tag: (type, count, raw value or offset)}
+        """
+        (count,) = struct.unpack(self.endian + 'H', self.read(self.base + offset, 2))
+        data = self.read(self.base + offset + 2, 12 * count + 4)
+        entries = dict()
+        for i in range(count):
+            tag, kind, n = struct.unpack_from(self.endian + 'HHL', data, 12 * i)
+            entries[tag] = (kind, n, data[12 * i + 8:12 * i + 12])
+        (next_offset,) = struct.unpack_from(self.endian + 'L', data, 12 * count)
+        return entries, next_offset
+#--------------------------------------------------------------------------------
+    def values(self, entry) -> tuple:
+        """
+        values returns the values of an integer IFD entry
+
+        Args:
+            entry: tuple
+                (type, count, raw value or offset) as returned by ifd
+        """
+        kind, count, raw = entry
+        if kind not in TYPE_FORMATS:
+            raise TiffError(f'unexpected type {kind}')
+        return struct.unpack_from(self.endian + TYPE_FORMATS[kind] * count, self.data(entry))
+#--------------------------------------------------------------------------------
+    def data(self, entry) -> bytes:
+        """
+        data returns the raw bytes of an IFD entry (ASCII and UNDEFINED entries are used as is)
+        """
+        kind, count, raw = entry
+        length = TYPE_SIZES.get(kind, 1) * count
+        if length <= 4:
+            return raw[:length]
+        (offset,) = struct.unpack(self.endian + 'L', raw)
+        return self.read(self.base + offset, length)
+#--------------------------------------------------------------------------------
+    def ascii(self, entry) -> str:
+        return self.data(entry).split(b'\0', 1)[0].decode('ascii', 'replace')
+#--------------------------------------------------------------------------------
+    def walk(self):
+        """
+        walk yields the entries of every IFD: the IFD0 chain and, recursively, the SubIFDs
+        """
+        pending = [self.first_ifd]
+        visited = set()
+        while pending and len(visited) < MAX_IFDS:
+            offset = pending.pop(0)
+            if offset == 0 or offset in visited:
+                continue
+            visited.add(offset)
+            entries, next_offset = self.ifd(offset)
+            yield entries
+            if SUB_IFDS in entries:
+                pending.extend(self.values(entries[SUB_IFDS]))
+            pending.append(next_offset)
+#################################################################################
+def find_jpeg_preview(file) -> tuple:
+    """
+    Summary
+        find_jpeg_preview: locates the largest JPEG preview of a TIFF based RAW file
+
+    Args:
+        file: binary file object
+
+    Returns:
+        tuple: (offset, length) of the JPEG, None if there is no JPEG preview
+    """
+    reader = TiffReader(file)
+    best = None
+    for entries in reader.walk():
+        candidate = None
+        if JPEG_OFFSET in entries and JPEG_LENGTH in entries:
+            candidate = (reader.values(entries[JPEG_OFFSET])[0], reader.values(entries[JPEG_LENGTH])[0])
+        elif COMPRESSION in entries and STRIP_OFFSETS in entries and STRIP_BYTE_COUNTS in entries:
+            # a reduced resolution image (NewSubfileType == 1) stored as a single JPEG strip
+            compression = reader.values(entries[COMPRESSION])[0]
+            reduced = NEW_SUBFILE_TYPE in entries and reader.values(entries[NEW_SUBFILE_TYPE])[0] == 1
+            offsets = reader.values(entries[STRIP_OFFSETS])
+            if compression in (6, 7) and reduced and len(offsets) == 1:
+                candidate = (offsets[0], reader.values(entries[STRIP_BYTE_COUNTS])[0])
+        if candidate is None:
+            continue
+        offset, length = candidate
+        if length == 0 or offset + length > reader.size or reader.read(offset, 2) != JPEG_SOI:
+            continue
+        if best is None or length > best[1]:
+            best = candidate
+    return best
+#--------------------------------------------------------------------------------
+def read_jpeg_preview(raw_file: str) -> memoryview:
+    """
+    Summary
+        read_jpeg_preview: reads only the bytes of the largest JPEG preview of a NEF file
+        The bytes are read once in a buffer, the returned memoryview can be written or decoded without any further copy
+        (no mmap: a memory card removed while mapped would kill the process with SIGBUS)
+
+    Args:
+        raw_file: str
+            path to the RAW file
+
+    Returns:
+        memoryview: the JPEG, None if the file cannot be parsed (rawpy should then be used)
+    """
+    try:
+        with open(raw_file, 'rb', buffering=0) as file:
+            location = find_jpeg_preview(file)
+            if location is None:
+                return None
+            offset, length = location
+            buffer = bytearray(length)
+            file.seek(offset)
+            view = memoryview(buffer)
+            read = 0
+            while read < length:
+                n = file.readinto(view[read:])
+                if not n:
+                    return None
+                read += n
+            return view
+    except (TiffError, struct.error, OSError):
+        return None
+#--------------------------------------------------------------------------------
+def read_nef_tags(raw_file: str) -> tuple:
+    """
+    Summary
+        read_nef_tags: reads only the tags needed by PhotoExif from a NEF file: IFD0, the EXIF IFD and the Nikon FileInfo record
+
+    Args:
+        raw_file: str
+            path to the RAW file
+
+    Returns:
+        tuple: (DateTimeOriginal, SubSecTimeOriginal, Orientation, FileNumber) as (str, str, int, int), None if the file cannot be parsed (pyexiv2 should then be used)
+    """
+    try:
+        with open(raw_file, 'rb', buffering=0) as file:
+            reader = TiffReader(file)
+            ifd0, _ = reader.ifd(reader.first_ifd)
+            orientation = reader.values(ifd0[ORIENTATION])[0] if ORIENTATION in ifd0 else 1
+            date_time = reader.ascii(ifd0[DATE_TIME_ORIGINAL]) if DATE_TIME_ORIGINAL in ifd0 else ''
+            exif_ifd, _ = reader.ifd(reader.values(ifd0[EXIF_IFD])[0])
+            if not date_time and DATE_TIME_ORIGINAL in exif_ifd:
+                date_time = reader.ascii(exif_ifd[DATE_TIME_ORIGINAL])
+            sub_sec = reader.ascii(exif_ifd[SUB_SEC_TIME_ORIGINAL]).strip() if SUB_SEC_TIME_ORIGINAL in exif_ifd else ''
+            # the MakerNote is a TIFF structure of its own, with its own byte order
+            kind, count, raw = exif_ifd[MAKER_NOTE]
+            (note_offset,) = struct.unpack(reader.endian + 'L', raw)
+            if reader.read(note_offset, len(NIKON_HEADER)) != NIKON_HEADER:
+                return None
+            note = TiffReader(file, note_offset + NIKON_TIFF_OFFSET)
+            note_ifd, _ = note.ifd(note.first_ifd)
+            file_info = note.data(note_ifd[NIKON_FILE_INFO])
+            (file_number,) = struct.unpack_from(note.endian + 'H', file_info, NIKON_FILE_NUMBER_OFFSET)
+    except (TiffError, KeyError, IndexError, struct.error, OSError):
+        return None
+    if not date_time:
+        return None
+    return date_time, sub_sec, orientation, file_number
+#################################################################################
@@ -0,0 +1,183 @@
+from pathlib import Path
+import os
+import string
+import datetime
+import multiprocessing
+from itertools import repeat
+from concurrent.futures import ProcessPoolExecutor
+
+from nef_preview import read_nef_tags
+from tracing import tracer, timed
+
+EXIF_DATE_FORMAT = '%Y:%m:%d %H:%M:%S'
+# below this number of files, the metadata are read in the calling process
+BATCH_MIN_FILES = 16
+
+
+#################################################################################
+class PhotoExif():
+    """
+    PhotoExif object contains the exif informations necessary for the present program and a compressed version of the original date
+    PhotoExif objects are compact (slots) records: they are read once (see read_exif_batch) and shared by the extraction and the gallery
+
+    Attributes
+        dir: str
+            directory containing the RAW files
+        original_name: str
+            original name (stem) from camera memory card
+        original_suffix: str
+            original ext (NEF for Nikon)
+        date_time: datetime.datetime
+            original date and time (DateTimeOriginal, with the sub seconds of SubSecTimeOriginal)
+        date [%Y %m %d]: str
+            original date (date of the shooting)
+        compressed_date: tuple
+            the first element of the tuple represents the decade (format: YYYX), the second one the date itself (format: YMDD, where Y is the last part of the year et M is the month as a letter between A for january and L for december)
+            Note: the compressed date is for compatibility with old files (the time of the 8.3 filenames)
+        exif_orientation: int
+            EXIF orientation (1 to 8)
+        oriention: str
+            portrait (exif orientation 5 to 8, the image is displayed rotated by 90°), landscape (otherwise)
+        nikon_file_number: int
+            Nikon file number
+    """
+    __slots__ = ('_file', '_date_suffix', 'dir', 'original_name', 'original_suffix', 'date_time', 'date', 'exif_orientation', 'orientation', 'nikon_file_number', '_compressed')
+
+    def __init__(self, file, tags: tuple = None) -> None:
+        """
+        __init__ creates PhotoExif objects
+
+        Args:
+            file: str
+                path to the RAW file
+            tags: tuple
+                (date_time, orientation, nikon_file_number) as returned by read_tags, read from file if None
+        """
+        self._file = file
+        self._date_suffix = ''
+        path = Path(file)
+        self.dir = str(path.cwd()) # maybe useless
+        self.original_name = path.stem
+        self.original_suffix = path.suffix
+        if tags is None:
+            tags = read_tags(file)
+        self.date_time, self.exif_orientation, self.nikon_file_number = tags
+        self.date = self.date_time.strftime('%Y %m %d')
+        index = int(self.date[5:7]) - 1
+        self._compressed = (str(self.date[0:3])+'0', self.date[3] + string.ascii_uppercase[index] + self.date[-2:])
+        self.orientation = 'portrait' if self.exif_orientation in (5, 6, 7, 8) else 'landscape'
+#--------------------------------------------------------------------------------
+    @property
+    def file(self):
+        return self._file
+    @property
+    def full_path(self):
+        return '/'.join([self.dir, self.file])
+    @property
+    def date_suffix(self):
+        # print('Récupération du suffixe de la date')
+        return str(self._date_suffix)
+    @date_suffix.setter
+    def date_suffix(self, suffix: str):
+        # print('Attribution suffixe')
+        self._date_suffix = suffix
+    @property
+    def compressed_date(self):
+        # the decade and the date are computed once, only the suffix changes
+        return self._compressed + (self._date_suffix,)
+#################################################################################
+def read_tags(file: str) -> tuple:
+    """
+    Summary
+        read_tags: reads DateTimeOriginal, Orientation and the Nikon file number of a RAW file
+        NEF files are parsed directly (only those tags are read), pyexiv2 is used for the other files or if the NEF cannot be parsed
+
+    Args:
+        file: str
+            path to the RAW file
+
+    Returns:
+        tuple: (date_time: datetime.datetime, orientation: int, nikon_file_number: int), nikon_file_number is -1 if not a NEF file
+    """
+    # the same test for both readers: .NEF and .nef files
+    is_nef = Path(file).suffix.upper() == '.NEF'
+    if is_nef:
+        tags = read_nef_tags(file)
+        if tags is not None:
+            date_time, sub_sec, orientation, file_number = tags
+            date_time = datetime.datetime.strptime(date_time, EXIF_DATE_FORMAT)
+            if sub_sec.isdigit():
+                # fraction of a second: '5' is 0.5 s, '05' is 0.05 s
+                date_time = date_time.replace(microsecond=int(sub_sec[:6].ljust(6, '0')))
+            return date_time, orientation, file_number
+    # imported only when needed: pyexiv2 is slow to import and not used for the NEF files
+    import pyexiv2
+    meta_data = pyexiv2.ImageMetadata(file)
+    meta_data.read()
+    date_time = meta_data['Exif.Image.DateTimeOriginal'].value
+    orientation = meta_data['Exif.Image.Orientation'].value
+    if is_nef:
+        file_number = meta_data['Exif.NikonFi.FileNumber'].value
+    else:
+        file_number = -1
+    return date_time, orientation, file_number
+#--------------------------------------------------------------------------------
+def read_exif_batch(files: list, workers: int = None, executor=None, errors: list = None) -> list:
+    """
+    Summary
+        read_exif_batch: reads the metadata of a whole list of RAW files in one pass, in parallel
+        A file that cannot be read (corrupt, truncated, unknown format) is left out, the other files are read anyway
+
+    Args:
+        files: list[str]
+            paths to the RAW files
+        workers: int
+            number of worker processes (default: number of CPUs), ignored if executor is given
+        executor: concurrent.futures.Executor
+            existing pool to use (the one of the ExtractionEngine for instance)
+        errors: list
+            if given, (path, error message) of each file left out is appended to it
+
+    Returns:
+        list[PhotoExif]: one record per readable file, in the order of files
+    """
+    files = list(files)
+    if executor is None and len(files) < BATCH_MIN_FILES:
+        results = list()
+        for file in files:
+            with tracer.span('exif', file=file):
+                results.append(_read_tags(file))
+    else:
+        workers = workers or os.cpu_count() or 1
+        chunksize = max(1, len(files) // (4 * workers))
+        if executor is not None:
+            results = _map_tags(executor, files, chunksize)
+        else:
+            with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn')) as pool:
+                results = _map_tags(pool, files, chunksize)
+    photos = list()
+    for file, (tags, error) in zip(files, results):
+        if error is None:
+            try:
+                photos.append(PhotoExif(file, tags))
+                continue
+            except Exception as e:
+                error = f'{type(e).__name__}: {e}'
+        tracer.count('unreadable files')
+        if errors is not None:
+            errors.append((file, error))
+    return photos
+#--------------------------------------------------------------------------------
+def _read_tags(file: str) -> tuple:
+    # run in the worker processes: the error of a file is returned, not raised, so that it does not end the whole batch
+    try:
+        return read_tags(file), None
+    except Exception as e:
+        return None, f'{type(e).__name__}: {e}'
+#--------------------------------------------------------------------------------
+def _map_tags(executor, files: list, chunksize: int) -> list:
+    # the workers time each file only when the tracing is on
+    if tracer.enabled:
+        return [tracer.unwrap('exif', result, file=file) for file, result in zip(files, executor.map(timed, repeat(_read_tags), files, chunksize=chunksize))]
+    return list(executor.map(_read_tags, files, chunksize=chunksize))
+#################################################################################
@@ -1,14 +1,23 @@
+import time
+# start of the program, for the startup report (see STARTUP_REPORT)
+STARTED = time.perf_counter()
 import sys, os
 import shutil
 
-import rawpy
-
-from PySide6.QtWidgets import QApplication, QMainWindow, QGridLayout, QVBoxLayout, QWidget
+from PySide6.QtWidgets import QApplication, QMainWindow, QVBoxLayout, QHBoxLayout, QWidget
 from PySide6.QtGui import QIcon
-from PySide6.QtCore import QFile, QTextStream, QIODevice
+from PySide6.QtCore import QFile, QTextStream, QIODevice, QTimer
 
 from constants import *
 from RenameCls import *
+from thumb_cache import ThumbCache, MemoryThumbCache
+from naming import plan_copies, NamingError
+from tracing import tracer
+from card_scan import iter_raw_files
+from library_index import LibraryIndex
+from session import SessionJournal
+
+IMPORTED = time.perf_counter()
 
 
 #################################################################################
@@ -16,46 +25,135 @@ class MainWindow(QMainWindow):
     def __init__(self, parent=None):
         super().__init__(parent=parent)
 
-        ### seulement pour la mise au point
-        ### only for the development phase --------------------------------------
-        # will be from camera memory card in the final version
-        # short list:
-        photos_test_short = ('_DSC7986.NEF', '_DSC8064.NEF', '_DSC8080.NEF', '_DSC8081.NEF', '_DSC8084.NEF')
-        # longer list: 
-        photos_test_long = (
-            '_DSC7986.NEF', '_DSC8064.NEF', '_DSC8080.NEF', '_DSC8081.NEF', '_DSC8084.NEF', '_DSC8134.NEF',
-            '_DSC8135.NEF',
-            '_DSC8145.NEF', '_DSC8146.NEF', '_DSC8147.NEF', '_DSC8148.NEF', '_DSC8149.NEF')
-        self.photos_test = photos_test_short
-        # development only ------------------------------------------------------
+        # memory card (or a copy of it) and destination library: arguments of the command line
+        self.source = sys.argv[1] if len(sys.argv) > 1 else CARD_SOURCE
+        library = sys.argv[2] if len(sys.argv) > 2 else LIBRARY_DIR
+        # the photos of the card already in the library are not displayed
+        self.library = LibraryIndex(library) if library and os.path.isdir(library) else None
+        # the sorting of the card is journaled: reopening the same card restores it
+        self.session = SessionJournal(self.source, SESSION_DIR)
+        self.imported = 0
+        self._copies = None
         self.eventFilter = KeyPressFilter(parent=self)
         self.installEventFilter(self.eventFilter)
 
-        self.create_thumb_jpeg(self.photos_test)
+        # the window is shown first, the photos are loaded once it is painted (see paintEvent)
+        self.startup = {'imports': IMPORTED - STARTED}
+        self.photos = list()
+        self.loading = False
+        # the gallery is created once the size of the card is known (see create_gallery)
+        self.gallery = None
+        self._waiting = list()
         self.setUI()
         self.show_display()
+        self.extraction = ExtractionEngine(self.cache, EXTRACT_WORKERS, self.library, self.session)
+        if self.library is not None:
+            self.controls.set_destination(self.library.root)
+        self.extraction.found.connect(self.file_found)
+        self.extraction.scanned.connect(self.card_scanned)
+        self.extraction.extracted.connect(self.thumbnail_extracted)
+        self.extraction.imported.connect(self.photo_imported)
+        self.extraction.failed.connect(self.extraction_failed)
+        self.extraction.finished.connect(self.loading_finished)
+
+    #--------------------------------------------------------------------------------
+    def showEvent(self, event):
+        super().showEvent(event)
+        # in case the main window itself is never painted (entirely covered by its children)
+        QTimer.singleShot(50, self.start_loading)
+
+    def paintEvent(self, event):
+        super().paintEvent(event)
+        if 'first paint' not in self.startup:
+            self.startup['first paint'] = time.perf_counter() - STARTED
+            # after the current paint, so that the window is on screen before any file is read
+            QTimer.singleShot(0, self.start_loading)
+
+    def start_loading(self):
+        if self.loading:
+            return
+        self.loading = True
+        self.startup.setdefault('first paint', time.perf_counter() - STARTED)
+        self.create_thumb_jpeg(self.source)
+
+    def first_thumbnail(self, rank: int):
+        self.gallery.thumbnail_added.disconnect(self.first_thumbnail)
+        self.startup['first thumbnail'] = time.perf_counter() - STARTED
+        if STARTUP_REPORT:
+            print('Démarrage :', ', '.join(f'{step} {seconds * 1000:.0f} ms' for step, seconds in self.startup.items()))
 
     #--------------------------------------------------------------------------------
-    def create_thumb_jpeg(self, photos_test: tuple):
+    def create_thumb_jpeg(self, source: str):
         """
         Summary
-            create_thumb_jpeg: Creates a temporary directory for JPEG embedded in NEF files
+            create_thumb_jpeg: Extracts in the background the JPEG embedded in NEF files to the cache
+            The card is scanned in the background, the metadata of each file are read as soon as it is found, and its JPEG is extracted as soon as they are known
+            Each Thumbnails is added to the gallery as soon as its JPEG is ready
         
         Args:
-            photos_test: list[str] 
-                list of the RAW files from which the JPEG is to be extracted
+            source: str
+                memory card (or directory) containing the RAW files
         """
+        # metadata are read once and shared by the extraction and the gallery
+        self.extraction.load(iter_raw_files(source))
+        self.photos = self.extraction.photos
+
+    #--------------------------------------------------------------------------------
+    def create_gallery(self, virtual: bool):
+        """
+        create_gallery creates the gallery, a VirtualGallery for large cards, and adds to it the thumbnails extracted so far
+        """
+        if virtual:
+            self.gallery = VirtualGallery(self.controls, self.cache, self.session)
+        else:
+            self.gallery = Gallery(self.controls, self.cache, self.session)
+        self.gallery.thumbnail_added.connect(self.first_thumbnail)
+        self.gallery.message.connect(self.statusBar().showMessage)
+        if self.stats_panel is not None:
+            self.stats_panel.set_pixmaps(self.gallery.pixmaps)
+        self.display.setWidget(self.gallery)
+        # the thumbnails in the viewport are loaded first
+        self.display.horizontalScrollBar().valueChanged.connect(self.gallery.viewport_changed)
+        for index, exif in self._waiting:
+            self.gallery.add_thumbnail(index, exif)
+        self._waiting.clear()
+
+    def file_found(self, index: int, raw_file: str):
+        if self.gallery is None and index + 1 >= VIRTUAL_GALLERY_MIN:
+            self.create_gallery(virtual=True)
+
+    def card_scanned(self, count: int):
+        print('Carte :', count, 'fichiers RAW')
+        if self.gallery is None:
+            self.create_gallery(virtual=False)
 
-        os.makedirs(TMP_DIR, exist_ok=True)
-        for i in range(0, len(photos_test)):
-            photo_file = f'./pictures/{photos_test[i]}'
-            photo_exif = PhotoExif(photo_file)
-            full_path_for_thumb = TMP_DIR + photo_exif.original_name + '.jpeg'
-            file_path = './pictures/' + photos_test[i]
-            with rawpy.imread(file_path) as raw:
-                thumb = raw.extract_thumb()
-            with open(full_path_for_thumb, 'wb') as file:
-                file.write(thumb.data)
+    def thumbnail_extracted(self, index: int, exif):
+        if self.gallery is None:
+            self._waiting.append((index, exif))
+        else:
+            self.gallery.add_thumbnail(index, exif)
+
+    def extraction_failed(self, index: int, error: str):
+        if index < 0:
+            # file of the library, not of the card
+            self.statusBar().showMessage(f'Bibliothèque : {error}')
+        elif self.gallery is None:
+            self.statusBar().showMessage(f'Extraction impossible ({index}) : {error}')
+            self._waiting.append((index, None))
+        else:
+            self.gallery.skip_thumbnail(index, error)
+
+    def photo_imported(self, index: int, exif):
+        self.imported += 1
+        self.thumbnail_extracted(index, None)
+
+    def loading_finished(self):
+        if self.imported:
+            print('Déjà dans la bibliothèque :', self.imported, 'photos')
+        # the order of the card is replaced by the shooting order if they differ
+        if self.gallery is not None:
+            self.gallery.sort_items()
+            self.gallery.restore_selection()
 
     #--------------------------------------------------------------------------------
 
@@ -70,13 +168,79 @@ class MainWindow(QMainWindow):
 
     def show_display(self):
         controls = Controls()
-        # creates widget gallery (contains Thumbnails objects)
-        gallery = Gallery(controls, self.photos_test)
-        # creates scrollarea (contains gallery)
-        display = Display(gallery)
+        self.controls = controls
+        if THUMB_CACHE_IN_MEMORY:
+            self.cache = MemoryThumbCache(THUMB_MEMORY_BYTES)
+        else:
+            self.cache = ThumbCache(CACHE_DIR, CACHE_MAX_BYTES)
+        # creates scrollarea (will contain the gallery, see create_gallery)
+        display = Display(QWidget())
+        self.display = display
         # adds scrollarea to main layout (central widget)
         self.main_layout.addWidget(display)
-        self.main_layout.addWidget(controls)
+        if TRACE:
+            # the performance panel is next to the controls
+            tracer.enabled = True
+            bottom = QHBoxLayout()
+            bottom.addWidget(controls)
+            self.stats_panel = StatsPanel(tracer)
+            bottom.addWidget(self.stats_panel)
+            self.main_layout.addLayout(bottom)
+        else:
+            self.stats_panel = None
+            self.main_layout.addWidget(controls)
+        # copy of the photos ("Exécuter")
+        self.execution = ExecutionEngine(COPY_WORKERS_PER_DEVICE)
+        self.execution.progress.connect(self.show_progress)
+        self.execution.finished.connect(self.execution_finished)
+        controls.executed.connect(self.execute)
+
+    #--------------------------------------------------------------------------------
+
+    def execute(self, title: str, destination: str, verify: bool):
+        """
+        Summary
+            execute: copies the photos that are not hidden to destination, under their new names
+            The photos already copied by a previous (interrupted) execution are skipped
+
+        Args:
+            title: str
+                title of the directories
+            destination: str
+                root directory of the copies
+            verify: bool
+                read back and check every copy
+        """
+        if not destination:
+            print('Pas de répertoire de destination')
+            return
+        if self.gallery is None:
+            print('Pas de photos')
+            return
+        photos = self.gallery.kept_photos()
+        try:
+            plan = plan_copies(photos, title, destination)
+        except NamingError as e:
+            print(e)
+            return
+        if not self.execution.start(plan, destination, verify):
+            print('Copie déjà en cours')
+            return
+        self._copies = (destination, photos, plan)
+
+    def show_progress(self, files: int, total_files: int, copied: int, total_bytes: int):
+        self.controls.show_progress(files, total_files)
+
+    def execution_finished(self, stats):
+        print('Copie terminée :', stats.files, 'fichiers,', stats.skipped, 'déjà copiés,', len(stats.errors), 'erreurs')
+        print(f'Débit : copie {stats.copy_rate / 1e6:.1f} Mo/s, vérification {stats.verify_rate / 1e6:.1f} Mo/s')
+        for src, error in stats.errors:
+            print(src, error)
+        # the copies are added to the index of the library, for the next cards
+        destination, photos, plan = self._copies
+        if self.library is None or self.library.root != destination:
+            self.library = LibraryIndex(destination)
+        self.library.record_plan(photos, plan, stats.errors)
 
 
 #################################################################################
@@ -94,9 +258,20 @@ def main():
     f.open(QIODevice.ReadOnly)
     app.setStyleSheet(QTextStream(f).readAll())
 
-    # shutil.rmtree(TMP_DIR) <- useless here!
     main_window.show()
-    sys.exit(app.exec())
+    try:
+        status = app.exec()
+    finally:
+        # also when the program fails: the workers are stopped, the journal is compacted, nothing is left in TMP_DIR
+        main_window.extraction.shutdown()
+        main_window.session.close()
+        shutil.rmtree(TMP_DIR, ignore_errors=True)
+    if TRACE:
+        tracer.export(TRACE_FILE)
+        print('Trace enregistrée dans', TRACE_FILE)
+        if main_window.gallery is not None:
+            print('Vignettes en mémoire :', main_window.gallery.pixmaps.stats())
+    sys.exit(status)
 
 
 if __name__ == '__main__':
@@ -0,0 +1,154 @@
+import os
+import json
+import hashlib
+import datetime
+import threading
+
+# the journal is compacted when it has more than COMPACT_MIN_LINES lines and more than COMPACT_RATIO lines per photo
+COMPACT_MIN_LINES = 1000
+COMPACT_RATIO = 3
+
+
+#################################################################################
+class SessionJournal():
+    """
+    SessionJournal is the append-only journal of the sorting of a memory card: metadata of the photos, hidden photos, date suffixes, colors and selection
+    Every change is appended as one JSON line at once; reopening the card replays the journal, the gallery is restored as it was and the metadata are not read again (see tags)
+    The journal is kept in directory, one file per card (named after the path of the card): the card itself is not written
+
+    Lines (short keys, the last value of a field wins):
+        {"f": path, "s": size, "m": mtime_ns, "t": DateTimeOriginal (iso), "o": orientation, "n": file number}: metadata of a photo, its previous state is dropped
+        {"f": path, "h": hidden, "x": date suffix, "c": color}: change of the state of a photo (any of the fields)
+        {"sel": [paths], "first": path, "last": path}: selection of the gallery
+    The journal is compacted (one line per photo) when it grows past COMPACT_RATIO lines per photo, and when it is closed
+
+    Attributes
+        path: str
+            path of the journal file
+        photos: dict
+            path -> fields of the photo
+        selection: dict
+            'sel', 'first' and 'last' of the last selection line
+    """
+    def __init__(self, source: str, directory: str) -> None:
+        """
+        __init__ creates SessionJournal objects and replays the journal of source if it exists
+
+        Args:
+            source: str
+                memory card (or directory) sorted
+            directory: str
+                directory of the journals
+        """
+        name = hashlib.sha1(os.path.abspath(source).encode()).hexdigest()[:16]
+        self.path = os.path.join(directory, name + '.jsonl')
+        self.photos = dict()
+        self.selection = {'sel': [], 'first': None, 'last': None}
+        self._lines = 0
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+        if os.path.exists(self.path):
+            with open(self.path, encoding='utf-8') as file:
+                for line in file:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        # last line of an interrupted write
+                        continue
+                    self._replay(entry)
+                    self._lines += 1
+        self._file = open(self.path, 'a', encoding='utf-8')
+#--------------------------------------------------------------------------------
+    def _replay(self, entry: dict):
+        path = entry.pop('f', None)
+        if path is None:
+            self.selection = entry
+        elif 's' in entry:
+            self.photos[path] = entry
+        elif path in self.photos:
+            self.photos[path].update(entry)
+#--------------------------------------------------------------------------------
+    def tags(self, path: str) -> tuple:
+        """
+        tags returns the metadata of a RAW file recorded in the journal, as read_tags, None if the file is not recorded or was modified since
+
+        Returns:
+            tuple: (date_time: datetime.datetime, orientation: int, nikon_file_number: int)
+        """
+        photo = self.photos.get(path)
+        if photo is None:
+            return None
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return None
+        if (photo['s'], photo['m']) != (stat.st_size, stat.st_mtime_ns):
+            return None
+        return datetime.datetime.fromisoformat(photo['t']), photo['o'], photo['n']
+#--------------------------------------------------------------------------------
+    def record_photo(self, exif):
+        """
+        record_photo records the metadata of a photo, unless they are already recorded (the state of a photo whose file changed is dropped)
+        """
+        stat = os.stat(exif.file)
+        photo = self.photos.get(exif.file)
+        if photo is not None and (photo['s'], photo['m']) == (stat.st_size, stat.st_mtime_ns):
+            return
+        entry = {'s': stat.st_size, 'm': stat.st_mtime_ns, 't': exif.date_time.isoformat(), 'o': exif.exif_orientation, 'n': exif.nikon_file_number}
+        self.photos[exif.file] = dict(entry)
+        self._append(dict(f=exif.file, **entry))
+#--------------------------------------------------------------------------------
+    def get(self, path: str, field: str, default=None):
+        """
+        get returns a field of the state of a photo: 'h' (hidden), 'x' (date suffix) or 'c' (color)
+        """
+        return self.photos.get(path, dict()).get(field, default)
+#--------------------------------------------------------------------------------
+    def update(self, path: str, **fields):
+        """
+        update records a change of the state of a photo: update(path, h=True), update(path, x='b', c='#a0b0c0')…
+        Nothing is written if the fields do not change
+        """
+        photo = self.photos.get(path)
+        if photo is None:
+            return
+        changed = {key: value for key, value in fields.items() if photo.get(key) != value}
+        if changed:
+            photo.update(changed)
+            self._append(dict(f=path, **changed))
+#--------------------------------------------------------------------------------
+    def set_selection(self, paths: list, first: str, last: str):
+        selection = {'sel': list(paths), 'first': first, 'last': last}
+        if selection != self.selection:
+            self.selection = selection
+            self._append(selection)
+#--------------------------------------------------------------------------------
+    def _append(self, entry: dict):
+        with self._lock:
+            # flushed at once: a crash of the program loses nothing
+            self._file.write(json.dumps(entry, ensure_ascii=False, separators=(',', ':')) + '\n')
+            self._file.flush()
+            self._lines += 1
+            compact = self._lines > max(COMPACT_MIN_LINES, COMPACT_RATIO * len(self.photos))
+        if compact:
+            self.compact()
+#--------------------------------------------------------------------------------
+    def compact(self):
+        """
+        compact rewrites the journal with one line per photo and the selection, under a temporary name then renamed
+        """
+        part = self.path + '.part'
+        with self._lock:
+            self._file.close()
+            with open(part, 'w', encoding='utf-8') as file:
+                for path, photo in self.photos.items():
+                    file.write(json.dumps(dict(f=path, **photo), ensure_ascii=False, separators=(',', ':')) + '\n')
+                file.write(json.dumps(self.selection, ensure_ascii=False, separators=(',', ':')) + '\n')
+            os.replace(part, self.path)
+            self._lines = len(self.photos) + 1
+            self._file = open(self.path, 'a', encoding='utf-8')
+#--------------------------------------------------------------------------------
+    def close(self):
+        self.compact()
+        self._file.close()
+#################################################################################
@@ -0,0 +1,203 @@
+"""
+Synthetic NEF-like files for the benchmarks (see benchmark.py)
+The files have the structure read by nef_preview: IFD0 with the orientation, a SubIFD with a JPEG preview, a SubIFD with the (random) raw data, the EXIF IFD with DateTimeOriginal and SubSecTimeOriginal, and a Nikon MakerNote with the FileInfo record
+They are laid out in DCIM/1xxNIKON directories like on a memory card
+"""
+import os
+import io
+import json
+import random
+import struct
+import datetime
+
+from nef_preview import (NEW_SUBFILE_TYPE, COMPRESSION, STRIP_OFFSETS, STRIP_BYTE_COUNTS, SUB_IFDS, JPEG_OFFSET, JPEG_LENGTH,
+                         ORIENTATION, EXIF_IFD, DATE_TIME_ORIGINAL, SUB_SEC_TIME_ORIGINAL, MAKER_NOTE, NIKON_HEADER,
+                         NIKON_FILE_INFO, TYPE_FORMATS)
+from photo_exif import EXIF_DATE_FORMAT
+
+# TIFF field types
+ASCII = 2
+SHORT = 3
+LONG = 4
+UNDEFINED = 7
+# compression of the raw data of a NEF
+NIKON_NEF_COMPRESSION = 34713
+# files per DCIM directory and largest file number, as numbered by Nikon cameras
+FILES_PER_DIRECTORY = 999
+MAX_FILE_NUMBER = 9999
+# size of the JPEG previews and number of different previews (the files share them)
+PREVIEW_SIZE = (1620, 1080)
+PREVIEW_VARIANTS = 4
+# size of the raw data of each file
+RAW_BYTES = 1024 * 1024
+# written once the card is complete, with its parameters: a complete card is reused
+MARKER = '.synthetic_card.json'
+
+
+#################################################################################
+def make_jpeg(width: int, height: int, seed: int = 0, quality: int = 90) -> bytes:
+    """
+    make_jpeg returns a JPEG with some texture (so that its size is close to the size of a real preview)
+    """
+    # imported only to generate the fixtures
+    from PIL import Image
+    rng = random.Random(seed)
+    noise = Image.effect_noise((width, height), 30 + 10 * (seed % 4))
+    gradient = Image.linear_gradient('L').resize((width, height)).rotate(rng.choice((0, 90, 180, 270)), expand=False)
+    color = Image.new('RGB', (width, height), tuple(rng.randrange(256) for _ in range(3)))
+    image = Image.merge('RGB', (noise, gradient, Image.blend(noise, gradient, 0.5)))
+    image = Image.blend(image, color, 0.3)
+    buffer = io.BytesIO()
+    image.save(buffer, 'JPEG', quality=quality)
+    return buffer.getvalue()
+#--------------------------------------------------------------------------------
+def _entry(endian: str, tag: int, kind: int, value) -> tuple:
+    # value: bytes for ASCII and UNDEFINED, int or tuple of int otherwise
+    if isinstance(value, bytes):
+        return tag, kind, len(value), value
+    values = value if isinstance(value, tuple) else (value,)
+    return tag, kind, len(values), struct.pack(endian + TYPE_FORMATS[kind] * len(values), *values)
+#--------------------------------------------------------------------------------
+def _ifd(endian: str, entries: list, offset: int, next_offset: int = 0) -> bytes:
+    """
+    _ifd returns an IFD located at offset (relative to the TIFF header), followed by the values that do not fit in the entries
+    """
+    entries = sorted(entries)
+    data_offset = offset + 2 + 12 * len(entries) + 4
+    table = struct.pack(endian + 'H', len(entries))
+    data = b''
+    for tag, kind, count, value in entries:
+        if len(value) <= 4:
+            table += struct.pack(endian + 'HHL', tag, kind, count) + value.ljust(4, b'\0')
+        else:
+            table += struct.pack(endian + 'HHLL', tag, kind, count, data_offset + len(data))
+            data += value + b'\0' * (len(value) % 2)
+    return table + struct.pack(endian + 'L', next_offset) + data
+#--------------------------------------------------------------------------------
+def _maker_note(file_number: int) -> bytes:
+    # Nikon type 3 MakerNote: header, version, then a big endian TIFF structure of its own
+    # FileInfo: version, memory card number, directory number, file number (at NIKON_FILE_NUMBER_OFFSET)
+    file_info = b'0100' + struct.pack('>HHH', 0, 100 + (file_number - 1) // FILES_PER_DIRECTORY, file_number).ljust(12, b'\0')
+    ifd = _ifd('>', [_entry('>', NIKON_FILE_INFO, UNDEFINED, file_info)], 8)
+    return NIKON_HEADER + b'\x02\x10\0\0' + b'MM' + struct.pack('>HL', 42, 8) + ifd
+#--------------------------------------------------------------------------------
+def nef_bytes(date_time: datetime.datetime, orientation: int, file_number: int, jpeg: bytes, raw: bytes) -> bytes:
+    """
+    Summary
+        nef_bytes: returns the content of a synthetic NEF file (little endian)
+
+    Args:
+        date_time: datetime.datetime
+            DateTimeOriginal, the hundredths of seconds go to SubSecTimeOriginal
+        orientation: int
+            EXIF orientation (1 to 8)
+        file_number: int
+            Nikon file number (1 to MAX_FILE_NUMBER)
+        jpeg: bytes
+            preview
+        raw: bytes
+            raw data
+    """
+    endian = '<'
+    date = date_time.strftime(EXIF_DATE_FORMAT).encode() + b'\0'
+    sub_sec = f'{date_time.microsecond // 10000:02d}'.encode() + b'\0'
+    maker_note = _maker_note(file_number)
+
+    def build(sub_ifd1, sub_ifd2, exif_ifd, note, preview, data):
+        ifd0 = _ifd(endian, [_entry(endian, NEW_SUBFILE_TYPE, LONG, 1), _entry(endian, ORIENTATION, SHORT, orientation),
+                             _entry(endian, SUB_IFDS, LONG, (sub_ifd1, sub_ifd2)), _entry(endian, EXIF_IFD, LONG, exif_ifd)], 8)
+        ifd1 = _ifd(endian, [_entry(endian, NEW_SUBFILE_TYPE, LONG, 1), _entry(endian, COMPRESSION, SHORT, 6),
+                             _entry(endian, JPEG_OFFSET, LONG, preview), _entry(endian, JPEG_LENGTH, LONG, len(jpeg))], sub_ifd1)
+        ifd2 = _ifd(endian, [_entry(endian, NEW_SUBFILE_TYPE, LONG, 0), _entry(endian, COMPRESSION, SHORT, NIKON_NEF_COMPRESSION),
+                             _entry(endian, STRIP_OFFSETS, LONG, data), _entry(endian, STRIP_BYTE_COUNTS, LONG, len(raw))], sub_ifd2)
+        exif = _ifd(endian, [_entry(endian, DATE_TIME_ORIGINAL, ASCII, date), _entry(endian, SUB_SEC_TIME_ORIGINAL, ASCII, sub_sec),
+                             _entry(endian, MAKER_NOTE, UNDEFINED, note)], exif_ifd)
+        return [b'II' + struct.pack(endian + 'HL', 42, 8), ifd0, ifd1, ifd2, exif]
+
+    # first pass for the sizes, the offsets do not change them
+    parts = build(0, 0, 0, maker_note, 0, 0)
+    offsets = list()
+    position = 0
+    for part in parts:
+        offsets.append(position)
+        position += len(part)
+    preview = position
+    data = preview + len(jpeg)
+    # the maker note is a value of the EXIF IFD: its offset is set by _ifd
+    parts = build(offsets[2], offsets[3], offsets[4], maker_note, preview, data)
+    return b''.join(parts) + jpeg + raw
+#--------------------------------------------------------------------------------
+def shooting_times(count: int, start: datetime.datetime, seed: int = 0) -> list:
+    """
+    shooting_times returns count increasing shooting times: bursts of a few photos a fraction of a second apart, photos a few seconds to minutes apart, longer breaks, and now and then the next day
+    """
+    rng = random.Random(seed)
+    times = list()
+    current = start
+    while len(times) < count:
+        times.append(current)
+        draw = rng.random()
+        if draw < 0.3:
+            step = datetime.timedelta(milliseconds=rng.randrange(100, 400, 10))
+        elif draw < 0.95:
+            step = datetime.timedelta(seconds=rng.randrange(2, 300))
+        elif draw < 0.995:
+            step = datetime.timedelta(hours=rng.uniform(1, 4))
+        else:
+            step = datetime.timedelta(days=1)
+        current += step
+    return times
+#--------------------------------------------------------------------------------
+def make_card(root: str, count: int, start: datetime.datetime = datetime.datetime(2023, 7, 14, 9, 0), first_number: int = 1,
+              preview_size: tuple = PREVIEW_SIZE, raw_bytes: int = RAW_BYTES, seed: int = 0) -> list:
+    """
+    Summary
+        make_card: writes count synthetic NEF files under root/DCIM, as a Nikon camera numbers them (_DSCnnnn.NEF, FILES_PER_DIRECTORY files per 1xxNIKON directory, file numbers wrapping after MAX_FILE_NUMBER)
+        A card already written with the same parameters is reused
+
+    Args:
+        root: str
+            directory of the card
+        count: int
+            number of files
+        start: datetime.datetime
+            time of the first photo
+        first_number: int
+            file number of the first photo
+        preview_size: tuple
+            (width, height) of the JPEG previews
+        raw_bytes: int
+            size of the raw data of each file
+        seed: int
+            seed of the random generators
+
+    Returns:
+        list[str]: paths of the files, in shooting order
+    """
+    parameters = dict(count=count, start=start.isoformat(), first_number=first_number, preview_size=list(preview_size), raw_bytes=raw_bytes, seed=seed)
+    marker = os.path.join(root, MARKER)
+    files = list()
+    for i in range(count):
+        number = (first_number - 1 + i) % MAX_FILE_NUMBER + 1
+        directory = os.path.join(root, 'DCIM', f'{100 + i // FILES_PER_DIRECTORY}NIKON')
+        files.append(os.path.join(directory, f'_DSC{number:04d}.NEF'))
+    try:
+        with open(marker, encoding='utf-8') as file:
+            if json.load(file) == parameters:
+                return files
+    except (OSError, ValueError):
+        pass
+
+    rng = random.Random(seed)
+    previews = [make_jpeg(*preview_size, seed=seed + i) for i in range(PREVIEW_VARIANTS)]
+    raw = rng.randbytes(raw_bytes)
+    for i, (path, date_time) in enumerate(zip(files, shooting_times(count, start, seed))):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        number = int(os.path.basename(path)[4:8])
+        orientation = 6 if rng.random() < 0.15 else 1
+        with open(path, 'wb') as file:
+            file.write(nef_bytes(date_time, orientation, number, previews[i % PREVIEW_VARIANTS], raw))
+    with open(marker, 'w', encoding='utf-8') as file:
+        json.dump(parameters, file)
+    return files
+#################################################################################
@@ -0,0 +1,90 @@
+import os
+import datetime
+
+import pytest
+
+from naming import compress_date, next_suffix, plan_copies, assign_suffixes, propose_suffixes, PhotoTable, NamingError
+from photo_exif import PhotoExif
+
+DAY = datetime.datetime(2023, 7, 14, 9, 0)
+
+
+def photos(*times, number: int = 1) -> list:
+    # PhotoExif of NEF files numbered from number, the files are never read
+    return [PhotoExif(f'/card/DCIM/100NIKON/_DSC{number + i:04d}.NEF', (date_time, 1, number + i)) for i, date_time in enumerate(times)]
+#--------------------------------------------------------------------------------
+def test_compress_date():
+    assert compress_date(datetime.date(2023, 7, 14)) == ('2020', '3G14')
+    assert compress_date(datetime.date(1999, 1, 5)) == ('1990', '9A05')
+    assert compress_date(datetime.date(2010, 12, 31)) == ('2010', '0L31')
+#--------------------------------------------------------------------------------
+def test_next_suffix():
+    assert next_suffix('') == 'a'
+    assert next_suffix('?') == 'a'
+    assert next_suffix('a') == 'b'
+    with pytest.raises(NamingError):
+        next_suffix('z')
+#--------------------------------------------------------------------------------
+def test_plan_copies_names():
+    photos_ = photos(DAY, DAY + datetime.timedelta(minutes=1), DAY + datetime.timedelta(days=1), number=41)
+    photos_[0].date_suffix = 'a'
+    photos_[1].date_suffix = 'b'
+    plan = plan_copies(photos_, 'Vacances', '/library')
+    assert [dst for _, dst in plan] == [
+        os.path.join('/library', '2020', '3G14a-Vacances', '(2023-07-14)_001_DSC0041-3G14a-Vacances.NEF'),
+        os.path.join('/library', '2020', '3G14b-Vacances', '(2023-07-14)_001_DSC0042-3G14b-Vacances.NEF'),
+        os.path.join('/library', '2020', '3G15-Vacances', '(2023-07-15)_001_DSC0043-3G15-Vacances.NEF'),
+    ]
+    assert [src for src, _ in plan] == [exif.file for exif in photos_]
+#--------------------------------------------------------------------------------
+def test_plan_copies_numbers_each_directory():
+    plan = plan_copies(photos(DAY, DAY + datetime.timedelta(seconds=1), DAY + datetime.timedelta(seconds=2)), 'T', '/library')
+    assert [os.path.basename(dst)[:16] for _, dst in plan] == ['(2023-07-14)_001', '(2023-07-14)_002', '(2023-07-14)_003']
+#--------------------------------------------------------------------------------
+@pytest.mark.parametrize('title', ['', '  ', 'a/b', 'a:b'])
+def test_plan_copies_invalid_title(title):
+    with pytest.raises(NamingError):
+        plan_copies(photos(DAY), title, '/library')
+#--------------------------------------------------------------------------------
+def test_plan_copies_day_partly_split():
+    photos_ = photos(DAY, DAY + datetime.timedelta(minutes=1))
+    photos_[0].date_suffix = 'a'
+    photos_[1].date_suffix = '?'
+    with pytest.raises(NamingError):
+        plan_copies(photos_, 'T', '/library')
+#--------------------------------------------------------------------------------
+def test_plan_copies_groups_out_of_order():
+    photos_ = photos(DAY, DAY + datetime.timedelta(minutes=1))
+    photos_[0].date_suffix = 'b'
+    photos_[1].date_suffix = 'a'
+    with pytest.raises(NamingError):
+        plan_copies(photos_, 'T', '/library')
+#--------------------------------------------------------------------------------
+def test_assign_suffixes_gap_and_splits():
+    minutes = [0, 5, 50, 52, 200]
+    photos_ = photos(*(DAY + datetime.timedelta(minutes=m) for m in minutes), DAY + datetime.timedelta(days=1))
+    assign_suffixes(photos_, datetime.timedelta(minutes=30), [DAY + datetime.timedelta(minutes=51)])
+    # the photos of the next day are a single group: no suffix
+    assert [exif.date_suffix for exif in photos_] == ['a', 'a', 'b', 'c', 'd', '']
+#--------------------------------------------------------------------------------
+@pytest.mark.parametrize('gap', [1, 10, 30, 120])
+def test_propose_suffixes_same_groups_as_assign_suffixes(gap):
+    pytest.importorskip('numpy')
+    minutes = [0, 0.5, 3, 15, 16, 47, 200, 201, 24 * 60, 24 * 60 + 90, 3 * 24 * 60]
+    photos_ = photos(*(DAY + datetime.timedelta(minutes=m) for m in minutes))
+    table = PhotoTable.from_photos(photos_)
+    proposed = [chr(code) if code else '' for code in propose_suffixes(table, 60 * gap).tolist()]
+    assign_suffixes(photos_, datetime.timedelta(minutes=gap))
+    assert proposed == [exif.date_suffix for exif in photos_]
+#--------------------------------------------------------------------------------
+def test_propose_suffixes_too_many_groups():
+    pytest.importorskip('numpy')
+    table = PhotoTable.from_photos(photos(*(DAY + datetime.timedelta(minutes=10 * i) for i in range(27))))
+    with pytest.raises(NamingError):
+        propose_suffixes(table, 60)
+#--------------------------------------------------------------------------------
+def test_propose_suffixes_not_chronological():
+    pytest.importorskip('numpy')
+    table = PhotoTable.from_photos(photos(DAY + datetime.timedelta(minutes=1), DAY))
+    with pytest.raises(NamingError):
+        propose_suffixes(table, 60)
@@ -0,0 +1,56 @@
+import datetime
+
+import pytest
+
+from nef_preview import find_jpeg_preview, read_jpeg_preview, read_nef_tags
+from photo_exif import read_tags, read_exif_batch
+from synthetic_nef import nef_bytes
+
+DATE_TIME = datetime.datetime(2023, 7, 14, 9, 30, 15, 250000)
+# not a real image: only the start of a JPEG is checked
+JPEG = b'\xff\xd8' + bytes(range(256)) * 40 + b'\xff\xd9'
+RAW = b'\x00' * 5000
+
+
+@pytest.fixture
+def nef(tmp_path):
+    path = tmp_path / '_DSC0123.NEF'
+    path.write_bytes(nef_bytes(DATE_TIME, 6, 123, JPEG, RAW))
+    return path
+#--------------------------------------------------------------------------------
+def test_read_nef_tags(nef):
+    assert read_nef_tags(str(nef)) == ('2023:07:14 09:30:15', '25', 6, 123)
+#--------------------------------------------------------------------------------
+def test_find_jpeg_preview(nef):
+    # the JPEG of the first SubIFD, not the raw data of the second one
+    with open(nef, 'rb') as file:
+        offset, length = find_jpeg_preview(file)
+    assert nef.read_bytes()[offset:offset + length] == JPEG
+    assert bytes(read_jpeg_preview(str(nef))) == JPEG
+#--------------------------------------------------------------------------------
+@pytest.mark.parametrize('name', ['_DSC0123.NEF', '_dsc0123.nef'])
+def test_read_tags(tmp_path, nef, name):
+    path = tmp_path / name
+    nef.rename(path)
+    assert read_tags(str(path)) == (DATE_TIME, 6, 123)
+#--------------------------------------------------------------------------------
+@pytest.mark.parametrize('content', [b'', b'garbage', b'II*\x00\xff\xff\xff\xff', b'MM\x00*\x00\x00\x00\x08'])
+def test_unreadable_nef(tmp_path, content):
+    # not a NEF, or IFD outside the file: None, the caller falls back to pyexiv2 or rawpy
+    path = tmp_path / 'bad.NEF'
+    path.write_bytes(content)
+    assert read_nef_tags(str(path)) is None
+    assert read_jpeg_preview(str(path)) is None
+#--------------------------------------------------------------------------------
+def test_truncated_nef(tmp_path, nef):
+    path = tmp_path / 'truncated.NEF'
+    path.write_bytes(nef.read_bytes()[:len(JPEG) // 2])
+    assert read_jpeg_preview(str(path)) is None
+#--------------------------------------------------------------------------------
+def test_read_exif_batch_skips_unreadable_files(tmp_path, nef):
+    bad = tmp_path / '_DSC0124.NEF'
+    bad.write_bytes(b'garbage')
+    errors = list()
+    photos = read_exif_batch([str(nef), str(bad)], errors=errors)
+    assert [(exif.file, exif.nikon_file_number) for exif in photos] == [(str(nef), 123)]
+    assert [path for path, _ in errors] == [str(bad)]
@@ -0,0 +1,108 @@
+import os
+import json
+import zlib
+
+import pytest
+
+import transfer
+from transfer import execute_plan, copy_file, Journal, JOURNAL_NAME
+
+
+def make_plan(tmp_path, count: int = 4, size: int = 100_000) -> list:
+    # count source files of random content, copied to destination/day/
+    source = tmp_path / 'card'
+    source.mkdir()
+    plan = list()
+    for i in range(count):
+        src = source / f'_DSC{i:04d}.NEF'
+        src.write_bytes(os.urandom(size + i))
+        plan.append((str(src), str(tmp_path / 'library' / 'day' / f'{i:03d}.NEF')))
+    return plan
+#--------------------------------------------------------------------------------
+def run(plan, destination, verify: bool = False):
+    journal = Journal(destination)
+    try:
+        return execute_plan(plan, journal=journal, verify=verify)
+    finally:
+        journal.close()
+#--------------------------------------------------------------------------------
+def same(plan) -> bool:
+    return all(open(src, 'rb').read() == open(dst, 'rb').read() for src, dst in plan)
+#--------------------------------------------------------------------------------
+def test_copy_records_journal(tmp_path):
+    plan = make_plan(tmp_path)
+    destination = str(tmp_path / 'library')
+    stats = run(plan, destination, verify=True)
+    assert (stats.files, stats.skipped, stats.errors) == (len(plan), 0, [])
+    assert same(plan)
+    with open(os.path.join(destination, JOURNAL_NAME), encoding='utf-8') as file:
+        entries = [json.loads(line) for line in file]
+    # the copies run in parallel: recorded in the order they end
+    assert {(entry['src'], entry['dst'], entry['verified']) for entry in entries} == {(src, dst, True) for src, dst in plan}
+    assert all(entry['crc32'] == zlib.crc32(open(entry['src'], 'rb').read()) for entry in entries)
+#--------------------------------------------------------------------------------
+def test_resume_skips_recorded_copies(tmp_path):
+    plan = make_plan(tmp_path)
+    destination = str(tmp_path / 'library')
+    run(plan, destination)
+    # a copy lost since the last run is made again, the others are skipped
+    os.remove(plan[1][1])
+    stats = run(plan, destination)
+    assert (stats.skipped, stats.copied_bytes, stats.errors) == (len(plan) - 1, os.path.getsize(plan[1][0]), [])
+    assert same(plan)
+#--------------------------------------------------------------------------------
+def test_resume_after_interruption(tmp_path):
+    plan = make_plan(tmp_path)
+    destination = str(tmp_path / 'library')
+    run(plan[:2], destination)
+    # copied but not recorded (interrupted before the journal was written): kept if identical
+    os.makedirs(os.path.dirname(plan[2][1]), exist_ok=True)
+    with open(plan[2][0], 'rb') as file:
+        open(plan[2][1], 'wb').write(file.read())
+    # a leftover temporary copy is replaced
+    open(plan[3][1] + '.part', 'wb').write(b'partial')
+    stats = run(plan, destination)
+    assert (stats.skipped, stats.errors) == (2, [])
+    assert stats.copied_bytes == os.path.getsize(plan[3][0])
+    assert same(plan)
+    assert not os.path.exists(plan[3][1] + '.part')
+    assert set(Journal(destination).entries) == {dst for _, dst in plan}
+#--------------------------------------------------------------------------------
+def test_resume_keeps_different_file(tmp_path):
+    plan = make_plan(tmp_path, count=1)
+    os.makedirs(os.path.dirname(plan[0][1]))
+    open(plan[0][1], 'wb').write(b'another photo')
+    stats = run(plan, str(tmp_path / 'library'))
+    assert [src for src, _ in stats.errors] == [plan[0][0]]
+    assert open(plan[0][1], 'rb').read() == b'another photo'
+#--------------------------------------------------------------------------------
+def test_resume_copies_again_modified_source(tmp_path):
+    plan = make_plan(tmp_path, count=1)
+    destination = str(tmp_path / 'library')
+    run(plan, destination)
+    open(plan[0][0], 'ab').write(b'more')
+    os.remove(plan[0][1])
+    stats = run(plan, destination)
+    assert stats.skipped == 0
+    assert same(plan)
+#--------------------------------------------------------------------------------
+def test_copy_file_fallback_after_partial_kernel_copy(tmp_path, monkeypatch):
+    # copy_file_range copies the first chunk, then fails: sendfile must go on at the same offset
+    if not hasattr(os, 'copy_file_range'):
+        pytest.skip('no copy_file_range')
+    copy_file_range = os.copy_file_range
+    calls = list()
+
+    def first_chunk_only(*args):
+        calls.append(args)
+        if len(calls) > 1:
+            raise OSError('cross device')
+        return copy_file_range(*args)
+    monkeypatch.setattr(os, 'copy_file_range', first_chunk_only)
+    monkeypatch.setattr(transfer, 'COPY_CHUNK', 64 * 1024)
+    src = tmp_path / 'src'
+    data = os.urandom(300_000)
+    src.write_bytes(data)
+    copied, crc = copy_file(str(src), str(tmp_path / 'dst'), checksum=True)
+    assert (copied, crc) == (len(data), zlib.crc32(data))
+    assert (tmp_path / 'dst').read_bytes() == data
@@ -0,0 +1,242 @@
+import os
+import hashlib
+import threading
+from collections import OrderedDict
+
+from extraction import read_preview
+
+SUFFIX = '.jpeg'
+
+
+#################################################################################
+def cache_key(exif) -> str:
+    """
+    cache_key returns the key of the JPEG of a RAW file: its original name and a hash of its path, size, mtime, Nikon file number and DateTimeOriginal
+
+    Args:
+        exif: PhotoExif
+            metadata of the RAW file
+    """
+    stat = os.stat(exif.file)
+    identity = '|'.join([os.path.abspath(exif.file), str(stat.st_size), str(stat.st_mtime_ns),
+                         str(exif.nikon_file_number), exif.date_time.isoformat()])
+    return exif.original_name + '_' + hashlib.sha1(identity.encode()).hexdigest()[:16]
+
+#################################################################################
+class ThumbCache():
+    """
+    ThumbCache is a persistent on-disk cache of the JPEG extracted from the RAW files
+
+    An entry is keyed on the identity of the RAW file: path, size, mtime, Nikon file number and DateTimeOriginal, so that a file number reused by the camera (counter wrap) or a modified file never shows a stale image
+    The cache directory is the index: the mtime of a file is its last use (LRU), it is refreshed on every hit and the least recently used files are deleted when the total size exceeds max_bytes
+    The directory is listed once, when the cache is opened: then the sizes are kept in memory
+    Files used during the current session are never evicted: if they alone exceed max_bytes, the cap is enforced at the next session
+
+    Attributes
+        root: str
+            cache directory
+        max_bytes: int
+            size cap of the cache
+        in_memory: bool
+            False: the JPEG are files, written by extract_preview
+    """
+    in_memory = False
+
+    def __init__(self, root: str, max_bytes: int) -> None:
+        """
+        __init__ creates ThumbCache objects, creates the directory if needed and enforces the size cap
+
+        Args:
+            root: str
+                cache directory
+            max_bytes: int
+                size cap of the cache in bytes
+        """
+        self.root = root
+        self.max_bytes = max_bytes
+        self._keys = dict()
+        # path -> size of the files used during the session
+        self._pinned = dict()
+        self._lock = threading.Lock()
+        os.makedirs(root, exist_ok=True)
+        # path -> size of the other files, least recently used first
+        self._unpinned = OrderedDict((path, size) for path, size, _ in sorted(self._entries(), key=lambda entry: entry[2]))
+        self._total = sum(self._unpinned.values())
+        self.evict()
+#--------------------------------------------------------------------------------
+    def key(self, exif) -> str:
+        """
+        key returns the cache key of a RAW file
+
+        Args:
+            exif: PhotoExif
+                metadata of the RAW file
+        """
+        key = self._keys.get(exif.file)
+        if key is None:
+            key = cache_key(exif)
+            self._keys[exif.file] = key
+        return key
+#--------------------------------------------------------------------------------
+    def path(self, exif) -> str:
+        return os.path.join(self.root, self.key(exif) + SUFFIX)
+#--------------------------------------------------------------------------------
+    def get(self, path: str) -> bool:
+        """
+        get checks whether a cached file exists and marks it as used
+
+        Args:
+            path: str
+                path returned by path
+
+        Returns:
+            bool: True on a hit
+        """
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            return False
+        with self._lock:
+            if path not in self._pinned:
+                self._pinned[path] = self._unpinned.pop(path, 0)
+        return True
+#--------------------------------------------------------------------------------
+    def data(self, path: str) -> bytes:
+        """
+        data returns None: the JPEG is read from its file (see MemoryThumbCache.data)
+        """
+        return None
+#--------------------------------------------------------------------------------
+    def peek(self, path: str) -> bytes:
+        # the JPEG is read from its file, see MemoryThumbCache.peek
+        return None
+#--------------------------------------------------------------------------------
+    def added(self, path: str):
+        """
+        added records a file written in the cache and evicts the least recently used files if the cache is full
+        Can be called from any thread
+        """
+        size = os.path.getsize(path)
+        with self._lock:
+            # a file written again replaces its previous size
+            previous = self._pinned.pop(path, None)
+            if previous is None:
+                previous = self._unpinned.pop(path, 0)
+            self._pinned[path] = size
+            self._total += size - previous
+            full = self._total > self.max_bytes
+        if full:
+            self.evict()
+#--------------------------------------------------------------------------------
+    def evict(self):
+        with self._lock:
+            # stops once only the files of the session are left
+            while self._total > self.max_bytes and self._unpinned:
+                path, size = self._unpinned.popitem(last=False)
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+                self._total -= size
+#--------------------------------------------------------------------------------
+    def _entries(self):
+        # (path, size, mtime) of the cached files
+        with os.scandir(self.root) as it:
+            for entry in it:
+                if entry.is_file() and entry.name.endswith(SUFFIX):
+                    stat = entry.stat()
+                    yield entry.path, stat.st_size, stat.st_mtime_ns
+#################################################################################
+class MemoryThumbCache():
+    """
+    MemoryThumbCache keeps the JPEG extracted from the RAW files in memory instead of on disk (slow or full disk, network home directory): nothing is written, nothing is left behind on exit
+    The ExtractionEngine reads the JPEG with read_preview and stores its bytes (see added), the thumbnails are decoded straight from them (see data)
+    Same interface as ThumbCache: path returns the key of a JPEG, not a file
+    The least recently used JPEG are dropped when the total size exceeds max_bytes: data reads a dropped JPEG from its RAW file again
+
+    Attributes
+        max_bytes: int
+            memory budget of the JPEG
+        in_memory: bool
+            True: the JPEG are bytes, given to added
+    """
+    in_memory = True
+
+    def __init__(self, max_bytes: int) -> None:
+        self.max_bytes = max_bytes
+        self._keys = dict()
+        # path -> RAW file, to read a dropped JPEG again
+        self._raw_files = dict()
+        # path -> bytes of the JPEG, in LRU order
+        self._data = OrderedDict()
+        self._total = 0
+        self._lock = threading.Lock()
+#--------------------------------------------------------------------------------
+    def key(self, exif) -> str:
+        key = self._keys.get(exif.file)
+        if key is None:
+            key = cache_key(exif)
+            self._keys[exif.file] = key
+        return key
+#--------------------------------------------------------------------------------
+    def path(self, exif) -> str:
+        path = self.key(exif) + SUFFIX
+        self._raw_files[path] = exif.file
+        return path
+#--------------------------------------------------------------------------------
+    def get(self, path: str) -> bool:
+        """
+        get checks whether a JPEG is in memory and marks it as used
+        """
+        with self._lock:
+            if path not in self._data:
+                return False
+            self._data.move_to_end(path)
+        return True
+#--------------------------------------------------------------------------------
+    def peek(self, path: str) -> bytes:
+        """
+        peek returns the bytes of a JPEG, None if it was dropped: never reads the RAW file, for the GUI thread
+        """
+        with self._lock:
+            return self._data.get(path)
+#--------------------------------------------------------------------------------
+    def data(self, path: str) -> bytes:
+        """
+        data returns the bytes of a JPEG, read again from its RAW file if it was dropped
+        Can be called from any thread, but reads a file: called by the decoding threads (see LoadJob), peek in the GUI thread
+
+        Args:
+            path: str
+                key returned by path
+        """
+        with self._lock:
+            data = self._data.get(path)
+            if data is not None:
+                self._data.move_to_end(path)
+                return data
+        data = read_preview(self._raw_files[path])
+        self.added(path, data)
+        return data
+#--------------------------------------------------------------------------------
+    def added(self, path: str, data: bytes):
+        """
+        added stores the bytes of a JPEG and drops the least recently used ones if the budget is exceeded
+        Can be called from any thread
+        """
+        with self._lock:
+            previous = self._data.pop(path, None)
+            if previous is not None:
+                self._total -= len(previous)
+            self._data[path] = data
+            self._total += len(data)
+            # the JPEG just added is kept even if it exceeds the budget on its own
+            while self._total > self.max_bytes and len(self._data) > 1:
+                _, dropped = self._data.popitem(last=False)
+                self._total -= len(dropped)
+#--------------------------------------------------------------------------------
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self._total = 0
+#################################################################################
@@ -0,0 +1,150 @@
+import os
+import json
+import time
+import threading
+from collections import namedtuple
+
+# result of a function run by timed, in a worker process
+Timed = namedtuple('Timed', ('result', 'start', 'end', 'pid'))
+
+
+#################################################################################
+class _NullSpan():
+    # shared by all the spans when the tracing is off: entering and leaving it costs nothing
+    def __enter__(self):
+        return self
+    def __exit__(self, *exc):
+        return False
+    def set(self, **args):
+        pass
+
+NULL_SPAN = _NullSpan()
+#################################################################################
+class _Span():
+    def __init__(self, tracer, name: str, category: str, args: dict) -> None:
+        self._tracer = tracer
+        self.name = name
+        self.category = category
+        self.args = args
+    def __enter__(self):
+        self._start = time.perf_counter()
+        return self
+    def __exit__(self, *exc):
+        self._tracer.record(self.name, self._start, time.perf_counter(), self.category, **self.args)
+        return False
+    def set(self, **args):
+        # arguments known only at the end of the span (size, cache hit…)
+        self.args.update(args)
+#################################################################################
+class Tracer():
+    """
+    Tracer records the timing spans and the counters of the pipeline stages (scan, exif, extraction, decode, blur, widget, slice, recolor, copy, verify)
+    When it is off (the default), span returns a shared object doing nothing and count returns at once
+    The records can be exported as a Chrome trace (chrome://tracing, Perfetto), summary gives the totals by stage
+
+    Attributes
+        enabled: bool
+            recording or not
+        events: list[dict]
+            the spans and counters, as Chrome trace events
+        stats: dict
+            stage -> [number of spans, total seconds, longest span in seconds]
+        counters: dict
+            counter -> value
+    """
+    def __init__(self, enabled: bool = False) -> None:
+        self.enabled = enabled
+        self.events = list()
+        self.stats = dict()
+        self.counters = dict()
+        self._origin = time.perf_counter()
+        self._lock = threading.Lock()
+#--------------------------------------------------------------------------------
+    def span(self, name: str, category: str = 'pipeline', **args):
+        """
+        span returns a context manager timing a block: with tracer.span('decode', file=path): ...
+
+        Args:
+            name: str
+                stage
+            category: str
+                category of the Chrome trace (pipeline, ui, io)
+            args: dict
+                arguments of the span (file, index…), kept in the trace
+        """
+        if not self.enabled:
+            return NULL_SPAN
+        return _Span(self, name, category, args)
+#--------------------------------------------------------------------------------
+    def record(self, name: str, start: float, end: float, category: str = 'pipeline', pid: int = None, tid: int = None, **args):
+        """
+        record adds a span measured elsewhere (perf_counter values, the clock is the same in the worker processes)
+        Can be called from any thread
+        """
+        if not self.enabled:
+            return
+        event = {'name': name, 'cat': category, 'ph': 'X', 'ts': round((start - self._origin) * 1e6, 1), 'dur': round((end - start) * 1e6, 1),
+                 'pid': pid or os.getpid(), 'tid': tid or threading.get_ident(), 'args': args}
+        with self._lock:
+            self.events.append(event)
+            stat = self.stats.setdefault(name, [0, 0.0, 0.0])
+            stat[0] += 1
+            stat[1] += end - start
+            stat[2] = max(stat[2], end - start)
+#--------------------------------------------------------------------------------
+    def count(self, name: str, value: int = 1):
+        """
+        count adds value to a counter (files, bytes, cache hits…)
+        """
+        if not self.enabled:
+            return
+        with self._lock:
+            total = self.counters.get(name, 0) + value
+            self.counters[name] = total
+            self.events.append({'name': name, 'ph': 'C', 'ts': round((time.perf_counter() - self._origin) * 1e6, 1),
+                                'pid': os.getpid(), 'args': {name: total}})
+#--------------------------------------------------------------------------------
+    def unwrap(self, name: str, value, **args):
+        """
+        unwrap records the span of a result returned by timed and returns the result itself (a value not returned by timed is returned unchanged)
+        """
+        if isinstance(value, Timed):
+            self.record(name, value.start, value.end, pid=value.pid, tid=value.pid, **args)
+            return value.result
+        return value
+#--------------------------------------------------------------------------------
+    def summary(self) -> dict:
+        """
+        summary returns the totals by stage: stage -> {'count', 'seconds', 'mean_ms', 'max_ms'}, and the counters
+        """
+        with self._lock:
+            stages = {name: {'count': n, 'seconds': round(total, 6), 'mean_ms': round(1000 * total / n, 3), 'max_ms': round(1000 * longest, 3)}
+                      for name, (n, total, longest) in self.stats.items()}
+            return {'stages': stages, 'counters': dict(self.counters)}
+#--------------------------------------------------------------------------------
+    def export(self, path: str):
+        """
+        export writes the records as a Chrome trace (JSON), with the summary in otherData
+        """
+        with self._lock:
+            events = list(self.events)
+        trace = {'traceEvents': events, 'displayTimeUnit': 'ms', 'otherData': self.summary()}
+        with open(path, 'w', encoding='utf-8') as file:
+            json.dump(trace, file)
+#--------------------------------------------------------------------------------
+    def clear(self):
+        with self._lock:
+            self.events.clear()
+            self.stats.clear()
+            self.counters.clear()
+#################################################################################
+def timed(function, *args) -> Timed:
+    """
+    timed runs function(*args) and returns its result with its start and end time, to be submitted to a worker process instead of function when the tracing is on (see Tracer.unwrap)
+    """
+    start = time.perf_counter()
+    result = function(*args)
+    return Timed(result, start, time.perf_counter(), os.getpid())
+#################################################################################
+# the tracer of the process, off unless enabled (TRACE in constants, --trace of ingest.py and benchmark.py)
+tracer = Tracer()
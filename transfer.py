@@ -0,0 +1,318 @@
+import os
+import json
+import time
+import zlib
+import shutil
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from tracing import tracer
+
+# bytes copied per system call
+COPY_CHUNK = 64 * 1024 * 1024
+# buffer of the CRC32 computations
+CHECKSUM_CHUNK = 4 * 1024 * 1024
+# simultaneous copies reading from or writing to the same device
+WORKERS_PER_DEVICE = 2
+# journal of the completed copies, at the root of the destination
+JOURNAL_NAME = '.renommage_journal.jsonl'
+
+
+#################################################################################
+class TransferError(OSError):
+    pass
+#################################################################################
+class TransferStats():
+    """
+    TransferStats counts the progress of a transfer
+
+    Attributes
+        files, total_files: int
+            files processed so far (copied, skipped or failed), files to be processed
+        bytes, total_bytes: int
+            bytes copied so far, bytes to be copied
+        skipped: int
+            files already copied and verified by a previous run (see Journal)
+        copied_bytes: int
+            bytes actually copied by this run
+        verified_bytes: int
+            bytes read back by the verification
+        copy_seconds, verify_seconds: float
+            time spent copying and verifying, summed over the files
+        errors: list[tuple]
+            (source path, error message) of the failed copies
+    """
+    def __init__(self, total_files: int, total_bytes: int) -> None:
+        self.files = 0
+        self.total_files = total_files
+        self.bytes = 0
+        self.total_bytes = total_bytes
+        self.skipped = 0
+        self.copied_bytes = 0
+        self.verified_bytes = 0
+        self.copy_seconds = 0.0
+        self.verify_seconds = 0.0
+        self.errors = list()
+#--------------------------------------------------------------------------------
+    @property
+    def copy_rate(self) -> float:
+        # bytes per second, per copy stream
+        return self.copied_bytes / self.copy_seconds if self.copy_seconds else 0.0
+    @property
+    def verify_rate(self) -> float:
+        return self.verified_bytes / self.verify_seconds if self.verify_seconds else 0.0
+#################################################################################
+class Journal():
+    """
+    Journal is the append-only record of the completed copies, stored next to the copies (JOURNAL_NAME at the root of the destination)
+    One JSON line per file: source, destination, size and mtime of the source, CRC32, verified (read back) or not
+    A copy is recorded only once it is complete and synced to disk, so that an interrupted transfer can be resumed without copying again what is already done
+
+    Attributes
+        path: str
+            path of the journal file
+        entries: dict
+            destination path -> last entry
+    """
+    def __init__(self, destination: str) -> None:
+        self.path = os.path.join(destination, JOURNAL_NAME)
+        self.entries = dict()
+        self._lock = threading.Lock()
+        os.makedirs(destination, exist_ok=True)
+        if os.path.exists(self.path):
+            with open(self.path, encoding='utf-8') as file:
+                for line in file:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        # last line of an interrupted write
+                        continue
+                    self.entries[entry['dst']] = entry
+        self._file = open(self.path, 'a', encoding='utf-8')
+#--------------------------------------------------------------------------------
+    def done(self, src: str, dst: str, verify: bool) -> bool:
+        """
+        done checks whether the copy of src to dst is recorded and still valid (same source, destination present with the same size)
+
+        Args:
+            verify: bool
+                the copy must also have been read back
+        """
+        entry = self.entries.get(dst)
+        if entry is None or entry['src'] != src or (verify and not entry['verified']):
+            return False
+        stat = os.stat(src)
+        if entry['size'] != stat.st_size or entry['mtime_ns'] != stat.st_mtime_ns:
+            return False
+        return os.path.exists(dst) and os.path.getsize(dst) == entry['size']
+#--------------------------------------------------------------------------------
+    def record(self, src: str, dst: str, crc: int, verified: bool):
+        stat = os.stat(src)
+        entry = {'src': src, 'dst': dst, 'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns, 'crc32': crc, 'verified': verified}
+        with self._lock:
+            self.entries[dst] = entry
+            self._file.write(json.dumps(entry, ensure_ascii=False) + '\n')
+            self._file.flush()
+            os.fsync(self._file.fileno())
+#--------------------------------------------------------------------------------
+    def close(self):
+        self._file.close()
+#################################################################################
+def copy_file(src: str, dst: str, checksum: bool = False) -> tuple:
+    """
+    Summary
+        copy_file: copies src to dst
+        The copy is done inside the kernel (copy_file_range, or sendfile), the data never goes through Python
+        With checksum, the copy is synced to disk and its CRC32 is computed by reading it back from the page cache, where it has just been written
+        The copy is written under a temporary name and renamed when complete, the timestamps of src are kept
+
+    Raises:
+        FileExistsError: if dst already exists
+
+    Returns:
+        tuple: (number of bytes copied, CRC32 or None)
+    """
+    if os.path.exists(dst):
+        raise FileExistsError(dst)
+    part = dst + '.part'
+    crc = None
+    with open(src, 'rb', buffering=0) as fsrc, open(part, 'wb', buffering=0) as fdst:
+        size = os.fstat(fsrc.fileno()).st_size
+        copied = 0
+        try:
+            while copied < size:
+                n = _kernel_copy(fsrc.fileno(), fdst.fileno(), min(COPY_CHUNK, size - copied), copied)
+                if n == 0:
+                    break
+                copied += n
+        except OSError:
+            # no kernel copy between these file systems
+            fsrc.seek(copied)
+            fdst.seek(copied)
+            shutil.copyfileobj(fsrc, fdst, COPY_CHUNK)
+            copied = size
+        if checksum:
+            os.fsync(fdst.fileno())
+    if checksum:
+        crc = file_crc(part)
+    shutil.copystat(src, part)
+    os.replace(part, dst)
+    return copied, crc
+#--------------------------------------------------------------------------------
+def _kernel_copy(fd_in: int, fd_out: int, count: int, offset: int) -> int:
+    if hasattr(os, 'copy_file_range'):
+        try:
+            return os.copy_file_range(fd_in, fd_out, count, offset, offset)
+        except OSError:
+            pass
+    # copy_file_range does not move the file positions, sendfile writes at the position of fd_out
+    os.lseek(fd_out, offset, os.SEEK_SET)
+    return os.sendfile(fd_out, fd_in, offset, count)
+#--------------------------------------------------------------------------------
+def file_crc(path: str, drop_cache: bool = False) -> int:
+    """
+    file_crc returns the CRC32 of a file
+
+    Args:
+        drop_cache: bool
+            evict the file from the page cache first, so that the data is really read back from the device
+    """
+    crc = 0
+    buffer = memoryview(bytearray(CHECKSUM_CHUNK))
+    with open(path, 'rb', buffering=0) as file:
+        if drop_cache and hasattr(os, 'posix_fadvise'):
+            os.posix_fadvise(file.fileno(), 0, 0, os.POSIX_FADV_DONTNEED)
+        while True:
+            n = file.readinto(buffer)
+            if not n:
+                break
+            crc = zlib.crc32(buffer[:n], crc)
+    return crc
+#--------------------------------------------------------------------------------
+def _file_size(path: str) -> int:
+    # 0 for a file that cannot be read
+    try:
+        return os.path.getsize(path)
+    except OSError:
+        return 0
+#--------------------------------------------------------------------------------
+def _device(path: str) -> int:
+    # device of a path, None if it cannot be reached
+    try:
+        return os.stat(path).st_dev
+    except OSError:
+        return None
+#--------------------------------------------------------------------------------
+def make_directories(plan: list):
+    """
+    make_directories creates, once each, all the directories of a plan
+    """
+    for directory in sorted({os.path.dirname(dst) for _, dst in plan}):
+        os.makedirs(directory, exist_ok=True)
+#--------------------------------------------------------------------------------
+def execute_plan(plan: list, workers_per_device: int = WORKERS_PER_DEVICE, progress=None, journal: Journal = None, verify: bool = False) -> TransferStats:
+    """
+    Summary
+        execute_plan: copies the files of a plan
+        The directories are created first, then the copies run in parallel, with at most workers_per_device copies reading from or writing to the same device, so that the slower device stays busy without thrashing
+
+    Args:
+        plan: list[tuple]
+            (source path, destination path), see naming.plan_copies
+        workers_per_device: int
+            concurrent copies per device
+        progress: callable
+            called with the TransferStats after each file, from a worker thread
+        journal: Journal
+            if given, the files it records are skipped, the copies compute a CRC32 and are recorded
+        verify: bool
+            read back each copy (from the device, not from the page cache) and compare its CRC32
+
+    Returns:
+        TransferStats: a file that cannot be read or copied is recorded in its errors, only the creation of the directories raises OSError
+    """
+    # the total is only an estimate: the files are read again by the copies, a file missing by then is a failed copy (see job)
+    sizes = [_file_size(src) for src, _ in plan]
+    stats = TransferStats(len(plan), sum(sizes))
+    if not plan:
+        return stats
+    with tracer.span('directories', 'io', count=len(plan)):
+        make_directories(plan)
+    # workers_per_device threads per device: a device unreachable now only fails its copies (see job)
+    directories = {os.path.dirname(src) for src, _ in plan} | {os.path.dirname(dst) for _, dst in plan}
+    devices = {device for device in map(_device, directories) if device is not None}
+    semaphores = dict()
+    lock = threading.Lock()
+    checksum = journal is not None or verify
+
+    def transfer(src, dst):
+        # returns (bytes copied, copy seconds, bytes verified, verify seconds), raises OSError
+        if journal is not None and journal.done(src, dst, verify):
+            return None
+        start = time.perf_counter()
+        if journal is not None and os.path.exists(dst):
+            # copied by an interrupted run, but not recorded: kept only if identical
+            crc, copied = file_crc(dst), 0
+            if os.path.getsize(dst) != os.path.getsize(src) or crc != file_crc(src):
+                raise FileExistsError(dst)
+        else:
+            copied, crc = copy_file(src, dst, checksum)
+        copy_seconds = time.perf_counter() - start
+        tracer.record('copy', start, start + copy_seconds, 'io', file=src, bytes=copied)
+        tracer.count('copied bytes', copied)
+        verified, verify_seconds = 0, 0.0
+        if verify:
+            start = time.perf_counter()
+            if file_crc(dst, drop_cache=True) != crc:
+                os.remove(dst)
+                raise TransferError(f'copie corrompue : {dst}')
+            verified, verify_seconds = copied or os.path.getsize(dst), time.perf_counter() - start
+            tracer.record('verify', start, start + verify_seconds, 'io', file=dst, bytes=verified)
+        if journal is not None:
+            journal.record(src, dst, crc, verify)
+        return copied, copy_seconds, verified, verify_seconds
+
+    def job(i):
+        src, dst = plan[i]
+        result = None
+        try:
+            size = os.path.getsize(src)
+            pair = sorted({os.stat(src).st_dev, os.stat(os.path.dirname(dst)).st_dev})
+        except OSError as e:
+            error = str(e)
+        else:
+            with lock:
+                for device in pair:
+                    semaphores.setdefault(device, threading.Semaphore(workers_per_device))
+            # the semaphores are always taken in the same (sorted) order: no deadlock
+            for device in pair:
+                semaphores[device].acquire()
+            try:
+                result = transfer(src, dst)
+                error = None
+            except OSError as e:
+                error = str(e)
+            finally:
+                for device in reversed(pair):
+                    semaphores[device].release()
+        with lock:
+            stats.files += 1
+            if error is not None:
+                stats.errors.append((src, error))
+            elif result is None:
+                stats.skipped += 1
+                stats.bytes += size
+            else:
+                copied, copy_seconds, verified, verify_seconds = result
+                stats.bytes += size
+                stats.copied_bytes += copied
+                stats.copy_seconds += copy_seconds
+                stats.verified_bytes += verified
+                stats.verify_seconds += verify_seconds
+        if progress is not None:
+            progress(stats)
+
+    with ThreadPoolExecutor(max_workers=workers_per_device * max(1, len(devices))) as pool:
+        list(pool.map(job, range(len(plan))))
+    return stats
+#################################################################################